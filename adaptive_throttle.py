@@ -0,0 +1,224 @@
+"""
+Adaptive, rate-limit-aware throttle for Contentstack API calls
+
+Every Contentstack request takes a token from a token bucket and a slot
+under a concurrency limit before it is sent. Both limits adapt AIMD-style:
+each success raises the rate by about one request per second per second and
+the concurrency limit by about one slot per window, and a 429 halves both.
+Until the first 429 the rate grows by one per success instead (slow start),
+so a run with headroom reaches full speed in a few seconds.
+X-RateLimit-Limit caps the rate, X-RateLimit-Remaining: 0 pauses new
+requests until the next one-second window, and 429s and 5xx responses are
+retried with jittered exponential backoff (or after Retry-After). One
+throttle is shared by every fetcher in the process, since the limits are
+per stack rather than per fetcher.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from config import config
+
+# How long a request waits before re-checking a full concurrency limit
+_SLOT_POLL_SECONDS = 0.01
+_MAX_BACKOFF_SECONDS = 30.0
+
+
+class AdaptiveThrottler:
+    def __init__(self, name: str, initial_rate: float, max_rate: float, initial_concurrency: int,
+                 max_concurrency: int, max_retries: int = 5, backoff_seconds: float = 0.5,
+                 min_rate: float = 1.0):
+        self.name = name
+        self.max_rate = max_rate if max_rate > 0 else float('inf')
+        self.min_rate = min_rate
+        self.rate = min(max(initial_rate, min_rate), self.max_rate)
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(min(max(initial_concurrency, 1), max_concurrency))
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self.header_limit = None
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.retries = 0
+        self._tokens = 1.0
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._slow_start = True
+        self._lock = threading.Lock()
+
+    def _rate_ceiling(self) -> float:
+        return min(self.max_rate, self.header_limit) if self.header_limit else self.max_rate
+
+    def _try_acquire(self) -> float:
+        """Take a token and a concurrency slot, or return how long to wait before trying again"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.in_flight >= int(self.concurrency):
+                return _SLOT_POLL_SECONDS
+            # Bursts are kept to a tenth of a second's worth of requests
+            capacity = max(1.0, self.rate / 10)
+            self._tokens = min(capacity, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self.rate
+            self._tokens -= 1.0
+            self.in_flight += 1
+            self.requests += 1
+            return 0.0
+
+    def _backoff(self, attempt: int) -> float:
+        return min(_MAX_BACKOFF_SECONDS, self.backoff_seconds * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _release(self):
+        """Give back the slot of a request that failed without a response to adapt to"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def _complete(self, status: Optional[int], headers: Dict, attempt: int) -> Optional[float]:
+        """Adapt the limits to one response; returns the retry delay, or None if it should not be retried"""
+        with self._lock:
+            now = time.monotonic()
+            self.in_flight -= 1
+
+            limit = _header_number(headers, 'X-RateLimit-Limit')
+            if limit:
+                self.header_limit = limit
+                self.rate = min(self.rate, limit)
+            if _header_number(headers, 'X-RateLimit-Remaining') == 0:
+                # The per-second window is used up; hold new requests until it resets
+                self._paused_until = max(self._paused_until, now + 1.0 - time.time() % 1.0)
+                self._tokens = 0.0
+
+            if status == 429:
+                self.throttled += 1
+                self._slow_start = False
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                delay = max(_header_number(headers, 'Retry-After') or 0.0, self._backoff(attempt))
+                self._paused_until = max(self._paused_until, now + delay)
+                return delay
+            if status is None or status >= 500:
+                self.server_errors += 1
+                self.concurrency = max(1.0, self.concurrency * 0.75)
+                return self._backoff(attempt)
+
+            self.rate = min(self._rate_ceiling(), self.rate + (1.0 if self._slow_start else 1.0 / self.rate))
+            self.concurrency = min(float(self.max_concurrency), self.concurrency + 1.0 / self.concurrency)
+            return None
+
+    def acquire(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def request(self, send: Callable, retry_exceptions: Tuple[Type[BaseException], ...] = ()):
+        """Send a request through the throttle, retrying 429s, 5xx and retry_exceptions.
+
+        Returns the last response; once retries run out a 429/5xx response is
+        returned as-is for the caller's raise_for_status().
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                response = send()
+            except retry_exceptions:
+                delay = self._complete(None, {}, attempt)
+                if attempt >= self.max_retries:
+                    raise
+            except BaseException:
+                # Any other error (or a cancelled task) still frees its slot
+                self._release()
+                raise
+            else:
+                delay = self._complete(response.status_code, response.headers, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    return response
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    async def request_async(self, send: Callable[[], Awaitable],
+                            retry_exceptions: Tuple[Type[BaseException], ...] = ()):
+        """Async request(): send is a coroutine function"""
+        attempt = 0
+        while True:
+            await self.acquire_async()
+            try:
+                response = await send()
+            except retry_exceptions:
+                delay = self._complete(None, {}, attempt)
+                if attempt >= self.max_retries:
+                    raise
+            except BaseException:
+                # Any other error (or a cancelled task) still frees its slot
+                self._release()
+                raise
+            else:
+                delay = self._complete(response.status_code, response.headers, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    return response
+            with self._lock:
+                self.retries += 1
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'rate': round(self.rate, 2),
+                'rate_ceiling': None if self._rate_ceiling() == float('inf') else self._rate_ceiling(),
+                'concurrency': round(self.concurrency, 2),
+                'in_flight': self.in_flight,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'server_errors': self.server_errors,
+                'retries': self.retries
+            }
+
+
+def _header_number(headers: Dict, name: str) -> Optional[float]:
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+_contentstack_throttler = None
+_contentstack_throttler_lock = threading.Lock()
+
+
+def get_contentstack_throttler() -> AdaptiveThrottler:
+    """Get or create the process-wide Contentstack throttle"""
+    global _contentstack_throttler
+    if _contentstack_throttler is None:
+        with _contentstack_throttler_lock:
+            if _contentstack_throttler is None:
+                _contentstack_throttler = AdaptiveThrottler(
+                    'contentstack',
+                    initial_rate=config.CONTENTSTACK_INITIAL_RPS,
+                    max_rate=config.CONTENTSTACK_MAX_RPS,
+                    initial_concurrency=config.CONTENTSTACK_FETCH_WORKERS,
+                    max_concurrency=config.CONTENTSTACK_MAX_CONCURRENCY,
+                    max_retries=config.CONTENTSTACK_MAX_RETRIES,
+                    backoff_seconds=config.CONTENTSTACK_RETRY_BACKOFF
+                )
+    return _contentstack_throttler
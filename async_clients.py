@@ -0,0 +1,491 @@
+"""
+Async HTTP clients for Contentstack, Pinecone and Gemini
+
+Used by the ASGI app (webhook_async.py) so a slow upstream call only parks a
+coroutine instead of blocking a whole worker.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+
+import httpx
+
+from config import config
+from deadline import Deadline
+from embeddings_generator import generate_product_embedding
+from query_rewriter import QueryRewriter
+from rewrite_cache import get_rewrite_cache
+from synonym_graph import get_synonym_table
+from precomputed_expansions import get_expansion_store
+from expansion_pruning import prune_expansions
+from adaptive_throttle import get_contentstack_throttler
+from reference_cache import REFERENCE_TEXT_FIELDS, get_reference_cache
+from metadata_schema import project_vectors
+from text_extractor import get_text_extractors
+from circuit_breaker import HedgeStats, pinecone_query_breaker
+from local_index import LocalReplicaIndex
+from upsert_batches import backoff_seconds, is_retryable, plan_batches, summarize
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
+PINECONE_CONTROL_URL = "https://api.pinecone.io"
+PINECONE_API_VERSION = "2024-07"
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create a shared async HTTP client with pooled connections"""
+    limits = httpx.Limits(
+        max_connections=config.ASYNC_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.ASYNC_HTTP_MAX_CONNECTIONS
+    )
+    return httpx.AsyncClient(timeout=config.ASYNC_HTTP_TIMEOUT, limits=limits)
+
+
+class AsyncEmbedder:
+    """Runs model inference on a bounded thread pool so it never blocks the event loop"""
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or config.EMBEDDING_EXECUTOR_WORKERS
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed")
+
+    async def embed_entry(self, entry: Dict, deadline: Deadline = None,
+                          content_type: str = None) -> Optional[List[float]]:
+        """Generate an entry embedding off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, generate_product_embedding, entry, deadline, content_type)
+
+    async def embed_query(self, query: str, deadline: Deadline = None) -> Optional[List[float]]:
+        """Generate a query embedding the same way the Flask app does"""
+        return await self.embed_entry({'title': query, 'description': query}, deadline=deadline)
+
+    async def prune_expansions(self, query: str, expansions: List[str],
+                               deadline: Deadline = None) -> Tuple[List[str], Dict[str, List[float]]]:
+        """Batch-embed the query and its expansions off the event loop and drop near-duplicates"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, prune_expansions, query, expansions, None, deadline)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsyncContentstackFetcher:
+    def __init__(self, client: httpx.AsyncClient):
+        if not config.validate_contentstack_config():
+            raise ValueError("Contentstack API credentials not found in configuration")
+
+        self.client = client
+        self.base_url = config.CONTENTSTACK_API_BASE_URL
+        self.environment = config.CONTENTSTACK_ENVIRONMENT
+        self.headers = config.get_contentstack_headers()
+        self.throttler = get_contentstack_throttler()
+
+    async def _get(self, url: str, params: Dict) -> httpx.Response:
+        """GET through the shared throttle, retrying 429s, 5xx and transport errors"""
+        return await self.throttler.request_async(
+            lambda: self.client.get(url, headers=self.headers, params=params),
+            retry_exceptions=(httpx.TransportError,)
+        )
+
+    async def load_text_extractor(self, content_type: str):
+        """Compile the content type's text extractor from its schema, fetched once per process"""
+        registry = get_text_extractors()
+        if not content_type or not registry.should_fetch(content_type):
+            return registry.get(content_type)
+        url = f"{self.base_url}/content_types/{content_type}"
+        params = {'environment': self.environment, 'include_global_field_schema': 'true'}
+        try:
+            response = await self._get(url, params)
+            response.raise_for_status()
+            return registry.register(response.json()['content_type'])
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            print(f"Warning: Could not load the {content_type} schema, using the default text fields: {e}")
+            registry.mark_unavailable(content_type)
+            return None
+
+    async def fetch_entries(self, content_type: str, limit: int = 100, skip: int = 0) -> Dict:
+        """Fetch one page of entries for a content type"""
+        url = f"{self.base_url}/content_types/{content_type}/entries"
+        params = {
+            'environment': self.environment,
+            'limit': limit,
+            'skip': skip,
+            'include_count': 'true'
+        }
+
+        try:
+            response = await self._get(url, params)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            print(f"Error fetching entries: {e}")
+            return {}
+
+    async def iter_entry_pages(self, content_type: str, limit: int = 100,
+                               strict: bool = False) -> AsyncIterator[List[Dict]]:
+        """Yield pages of entries in order, fetching the remaining offsets concurrently.
+
+        With strict, a page that cannot be fetched raises instead of being skipped.
+        """
+        first_page = await self.fetch_entries(content_type, limit=limit, skip=0)
+        if strict and not first_page:
+            raise RuntimeError(f"Page at skip=0 of {content_type} could not be fetched")
+        entries = first_page.get('entries', [])
+        total_count = first_page.get('count', 0)
+        yield entries
+        if len(entries) < limit or total_count <= limit:
+            return
+
+        offsets = deque(range(limit, total_count, limit))
+        window = config.CONTENTSTACK_FETCH_WORKERS
+        in_flight = deque()
+        try:
+            while offsets or in_flight:
+                while offsets and len(in_flight) < window:
+                    skip = offsets.popleft()
+                    in_flight.append((skip, asyncio.create_task(self.fetch_entries(content_type, limit, skip))))
+                skip, task = in_flight.popleft()
+                data = await task
+                if not data:
+                    if strict:
+                        raise RuntimeError(f"Page at skip={skip} of {content_type} could not be fetched")
+                    print(f"Warning: page at skip={skip} of {content_type} could not be fetched")
+                yield data.get('entries', [])
+        finally:
+            for _, task in in_flight:
+                task.cancel()
+
+    async def fetch_entries_by_uid(self, content_type: str, uids: List[str], locale: str = None) -> List[Dict]:
+        """Fetch the named entries with one uid[$in] query; raises on failure"""
+        url = f"{self.base_url}/content_types/{content_type}/entries"
+        params = {
+            'environment': self.environment,
+            'query': json.dumps({'uid': {'$in': sorted(uids)}}),
+            'limit': len(uids),
+            'only[BASE][]': REFERENCE_TEXT_FIELDS
+        }
+        if locale:
+            params['locale'] = locale
+        response = await self._get(url, params)
+        response.raise_for_status()
+        return response.json().get('entries', [])
+
+    async def resolve_references(self, entries: List[Dict], locale: str = None):
+        """Replace reference stubs in a batch of entries, fetching only uncached references"""
+        cache = get_reference_cache()
+        for (content_type, ref_locale), uids in cache.missing(entries, locale).items():
+            uids = sorted(uids)
+            for i in range(0, len(uids), 100):
+                chunk = uids[i:i + 100]
+                try:
+                    fetched = await self.fetch_entries_by_uid(content_type, chunk, ref_locale)
+                except httpx.HTTPError as e:
+                    print(f"Warning: Could not resolve {len(chunk)} {content_type} references: {e}")
+                    continue
+                cache.store(content_type, set(chunk), fetched, ref_locale)
+        cache.attach(entries, locale)
+
+    async def fetch_all_entries(self, content_type: str) -> List[Dict]:
+        """Fetch all entries for a content type with pagination; raises if any page fails"""
+        all_entries = []
+        async for entries in self.iter_entry_pages(content_type, strict=True):
+            all_entries.extend(entries)
+
+        print(f"Total entries fetched: {len(all_entries)}")
+        return all_entries
+
+    async def fetch_sync_items(self, content_type: str, sync_token: str = None) -> Tuple[List[Dict], str]:
+        """Fetch Sync API items since sync_token (or an initial sync); raises on any failed page"""
+        url = f"{self.base_url}/stacks/sync"
+        if sync_token:
+            params = {'sync_token': sync_token}
+        else:
+            params = {'init': 'true', 'environment': self.environment, 'content_type_uid': content_type}
+
+        items = []
+        while True:
+            response = await self._get(url, params)
+            response.raise_for_status()
+            data = response.json()
+            items.extend(data.get('items', []))
+
+            if data.get('pagination_token'):
+                params = {'pagination_token': data['pagination_token']}
+            elif data.get('sync_token'):
+                return items, data['sync_token']
+            else:
+                raise ValueError("Sync API response had neither pagination_token nor sync_token")
+
+    async def get_entry_details(self, content_type: str, entry_uid: str) -> Dict:
+        """Fetch a specific entry by UID"""
+        url = f"{self.base_url}/content_types/{content_type}/entries/{entry_uid}"
+
+        try:
+            response = await self._get(url, {'environment': self.environment})
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            print(f"Error fetching entry {entry_uid}: {e}")
+            return {}
+
+
+class AsyncPineconeManager:
+    """Talks to the Pinecone data plane over REST instead of the blocking SDK"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        if not config.validate_pinecone_config():
+            raise ValueError("PINECONE_API_KEY not configured")
+
+        self.client = client
+        self.index_name = config.PINECONE_INDEX_NAME
+        self.index_host = config.PINECONE_INDEX_HOST
+        self.headers = {
+            'Api-Key': config.PINECONE_API_KEY,
+            'X-Pinecone-API-Version': PINECONE_API_VERSION,
+            'Content-Type': 'application/json'
+        }
+        # The same query path protection as PineconeManager: breaker, hedging, local replica
+        self.query_breaker = pinecone_query_breaker()
+        self.hedge_stats = HedgeStats()
+        self._replica = None
+        self._replica_loaded = False
+
+    async def _get_host(self) -> str:
+        """Resolve (once) the data plane host of the index"""
+        if not self.index_host:
+            response = await self.client.get(f"{PINECONE_CONTROL_URL}/indexes/{self.index_name}", headers=self.headers)
+            response.raise_for_status()
+            self.index_host = response.json()['host']
+        if not self.index_host.startswith('http'):
+            self.index_host = f"https://{self.index_host}"
+        return self.index_host
+
+    async def _post(self, path: str, payload: Dict, timeout: float = None) -> Dict:
+        host = await self._get_host()
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        response = await self.client.post(f"{host}{path}", headers=self.headers, json=payload, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    async def _upsert_batch(self, batch: List[Dict[str, Any]], slots: asyncio.Semaphore) -> Dict:
+        """Send one batch, retrying transient failures with backoff"""
+        attempt = 0
+        async with slots:
+            while True:
+                try:
+                    await self._post('/vectors/upsert', {'vectors': batch})
+                    return {'vectors': len(batch), 'ok': True, 'attempts': attempt + 1, 'error': None}
+                except httpx.HTTPError as e:
+                    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                    if attempt >= config.PINECONE_UPSERT_RETRIES or not is_retryable(status):
+                        print(f"Error upserting batch of {len(batch)} vectors after {attempt + 1} attempts: {e}")
+                        return {'vectors': len(batch), 'ok': False, 'attempts': attempt + 1, 'error': str(e)}
+                await asyncio.sleep(backoff_seconds(attempt))
+                attempt += 1
+
+    async def upsert_vectors(self, vectors: List[Dict[str, Any]], batch_size: int = None) -> Dict:
+        """Upsert prepared {'id', 'values', 'metadata'} vectors in byte- and count-sized batches, several in flight"""
+        start = time.time()
+        vectors = project_vectors(vectors)
+        slots = asyncio.Semaphore(config.PINECONE_UPSERT_WORKERS)
+        results = await asyncio.gather(*(
+            self._upsert_batch(batch, slots) for batch in plan_batches(vectors, max_vectors=batch_size)
+        ))
+        summary = summarize(list(results), time.time() - start)
+        failed = f", {summary['failed']} failed" if summary['failed'] else ''
+        print(f"Upserted {summary['upserted']}/{len(vectors)} vectors in {summary['batches']} batches{failed}")
+        return summary
+
+    async def search_similar(self, query_embedding: List[float], top_k: int = 5, deadline: Deadline = None) -> Dict:
+        """Search for similar embeddings (circuit-broken and hedged, with replica fallback)"""
+        timeout = config.PINECONE_QUERY_TIMEOUT
+        if deadline is not None:
+            if deadline.expired():
+                deadline.skip('vector_query', 'deadline exceeded')
+                return {'matches': []}
+            timeout = deadline.timeout(cap=timeout)
+
+        if not self.query_breaker.allow_request():
+            return self._fallback_search(query_embedding, top_k, "circuit open")
+
+        self.hedge_stats.add(requests=1)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._query_index(query_embedding, top_k, timeout))
+        pending = {primary}
+
+        # Hedge: send a duplicate once the primary is slower than the rolling p95
+        hedge_delay = max(self.query_breaker.latency_percentile(95), config.PINECONE_HEDGE_MIN_DELAY_MS) / 1000.0
+        if config.PINECONE_HEDGE_ENABLED and hedge_delay < timeout:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done:
+                pending.add(asyncio.ensure_future(self._query_index(query_embedding, top_k, timeout)))
+                self.hedge_stats.add(hedges_sent=1)
+
+        last_error = None
+        upstream_failed = False
+        try:
+            while pending:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        results, latency_ms = task.result()
+                    except Exception as e:
+                        last_error = e
+                        # An error before our timeout ran out is the upstream's, not the deadline's
+                        upstream_failed = upstream_failed or time.monotonic() - started < timeout
+                        continue
+                    # Record the attempt's own latency so hedging doesn't inflate the p95
+                    self.query_breaker.record(True, latency_ms)
+                    if task is not primary:
+                        self.hedge_stats.add(hedge_wins=1)
+                    return results
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if timeout < config.PINECONE_QUERY_TIMEOUT and not upstream_failed:
+            # The request's deadline cut the wait short; that says nothing about Pinecone's health
+            self.query_breaker.release()
+        else:
+            self.query_breaker.record(False, (time.monotonic() - started) * 1000)
+        print(f"Error searching: {last_error or 'query timed out'}")
+        return self._fallback_search(query_embedding, top_k, "query failed")
+
+    async def _query_index(self, query_embedding: List[float], top_k: int, timeout: float):
+        """One query attempt, returning (results, latency_ms)"""
+        started = time.monotonic()
+        results = await self._post('/query', {
+            'vector': query_embedding,
+            'topK': top_k,
+            'includeMetadata': True,
+            'includeValues': False
+        }, timeout=timeout)
+        return results, (time.monotonic() - started) * 1000
+
+    def get_local_replica(self):
+        """Load the local replica index once, if one is configured"""
+        if not self._replica_loaded:
+            self._replica_loaded = True
+            if config.PINECONE_LOCAL_REPLICA_PATH:
+                try:
+                    self._replica = LocalReplicaIndex(config.PINECONE_LOCAL_REPLICA_PATH)
+                except Exception as e:
+                    print(f"Could not load local replica index: {e}")
+        return self._replica
+
+    def _fallback_search(self, query_embedding: List[float], top_k: int, reason: str) -> Dict:
+        replica = self.get_local_replica()
+        if replica is None:
+            return {'matches': []}
+        print(f"↪️ Serving query from local replica ({reason})")
+        self.hedge_stats.add(fallbacks=1)
+        return replica.query(query_embedding, top_k=top_k)
+
+    def get_query_stats(self) -> Dict:
+        """Breaker state and hedging counters for the query path"""
+        return {
+            'breaker': self.query_breaker.stats(),
+            'hedging': self.hedge_stats.stats(),
+            'local_replica': len(self._replica) if self._replica is not None else None
+        }
+
+    async def delete_product(self, product_id: str):
+        """Delete a product from the index"""
+        try:
+            await self._post('/vectors/delete', {'ids': [product_id]})
+            print(f"Deleted product {product_id} from Pinecone")
+        except (httpx.HTTPError, KeyError) as e:
+            print(f"Error deleting product {product_id}: {e}")
+
+    async def delete_products(self, product_ids: List[str], batch_size: int = 1000) -> int:
+        """Delete many products from the index in batches, returning how many were deleted"""
+        deleted = 0
+        for i in range(0, len(product_ids), batch_size):
+            batch = product_ids[i:i + batch_size]
+            try:
+                await self._post('/vectors/delete', {'ids': batch})
+                deleted += len(batch)
+                print(f"Deleted batch {i//batch_size + 1} with {len(batch)} products from Pinecone")
+            except (httpx.HTTPError, KeyError) as e:
+                print(f"Error deleting batch {i//batch_size + 1}: {e}")
+        return deleted
+
+
+class AsyncQueryRewriter:
+    """Gemini query rewriting over the REST API, sharing prompt and parsing with QueryRewriter"""
+
+    def __init__(self, client: httpx.AsyncClient, mode: str = None):
+        self.mode = (mode or config.QUERY_EXPANSION_MODE).lower()
+        if self.mode == 'local':
+            if get_synonym_table() is None:
+                raise ValueError(f"Synonym table not found at {config.SYNONYM_TABLE_PATH}; run synonym_graph.py")
+        elif not config.validate_gemini_config():
+            raise ValueError("GEMINI_API_KEY not configured")
+
+        self.client = client
+        self.api_key = config.GEMINI_API_KEY
+        self.use_llm = bool(self.api_key) and (self.mode != 'local' or config.QUERY_EXPANSION_LLM_FALLBACK)
+
+    def local_rewrites(self, query: str, num_rewrites: int) -> List[str]:
+        """Expansions from the synonym table (empty for out-of-vocabulary queries)"""
+        table = get_synonym_table() if self.mode == 'local' else None
+        return table.expand(query, num_rewrites) if table else []
+
+    async def rewrite_query(self, query: str, num_rewrites: int = 3, timeout: float = None) -> List[str]:
+        """Rewrite a query into multiple semantically similar forms"""
+        cache = get_rewrite_cache()
+        if cache is not None:
+            hit, cached = cache.get(query, num_rewrites)
+            if hit:
+                return cached
+
+        payload = {'contents': [{'parts': [{'text': QueryRewriter.build_prompt(query, num_rewrites)}]}]}
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+
+        try:
+            response = await self.client.post(GEMINI_API_URL, params={'key': self.api_key}, json=payload, **kwargs)
+            response.raise_for_status()
+            result_text = response.json()['candidates'][0]['content']['parts'][0]['text']
+            rewrites = QueryRewriter.parse_rewrites(result_text, num_rewrites)
+        except httpx.TimeoutException as e:
+            print(f"Error rewriting query: {e}")
+            return []
+        except (httpx.HTTPError, KeyError, IndexError) as e:
+            print(f"Error rewriting query: {e}")
+            if cache is not None:
+                cache.put(query, num_rewrites, [])
+            return []
+
+        # Unparseable responses come back empty and are cached as failures
+        if cache is not None:
+            cache.put(query, num_rewrites, rewrites)
+        return rewrites
+
+    async def expand_query(self, query: str, num_expansions: int = 5, deadline: Deadline = None) -> List[str]:
+        """Expand a query with multiple related search terms"""
+        # Precomputed and local expansions are lookups, so they never need budget
+        store = get_expansion_store()
+        precomputed = store.get(query, num_expansions) if store else None
+        if precomputed:
+            return QueryRewriter.merge_expansions(query, precomputed)
+
+        rewrites = self.local_rewrites(query, num_expansions)
+        if rewrites or not self.use_llm:
+            return QueryRewriter.merge_expansions(query, rewrites)
+
+        timeout = None
+        if deadline is not None:
+            # Leave enough budget to embed and search the original query afterwards
+            if not deadline.allows(config.REWRITE_MIN_BUDGET_MS + config.SEARCH_RESERVE_MS):
+                deadline.skip('rewrite', 'not enough budget for the LLM rewrite')
+                return [query]
+            timeout = deadline.timeout(reserve_ms=config.SEARCH_RESERVE_MS)
+
+        rewrites = await self.rewrite_query(query, num_expansions, timeout=timeout)
+        if deadline is not None and not rewrites and not deadline.allows(config.SEARCH_RESERVE_MS):
+            deadline.skip('rewrite', 'LLM rewrite timed out')
+        return QueryRewriter.merge_expansions(query, rewrites)
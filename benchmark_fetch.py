@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Payload benchmark for Contentstack entry fetches
+
+Fetches the same pages of a content type with and without field projection
+(only[BASE][]) and reports bytes transferred and JSON parse time for each.
+The entry cache is bypassed so both runs download full bodies:
+
+    python benchmark_fetch.py --content-type product --pages 10
+"""
+import argparse
+
+from config import config
+from contentstack_fetcher import ContentstackFetcher, projected_fields
+
+
+def measure(content_type: str, pages: int, limit: int, projection: bool) -> dict:
+    """Fetch the first pages of a content type and return the fetcher's transfer stats"""
+    fetcher = ContentstackFetcher()
+    entries = 0
+    for page in range(pages):
+        data = fetcher.fetch_entries(content_type, limit=limit, skip=page * limit, projection=projection)
+        entries += len(data.get('entries', []))
+        if len(data.get('entries', [])) < limit:
+            break
+    return {**fetcher.transfer_stats, 'entries': entries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Contentstack payload size with and without field projection")
+    parser.add_argument('--content-type', default='product')
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    config.ENTRY_CACHE_PATH = ''  # Conditional requests would hide the body sizes
+    print(f"Projected fields: {', '.join(projected_fields())}")
+
+    results = {
+        'full': measure(args.content_type, args.pages, args.limit, projection=False),
+        'projected': measure(args.content_type, args.pages, args.limit, projection=True)
+    }
+    for name, stats in results.items():
+        per_entry = stats['bytes'] / stats['entries'] if stats['entries'] else 0
+        print(f"{name:>10}: {stats['entries']} entries, {stats['bytes'] / 1024:.1f} KiB "
+              f"({per_entry:.0f} B/entry), parse {stats['parse_seconds'] * 1000:.1f} ms")
+
+    full, projected = results['full'], results['projected']
+    if full['bytes']:
+        print(f"✅ Projection cut bytes by {100 * (1 - projected['bytes'] / full['bytes']):.1f}% "
+              f"and parse time by {100 * (1 - projected['parse_seconds'] / max(full['parse_seconds'], 1e-9)):.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Concurrent load benchmark for the /search endpoint
+
+Works against any of the servers (webhook_full.py under gunicorn, webhook_async.py
+under uvicorn) so their numbers are directly comparable:
+
+    python benchmark_search.py --url http://localhost:5000 --concurrency 200 --requests 2000
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUERIES = [
+    "red sneakers",
+    "wireless headphones",
+    "comfortable shoes",
+    "gym workout gear",
+    "leather wallet",
+    "smart watch"
+]
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def run_benchmark(url: str, concurrency: int, total_requests: int, rewrite: bool, timeout: float):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def one_request(i):
+        payload = {'query': QUERIES[i % len(QUERIES)], 'top_k': 5, 'rewrite': rewrite}
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{url}/search", json=payload, timeout=timeout)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    print(f"🚀 {total_requests} requests to {url}/search with {concurrency} in flight (rewrite: {rewrite})")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for ok, latency in results if ok]
+    errors = sum(1 for ok, _ in results if not ok)
+
+    print(f"   Completed: {len(latencies)}  Errors: {errors}")
+    print(f"   Throughput: {len(latencies) / elapsed:.1f} req/s over {elapsed:.1f}s")
+    if latencies:
+        print(f"   Latency ms  mean: {statistics.mean(latencies):.0f}  p50: {percentile(latencies, 50):.0f}"
+              f"  p95: {percentile(latencies, 95):.0f}  p99: {percentile(latencies, 99):.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /search endpoint")
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rewrite', action='store_true')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    run_benchmark(args.url.rstrip('/'), args.concurrency, args.requests, args.rewrite, args.timeout)
+
+if __name__ == "__main__":
+    main()
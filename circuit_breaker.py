@@ -0,0 +1,163 @@
+"""
+Circuit breaker with rolling error and latency windows
+
+Tracks the outcome and latency of recent calls to an upstream (the Pinecone
+query path). Opens when the error rate or slow-call rate over the window
+crosses its threshold, lets a single probe through after a cool-down
+(half-open) and closes again once a probe succeeds. A call the caller gave up
+on (its own deadline ran out first) is released without a verdict. The
+rolling latencies also give the p95 used to decide when to hedge a request.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from config import config
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window_seconds: float = 30.0, min_requests: int = 10,
+                 error_rate_threshold: float = 0.5, slow_call_ms: float = 2000.0,
+                 slow_rate_threshold: float = 0.8, open_seconds: float = 15.0):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_ms = slow_call_ms
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._calls = deque()  # (timestamp, ok, latency_ms)
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to the upstream right now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, latency_ms: float):
+        """Record the outcome of one upstream call"""
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append((now, ok, latency_ms))
+            self._trim(now)
+
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and latency_ms < self.slow_call_ms:
+                    print(f"🟢 Circuit '{self.name}' closed")
+                    self.state = CLOSED
+                else:
+                    self._open(now)
+                return
+
+            if self.state == CLOSED and len(self._calls) >= self.min_requests:
+                total = len(self._calls)
+                errors = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+                slow = sum(1 for _, _, latency in self._calls if latency >= self.slow_call_ms)
+                if errors / total >= self.error_rate_threshold or slow / total >= self.slow_rate_threshold:
+                    self._open(now)
+
+    def release(self):
+        """Give back a call without recording an outcome (the caller's deadline cut it short)"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _open(self, now: float):
+        print(f"🔴 Circuit '{self.name}' opened")
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+
+    def latency_percentile(self, pct: float) -> float:
+        """Latency percentile (ms) of successful calls in the window, 0 if none"""
+        with self._lock:
+            self._trim(time.monotonic())
+            latencies = sorted(latency for _, ok, latency in self._calls if ok)
+        if not latencies:
+            return 0.0
+        index = min(len(latencies) - 1, int(pct / 100.0 * len(latencies)))
+        return latencies[index]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            total = len(self._calls)
+            errors = sum(1 for _, ok, _ in self._calls if not ok)
+            slow = sum(1 for _, _, latency in self._calls if latency >= self.slow_call_ms)
+            state = self.state
+        return {
+            'state': state,
+            'window_calls': total,
+            'error_rate': round(errors / total, 3) if total else 0.0,
+            'slow_rate': round(slow / total, 3) if total else 0.0,
+            'p95_ms': round(self.latency_percentile(95), 1),
+            'times_opened': self.times_opened,
+            'rejected': self.rejected
+        }
+
+
+class HedgeStats:
+    """Counts hedged requests and how often the hedge beat the primary"""
+
+    def __init__(self):
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def add(self, requests: int = 0, hedges_sent: int = 0, hedge_wins: int = 0, fallbacks: int = 0):
+        with self._lock:
+            self.requests += requests
+            self.hedges_sent += hedges_sent
+            self.hedge_wins += hedge_wins
+            self.fallbacks += fallbacks
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges_sent': self.hedges_sent,
+                'hedge_wins': self.hedge_wins,
+                'hedge_win_rate': round(self.hedge_wins / self.hedges_sent, 3) if self.hedges_sent else 0.0,
+                'replica_fallbacks': self.fallbacks
+            }
+
+
+def pinecone_query_breaker() -> CircuitBreaker:
+    """A breaker for a Pinecone query path, with the PINECONE_BREAKER_* settings"""
+    return CircuitBreaker(
+        'pinecone-query',
+        window_seconds=config.PINECONE_BREAKER_WINDOW_SECONDS,
+        min_requests=config.PINECONE_BREAKER_MIN_REQUESTS,
+        error_rate_threshold=config.PINECONE_BREAKER_ERROR_RATE,
+        slow_call_ms=config.PINECONE_BREAKER_SLOW_CALL_MS,
+        slow_rate_threshold=config.PINECONE_BREAKER_SLOW_RATE,
+        open_seconds=config.PINECONE_BREAKER_OPEN_SECONDS
+    )
@@ -2,6 +2,7 @@
 Configuration management for Contentstack Semantic Search
 """
 import os
+import tempfile
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -17,14 +18,82 @@ class Config:
     CONTENTSTACK_ENVIRONMENT: str = os.getenv('CONTENTSTACK_ENVIRONMENT', 'development').strip()
     CONTENTSTACK_REGION: str = os.getenv('CONTENTSTACK_REGION', 'eu').strip()  # eu or us
     CONTENTSTACK_API_BASE_URL: str = os.getenv('CONTENTSTACK_API_BASE_URL', f"https://{CONTENTSTACK_REGION}-cdn.contentstack.com/v3").strip()
+    CONTENTSTACK_DEFAULT_LOCALE: str = os.getenv('CONTENTSTACK_DEFAULT_LOCALE', 'en-us').strip()  # Vectors in this locale keep the bare uid
+    CONTENTSTACK_FETCH_WORKERS: int = int(os.getenv('CONTENTSTACK_FETCH_WORKERS', '8'))  # Concurrent page fetches
+    CONTENTSTACK_FIELD_PROJECTION: bool = os.getenv('CONTENTSTACK_FIELD_PROJECTION', 'true').lower() == 'true'  # Fetch only the fields syncs read
+    CONTENTSTACK_REFERENCE_FIELDS: str = os.getenv('CONTENTSTACK_REFERENCE_FIELDS', 'brand,category').strip()  # Reference fields resolved into embedding text
+    CONTENTSTACK_SCHEMA_PATH: str = os.getenv('CONTENTSTACK_SCHEMA_PATH', '').strip()  # Content type schemas to compile text extractors from
+    CONTENTSTACK_GLOBAL_FIELDS_PATH: str = os.getenv('CONTENTSTACK_GLOBAL_FIELDS_PATH', '').strip()  # Global field schemas they include
+    REFERENCE_CACHE_SIZE: int = int(os.getenv('REFERENCE_CACHE_SIZE', '10000'))  # Referenced entries kept in the shared LRU
+    CONTENTSTACK_INITIAL_RPS: float = float(os.getenv('CONTENTSTACK_INITIAL_RPS', '10'))  # Starting rate of the adaptive throttle
+    CONTENTSTACK_MAX_RPS: float = float(os.getenv('CONTENTSTACK_MAX_RPS', '100'))  # Ceiling for the adaptive rate (0 = headers only)
+    CONTENTSTACK_MAX_CONCURRENCY: int = int(os.getenv('CONTENTSTACK_MAX_CONCURRENCY', '16'))  # Ceiling for requests in flight
+    CONTENTSTACK_MAX_RETRIES: int = int(os.getenv('CONTENTSTACK_MAX_RETRIES', '5'))  # Retries of 429/5xx/connection errors
+    CONTENTSTACK_RETRY_BACKOFF: float = float(os.getenv('CONTENTSTACK_RETRY_BACKOFF', '0.5'))  # First backoff (seconds), doubles per retry
+    SYNC_CONTENT_TYPES: str = os.getenv('SYNC_CONTENT_TYPES', 'product').strip()  # Comma-separated, for multi-type syncs
+    SYNC_LOCALES: str = os.getenv('SYNC_LOCALES', '').strip()  # Comma-separated; empty uses the stack default locale
+    SYNC_MAX_PARALLEL_JOBS: int = int(os.getenv('SYNC_MAX_PARALLEL_JOBS', '8'))  # Content type/locale jobs run at once
+    SYNC_EMBED_WORKERS: int = int(os.getenv('SYNC_EMBED_WORKERS', '2'))  # Shared embedding pool for multi-type syncs
+    SYNC_EMBED_BATCH_SIZE: int = int(os.getenv('SYNC_EMBED_BATCH_SIZE', '64'))  # Entries per encode call
+    SYNC_UPSERT_BATCH_SIZE: int = int(os.getenv('SYNC_UPSERT_BATCH_SIZE', '100'))  # Vectors per Pinecone upsert
+    SYNC_QUEUE_SIZE: int = int(os.getenv('SYNC_QUEUE_SIZE', '4'))  # Batches buffered between pipeline stages
+    ENTRY_CACHE_PATH: str = os.getenv('ENTRY_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'contentstack-entry-cache.sqlite3')).strip()  # Empty disables
+    SYNC_JOBS_PATH: str = os.getenv('SYNC_JOBS_PATH', os.path.join(tempfile.gettempdir(), 'contentstack-sync-jobs.sqlite3')).strip()  # Background /sync jobs
+    SYNC_JOB_MAX_RESUMES: int = int(os.getenv('SYNC_JOB_MAX_RESUMES', '3'))  # Times an interrupted job is run again at startup
+    SYNC_SEARCH_YIELD_SECONDS: float = float(os.getenv('SYNC_SEARCH_YIELD_SECONDS', '2.0'))  # Longest a sync batch waits for searches
+    WEBHOOK_COALESCE_SECONDS: float = float(os.getenv('WEBHOOK_COALESCE_SECONDS', '1.0'))  # Window webhook events are buffered for
+    WEBHOOK_BATCH_SIZE: int = int(os.getenv('WEBHOOK_BATCH_SIZE', '256'))  # Entries indexed per webhook batch
+    WEBHOOK_MAX_RETRIES: int = int(os.getenv('WEBHOOK_MAX_RETRIES', '5'))  # Retries of a failed webhook event before it is dropped
+    WEBHOOK_RETRY_BACKOFF: float = float(os.getenv('WEBHOOK_RETRY_BACKOFF', '1.0'))  # Base backoff seconds after a failed batch, doubled per failure
+    RECONCILE_DELETE_BATCH_SIZE: int = int(os.getenv('RECONCILE_DELETE_BATCH_SIZE', '1000'))  # Stale vector ids per Pinecone delete
+    RECONCILE_MAX_DELETE_FRACTION: float = float(os.getenv('RECONCILE_MAX_DELETE_FRACTION', '0.5'))  # Larger purges need force
+    SYNC_STATE_PATH: str = os.getenv('SYNC_STATE_PATH', 'sync_state.json').strip()  # Sync API tokens for delta syncs
 
     # Pinecone Configuration
     PINECONE_API_KEY: str = os.getenv('PINECONE_API_KEY', '').strip()
     PINECONE_INDEX_NAME: str = os.getenv('PINECONE_INDEX_NAME', 'contentstack-products').strip()
+    PINECONE_INDEX_HOST: str = os.getenv('PINECONE_INDEX_HOST', '').strip()  # Resolved from the control plane when empty
+
+    # Pinecone Query Path Resilience (circuit breaker, hedging, local replica fallback)
+    PINECONE_QUERY_TIMEOUT: float = float(os.getenv('PINECONE_QUERY_TIMEOUT', '10'))
+    PINECONE_QUERY_WORKERS: int = int(os.getenv('PINECONE_QUERY_WORKERS', '8'))
+    PINECONE_UPSERT_MAX_BYTES: int = int(os.getenv('PINECONE_UPSERT_MAX_BYTES', '1800000'))  # Per request; Pinecone's cap is 2 MB
+    PINECONE_UPSERT_MAX_VECTORS: int = int(os.getenv('PINECONE_UPSERT_MAX_VECTORS', '1000'))  # Per request; Pinecone's cap is 1000
+    PINECONE_UPSERT_WORKERS: int = int(os.getenv('PINECONE_UPSERT_WORKERS', '4'))  # Upsert requests in flight at once
+    PINECONE_UPSERT_RETRIES: int = int(os.getenv('PINECONE_UPSERT_RETRIES', '3'))  # Retries of a failed upsert batch
+    PINECONE_UPSERT_BACKOFF: float = float(os.getenv('PINECONE_UPSERT_BACKOFF', '0.5'))  # Base backoff seconds, doubled per retry
+    METADATA_DESCRIPTION_MAX_CHARS: int = int(os.getenv('METADATA_DESCRIPTION_MAX_CHARS', '300'))  # Description stored per vector
+    PINECONE_BREAKER_WINDOW_SECONDS: float = float(os.getenv('PINECONE_BREAKER_WINDOW_SECONDS', '30'))
+    PINECONE_BREAKER_MIN_REQUESTS: int = int(os.getenv('PINECONE_BREAKER_MIN_REQUESTS', '10'))
+    PINECONE_BREAKER_ERROR_RATE: float = float(os.getenv('PINECONE_BREAKER_ERROR_RATE', '0.5'))
+    PINECONE_BREAKER_SLOW_CALL_MS: float = float(os.getenv('PINECONE_BREAKER_SLOW_CALL_MS', '2000'))
+    PINECONE_BREAKER_SLOW_RATE: float = float(os.getenv('PINECONE_BREAKER_SLOW_RATE', '0.8'))
+    PINECONE_BREAKER_OPEN_SECONDS: float = float(os.getenv('PINECONE_BREAKER_OPEN_SECONDS', '15'))
+    PINECONE_HEDGE_ENABLED: bool = os.getenv('PINECONE_HEDGE_ENABLED', 'True').lower() == 'true'
+    PINECONE_HEDGE_MIN_DELAY_MS: float = float(os.getenv('PINECONE_HEDGE_MIN_DELAY_MS', '50'))  # Used until p95 is known
+    PINECONE_LOCAL_REPLICA_PATH: str = os.getenv('PINECONE_LOCAL_REPLICA_PATH', '').strip()
 
     # Gemini/LLM Configuration
     GEMINI_API_KEY: str = os.getenv('GEMINI_API_KEY', '').strip()
 
+    # Query Expansion Mode ('llm' = Gemini, 'local' = synonym table with optional Gemini fallback)
+    QUERY_EXPANSION_MODE: str = os.getenv('QUERY_EXPANSION_MODE', 'llm').strip().lower()
+    QUERY_EXPANSION_LLM_FALLBACK: bool = os.getenv('QUERY_EXPANSION_LLM_FALLBACK', 'True').lower() == 'true'
+    SYNONYM_TABLE_PATH: str = os.getenv('SYNONYM_TABLE_PATH', 'synonym_table.json').strip()
+    MINED_TERMS_PATH: str = os.getenv('MINED_TERMS_PATH', 'mined_terms.json').strip()  # Terms collected during sync
+
+    # Search Log and Precomputed Expansions (shared SQLite file; empty path disables both)
+    PRECOMPUTED_EXPANSIONS_PATH: str = os.getenv('PRECOMPUTED_EXPANSIONS_PATH', os.path.join(tempfile.gettempdir(), 'contentstack-expansions.sqlite3')).strip()
+    PRECOMPUTED_EXPANSIONS_TTL: float = float(os.getenv('PRECOMPUTED_EXPANSIONS_TTL', str(7 * 24 * 3600)))
+    SEARCH_LOG_FLUSH_SECONDS: float = float(os.getenv('SEARCH_LOG_FLUSH_SECONDS', '5'))  # Searches are counted in memory between writes
+    SEARCH_LOG_HALF_LIFE: float = float(os.getenv('SEARCH_LOG_HALF_LIFE', str(7 * 24 * 3600)))  # Search counts halve over this many seconds
+    SEARCH_LOG_RETENTION: float = float(os.getenv('SEARCH_LOG_RETENTION', str(30 * 24 * 3600)))  # Queries unseen this long are pruned
+
+    # Query Rewrite Cache (shared SQLite file; empty path disables it)
+    REWRITE_CACHE_PATH: str = os.getenv('REWRITE_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'contentstack-rewrite-cache.sqlite3')).strip()
+    REWRITE_CACHE_TTL: float = float(os.getenv('REWRITE_CACHE_TTL', str(7 * 24 * 3600)))
+    REWRITE_CACHE_NEGATIVE_TTL: float = float(os.getenv('REWRITE_CACHE_NEGATIVE_TTL', '300'))
+
     # Ngrok Configuration
     NGROK_AUTH_TOKEN: str = os.getenv('NGROK_AUTH_TOKEN', '').strip()
     NGROK_DOMAIN: str = os.getenv('NGROK_DOMAIN', 'destined-mammoth-flowing.ngrok-free.app').strip()
@@ -40,6 +109,27 @@ class Config:
     DEFAULT_TOP_K: int = int(os.getenv('DEFAULT_TOP_K', '5'))
     MAX_TOP_K: int = int(os.getenv('MAX_TOP_K', '20'))
 
+    # Search Deadline Configuration (per-request budget, overridable via header)
+    SEARCH_DEADLINE_HEADER: str = os.getenv('SEARCH_DEADLINE_HEADER', 'X-Search-Deadline-Ms').strip()
+    SEARCH_DEADLINE_MS: float = float(os.getenv('SEARCH_DEADLINE_MS', '8000'))
+    SEARCH_MAX_DEADLINE_MS: float = float(os.getenv('SEARCH_MAX_DEADLINE_MS', '30000'))
+    REWRITE_MIN_BUDGET_MS: float = float(os.getenv('REWRITE_MIN_BUDGET_MS', '2000'))  # Skip rewrite below this
+    SEARCH_RESERVE_MS: float = float(os.getenv('SEARCH_RESERVE_MS', '1000'))  # Kept for embed + query of the original
+    EXPANSION_MIN_BUDGET_MS: float = float(os.getenv('EXPANSION_MIN_BUDGET_MS', '500'))  # Skip extra expansions below this
+    EXPANSION_PRUNE_SIMILARITY: float = float(os.getenv('EXPANSION_PRUNE_SIMILARITY', '0.9'))  # 1.0 disables pruning
+    SEARCH_EXECUTOR_WORKERS: int = int(os.getenv('SEARCH_EXECUTOR_WORKERS', '16'))  # Concurrent base/rewrite/expansion tasks
+    MODEL_LOAD_BUDGET_MS: float = float(os.getenv('MODEL_LOAD_BUDGET_MS', '15000'))  # Needed to load the model cold
+
+    # Async Server Configuration
+    ASYNC_HTTP_TIMEOUT: float = float(os.getenv('ASYNC_HTTP_TIMEOUT', '30'))
+    ASYNC_HTTP_MAX_CONNECTIONS: int = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '200'))
+    EMBEDDING_EXECUTOR_WORKERS: int = int(os.getenv('EMBEDDING_EXECUTOR_WORKERS', '2'))
+
+    # Embedding Sidecar Configuration (empty socket path = encode in-process)
+    EMBEDDING_SIDECAR_SOCKET: str = os.getenv('EMBEDDING_SIDECAR_SOCKET', '').strip()
+    EMBEDDING_SIDECAR_TIMEOUT: float = float(os.getenv('EMBEDDING_SIDECAR_TIMEOUT', '10'))
+    EMBEDDING_SIDECAR_RETRY_AFTER: float = float(os.getenv('EMBEDDING_SIDECAR_RETRY_AFTER', '30'))
+
     @classmethod
     def validate_contentstack_config(cls) -> bool:
         """Validate Contentstack configuration"""
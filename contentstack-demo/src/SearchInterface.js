@@ -74,7 +74,16 @@ function SearchInterface() {
     setError('');
 
     try {
-      await axios.post(`${API_BASE_URL}/sync?content_type=product`);
+      // webhook_full.py runs the sync as a background job to poll; webhook_async.py answers once it is done
+      const { data } = await axios.post(`${API_BASE_URL}/sync?content_type=product`);
+      let job = data.job_id ? data : { ...data, status: 'completed' };
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        ({ data: job } = await axios.get(`${API_BASE_URL}/sync/${data.job_id}`));
+      }
+      if (job.status !== 'completed') {
+        throw new Error(job.error || `Sync ${job.status}`);
+      }
       alert('Content sync completed successfully!');
     } catch (err) {
       console.error('Sync error:', err);
@@ -171,8 +180,8 @@ function SearchInterface() {
 
                 <div className="result-meta">
                   <span className="product-id">ID: {result.product_id}</span>
-                  {result.metadata?.content_type && (
-                    <span className="content-type">{result.metadata.content_type}</span>
+                  {result.content_type && (
+                    <span className="content-type">{result.content_type}</span>
                   )}
                 </div>
 
@@ -182,9 +191,9 @@ function SearchInterface() {
                   </div>
                 )}
 
-                {result.metadata?.url && (
+                {result.url && (
                   <a
-                    href={result.metadata.url}
+                    href={result.url}
                     target="_blank"
                     rel="noopener noreferrer"
                     className="result-link"
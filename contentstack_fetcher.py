@@ -1,11 +1,33 @@
 import requests
+import json
 import os
-from embeddings_generator import generate_product_embedding
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from embeddings_generator import generate_product_embedding, embedding_text_function, EMBEDDING_TEXT_FIELDS
 from pinecone_integration import PineconeManager
+from synonym_graph import update_mined_terms
+from sync_state import get_sync_state, collapse_sync_items, uid_set_hash, vector_id
+from sync_pipeline import SyncPipeline
+from entry_cache import get_entry_cache
+from adaptive_throttle import get_contentstack_throttler
+from reference_cache import REFERENCE_TEXT_FIELDS, get_reference_cache, reference_fields
+from text_extractor import get_text_extractors
 from config import config
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 import time
 
+# Entry fields read by entry_metadata() and the entry cache
+ENTRY_METADATA_FIELDS = ['uid', 'title', 'locale', 'url', 'publish_details', '_version']
+
+
+def projected_fields(content_type: str = None) -> List[str]:
+    """The minimal field set a sync needs: embedding text, vector metadata and reference stubs"""
+    extractor = get_text_extractors().get(content_type)
+    text_fields = extractor.fields if extractor else EMBEDDING_TEXT_FIELDS
+    return sorted(set(text_fields) | set(ENTRY_METADATA_FIELDS) | set(reference_fields()))
+
+
 class ContentstackFetcher:
     def __init__(self):
         self.stack_api_key = config.CONTENTSTACK_STACK_API_KEY
@@ -19,6 +41,13 @@ class ContentstackFetcher:
         # Set up base URL based on region
         self.base_url = config.CONTENTSTACK_API_BASE_URL
         
+        # Pooled connections shared by the page-fetch workers
+        self.session = requests.Session()
+        # Adaptive rate limit and retries, shared with every other fetcher in the process
+        self.throttler = get_contentstack_throttler()
+        self._stats_lock = threading.Lock()
+        self.transfer_stats = {'requests': 0, 'bytes': 0, 'parse_seconds': 0.0}
+        
         # Initialize Pinecone manager
         self.pinecone_manager = None
         try:
@@ -26,16 +55,26 @@ class ContentstackFetcher:
         except Exception as e:
             print(f"Warning: Pinecone not available: {e}")
 
-    def fetch_entries(self, content_type: str, limit: int = 100, skip: int = 0) -> Dict:
-        """Fetch entries from Contentstack for a specific content type"""
+    def fetch_entries(self, content_type: str, limit: int = 100, skip: int = 0, projection: bool = None,
+                      locale: str = None, fields: List[str] = None) -> Dict:
+        """Fetch entries from Contentstack for a specific content type (and locale)"""
         url = f"{self.base_url}/content_types/{content_type}/entries"
         
         params = {
             'environment': self.environment,
             'limit': limit,
             'skip': skip,
-            'include_count': True
+            'include_count': True,
+            # Oldest first, so entries created mid-sync land after a resume checkpoint
+            'asc': 'created_at'
         }
+        if locale:
+            params['locale'] = locale
+        if fields:
+            params['only[BASE][]'] = fields
+        elif config.CONTENTSTACK_FIELD_PROJECTION if projection is None else projection:
+            self.load_text_extractor(content_type)
+            params['only[BASE][]'] = projected_fields(content_type)
         
         headers = {
             "api_key": self.stack_api_key,
@@ -44,54 +83,192 @@ class ContentstackFetcher:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._get_json(url, headers, params, content_type)
         except requests.exceptions.RequestException as e:
             print(f"Error fetching entries: {e}")
             return {}
 
-    def fetch_all_entries(self, content_type: str) -> List[Dict]:
-        """Fetch all entries for a content type with pagination"""
-        all_entries = []
-        skip = 0
-        limit = 100
+    def _get_json(self, url: str, headers: Dict, params: Dict, content_type: str) -> Dict:
+        """GET with If-None-Match against the entry cache; a 304 is served from the cache"""
+        cache = get_entry_cache()
+        request_key = cache.request_key(url, params) if cache else None
+        etag = cache.get_etag(request_key) if cache else None
         
-        while True:
-            print(f"Fetching entries {skip} to {skip + limit}...")
-            data = self.fetch_entries(content_type, limit=limit, skip=skip)
-            
-            entries = data.get('entries', [])
-            all_entries.extend(entries)
-            
-            # Check if we have all entries
-            total_count = data.get('count', 0)
-            if len(all_entries) >= total_count or len(entries) < limit:
-                break
-                
-            skip += limit
-            time.sleep(0.1)  # Small delay to be respectful to the API
+        response = self._get(url, {**headers, 'If-None-Match': etag} if etag else headers, params)
+        if response.status_code == 304:
+            with self._stats_lock:
+                self.transfer_stats['requests'] += 1
+            data = cache.load_response(request_key)
+            if data is not None:
+                return data
+            # An entry behind the cached response is gone; fetch the full body again
+            response = self._get(url, headers, params)
         
-        print(f"Total entries fetched: {len(all_entries)}")
-        return all_entries
+        response.raise_for_status()
+        parse_start = time.perf_counter()
+        data = response.json()
+        with self._stats_lock:
+            self.transfer_stats['requests'] += 1
+            self.transfer_stats['bytes'] += len(response.content)
+            self.transfer_stats['parse_seconds'] += time.perf_counter() - parse_start
+        if cache and response.headers.get('ETag'):
+            cache.store_response(request_key, response.headers['ETag'], content_type, data, cache.field_set(params))
+        return data
 
-    def sync_entries_to_pinecone(self, content_type: str = 'product'):
-        """Fetch all entries and sync them to Pinecone"""
-        if not self.pinecone_manager:
-            print("Pinecone not available, cannot sync")
+    def _get(self, url: str, headers: Dict, params: Dict) -> requests.Response:
+        """GET through the shared throttle, retrying 429s, 5xx and connection errors"""
+        return self.throttler.request(
+            lambda: self.session.get(url, headers=headers, params=params),
+            retry_exceptions=(requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        )
+
+    def load_text_extractor(self, content_type: str):
+        """Compile the content type's text extractor from its schema, fetched once per process"""
+        registry = get_text_extractors()
+        if not content_type or not registry.should_fetch(content_type):
+            return registry.get(content_type)
+        url = f"{self.base_url}/content_types/{content_type}"
+        params = {'environment': self.environment, 'include_global_field_schema': 'true'}
+        headers = {
+            "api_key": self.stack_api_key,
+            "access_token": self.delivery_token,
+            "Content-Type": "application/json"
+        }
+        try:
+            response = self._get(url, headers, params)
+            response.raise_for_status()
+            return registry.register(response.json()['content_type'])
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"Warning: Could not load the {content_type} schema, using the default text fields: {e}")
+            registry.mark_unavailable(content_type)
+            return None
+
+    def iter_entry_pages(self, content_type: str, limit: int = 100, locale: str = None,
+                         submit: Callable = None, start: int = 0, strict: bool = False,
+                         fields: List[str] = None) -> Iterator[List[Dict]]:
+        """Yield pages of entries in order from offset start, fetching the remaining offsets concurrently.
+        
+        Page fetches go to submit (an executor's submit) when given, otherwise
+        to a private pool of CONTENTSTACK_FETCH_WORKERS threads. With strict, a
+        page that cannot be fetched raises instead of being skipped. fields
+        overrides the projection, as in fetch_entries.
+        """
+        label = f"{content_type}/{locale}" if locale else content_type
+        first_page = self.fetch_entries(content_type, limit=limit, skip=start, locale=locale, fields=fields)
+        if strict and not first_page:
+            raise RuntimeError(f"Page at skip={start} of {label} could not be fetched")
+        entries = first_page.get('entries', [])
+        total_count = first_page.get('count', 0)
+        yield entries
+        if len(entries) < limit or total_count <= start + limit:
             return
         
-        print(f"Starting sync of {content_type} entries to Pinecone...")
+        offsets = deque(range(start + limit, total_count, limit))
+        print(f"Fetching {len(offsets)} more pages of {label} ({total_count} entries)...")
+        executor = None
+        if submit is None:
+            executor = ThreadPoolExecutor(max_workers=config.CONTENTSTACK_FETCH_WORKERS,
+                                          thread_name_prefix="contentstack-page")
+            submit = executor.submit
+        # A sliding window of in-flight pages keeps the stream ordered and memory bounded
+        window = config.CONTENTSTACK_FETCH_WORKERS * 2
+        try:
+            in_flight = deque()
+            while offsets or in_flight:
+                while offsets and len(in_flight) < window:
+                    skip = offsets.popleft()
+                    in_flight.append((skip, submit(self.fetch_entries, content_type, limit, skip, None, locale, fields)))
+                skip, future = in_flight.popleft()
+                data = future.result()
+                if not data:
+                    if strict:
+                        raise RuntimeError(f"Page at skip={skip} of {label} could not be fetched")
+                    print(f"Warning: page at skip={skip} of {label} could not be fetched")
+                yield data.get('entries', [])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def fetch_entries_by_uid(self, content_type: str, uids: List[str], locale: str = None,
+                             fields: Optional[List[str]] = REFERENCE_TEXT_FIELDS) -> List[Dict]:
+        """Fetch the named entries with one uid[$in] query; raises on failure.
         
-        entries = self.fetch_all_entries(content_type)
+        Only the fields a reference needs are requested unless fields says
+        otherwise (None fetches whole entries).
+        """
+        url = f"{self.base_url}/content_types/{content_type}/entries"
+        params = {
+            'environment': self.environment,
+            'query': json.dumps({'uid': {'$in': sorted(uids)}}),
+            'limit': len(uids)
+        }
+        if fields:
+            params['only[BASE][]'] = fields
+        if locale:
+            params['locale'] = locale
+        headers = {
+            "api_key": self.stack_api_key,
+            "access_token": self.delivery_token,
+            "Content-Type": "application/json"
+        }
+        return self._get_json(url, headers, params, content_type).get('entries', [])
+
+    def resolve_references(self, entries: List[Dict], locale: str = None):
+        """Replace reference stubs in a batch of entries, fetching only uncached references"""
+        cache = get_reference_cache()
+        for (content_type, ref_locale), uids in cache.missing(entries, locale).items():
+            uids = sorted(uids)
+            for i in range(0, len(uids), 100):
+                chunk = uids[i:i + 100]
+                try:
+                    fetched = self.fetch_entries_by_uid(content_type, chunk, ref_locale)
+                except requests.exceptions.RequestException as e:
+                    print(f"Warning: Could not resolve {len(chunk)} {content_type} references: {e}")
+                    continue
+                cache.store(content_type, set(chunk), fetched, ref_locale)
+        cache.attach(entries, locale)
+
+    def fetch_all_entries(self, content_type: str) -> List[Dict]:
+        """Fetch all entries for a content type with pagination; raises if any page fails"""
+        all_entries = []
+        start = time.time()
+        for entries in self.iter_entry_pages(content_type, strict=True):
+            all_entries.extend(entries)
         
-        if not entries:
-            print("No entries found to sync")
-            return
+        print(f"Total entries fetched: {len(all_entries)} in {time.time() - start:.1f}s")
+        return all_entries
+
+    @staticmethod
+    def entry_vector_id(entry: Dict, locale: str = None) -> str:
+        return vector_id(entry['uid'], entry.get('locale') or locale)
+
+    @staticmethod
+    def entry_metadata(entry: Dict, content_type: str) -> Dict:
+        """Pinecone metadata for an entry (projected onto metadata_schema.py when written)"""
+        return {
+            'entry_uid': entry['uid'],
+            'product_id': vector_id(entry['uid'], entry.get('locale')),
+            'content_type': content_type,
+            'title': entry.get('title', ''),
+            'locale': entry.get('locale', config.CONTENTSTACK_DEFAULT_LOCALE),
+            'url': entry.get('url', '')
+        }
+
+    def build_entry_vectors(self, entries: List[Dict], content_type: str) -> Tuple[Dict, Dict]:
+        """Embed entries and build their Pinecone metadata, keyed by vector id (uid, plus locale outside the default)"""
+        # Collect catalog terms for the offline synonym table (synonym_graph.py)
+        try:
+            update_mined_terms(
+                f"{entry.get('title', '')} {entry.get('description', '')}" for entry in entries
+            )
+        except Exception as e:
+            print(f"Warning: Could not update mined terms: {e}")
         
         # Generate embeddings and prepare for Pinecone
         embeddings_dict = {}
         metadata_dict = {}
+        self.resolve_references(entries)
+        self.load_text_extractor(content_type)
         
         for entry in entries:
             entry_uid = entry.get('uid')
@@ -99,34 +276,190 @@ class ContentstackFetcher:
                 continue
                 
             # Generate embedding
-            embedding = generate_product_embedding(entry)
+            embedding = generate_product_embedding(entry, content_type=content_type)
             if embedding:
-                embeddings_dict[entry_uid] = embedding
-                
-                # Prepare metadata
-                metadata_dict[entry_uid] = {
-                    'entry_uid': entry_uid,
-                    'content_type': content_type,
-                    'title': entry.get('title', ''),
-                    'locale': entry.get('locale', 'en-us'),
-                    'url': entry.get('url', ''),
-                    'publish_details': entry.get('publish_details', {})
-                }
+                entry_vector_id = self.entry_vector_id(entry)
+                embeddings_dict[entry_vector_id] = embedding
+                metadata_dict[entry_vector_id] = self.entry_metadata(entry, content_type)
             else:
                 print(f"Warning: Could not generate embedding for entry {entry_uid}")
         
-        if embeddings_dict:
-            print(f"Syncing {len(embeddings_dict)} embeddings to Pinecone...")
-            self.pinecone_manager.upsert_embeddings(embeddings_dict, metadata_dict)
-            print("Sync completed successfully!")
+        return embeddings_dict, metadata_dict
+
+    def fetch_sync_items(self, content_type: str, sync_token: str = None) -> Tuple[List[Dict], str]:
+        """Fetch Sync API items since sync_token (or an initial sync), following pagination.
+        
+        Returns the items and the new sync token. Raises on any failed page so a
+        partial sync never advances the stored token.
+        """
+        url = f"{self.base_url}/stacks/sync"
+        headers = {
+            "api_key": self.stack_api_key,
+            "access_token": self.delivery_token,
+            "Content-Type": "application/json"
+        }
+        if sync_token:
+            params = {'sync_token': sync_token}
+        else:
+            params = {'init': 'true', 'environment': self.environment, 'content_type_uid': content_type}
+        
+        items = []
+        while True:
+            response = self._get(url, headers, params)
+            response.raise_for_status()
+            data = response.json()
+            items.extend(data.get('items', []))
+            
+            if data.get('pagination_token'):
+                params = {'pagination_token': data['pagination_token']}
+            elif data.get('sync_token'):
+                return items, data['sync_token']
+            else:
+                raise ValueError("Sync API response had neither pagination_token nor sync_token")
+
+    def delta_sync_to_pinecone(self, content_type: str = 'product', reset: bool = False) -> Dict:
+        """Apply only the entries published, unpublished or deleted since the last sync"""
+        if not self.pinecone_manager:
+            raise ValueError("Pinecone not available, cannot sync")
+        
+        state = get_sync_state()
+        if reset:
+            state.clear(content_type)
+        sync_token = state.get_sync_token(content_type)
+        mode = 'delta' if sync_token else 'initial'
+        print(f"Starting {mode} sync of {content_type} entries to Pinecone...")
+        
+        start = time.time()
+        items, new_sync_token = self.fetch_sync_items(content_type, sync_token)
+        
+        published, removed = collapse_sync_items(items, content_type)
+        upserted = {'upserted': 0}
+        if published:
+            embeddings_dict, metadata_dict = self.build_entry_vectors(list(published.values()), content_type)
+            if embeddings_dict:
+                upserted = self.pinecone_manager.upsert_embeddings(embeddings_dict, metadata_dict)
+                if upserted['failed']:
+                    # Keep the old token so the next delta sync retries these changes
+                    raise RuntimeError(f"{upserted['failed']} vectors failed to upsert: {upserted['errors']}")
+        if removed:
+            deleted = self.pinecone_manager.delete_products(sorted(removed))
+            if deleted < len(removed):
+                # Keep the old token so the next delta sync retries these removals
+                raise RuntimeError(f"Only {deleted}/{len(removed)} removed entries were deleted from Pinecone")
+        
+        state.set_sync_token(content_type, new_sync_token, mode=mode)
+        summary = {
+            'mode': mode,
+            'items': len(items),
+            'upserted': upserted['upserted'],
+            'deleted': len(removed),
+            'seconds': round(time.time() - start, 2)
+        }
+        print(f"Delta sync completed: {summary}")
+        return summary
+
+    def count_entries(self, content_type: str, locale: str = None) -> Optional[int]:
+        """Number of published entries, from a one-entry uid-only request"""
+        data = self.fetch_entries(content_type, limit=1, locale=locale, fields=['uid'])
+        return data.get('count') if data else None
+
+    def resume_point(self, content_type: str, locale: str = None) -> Tuple[int, str]:
+        """Offset and uid hash an interrupted full sync can resume from (0 if there is none to trust)"""
+        label = f"{content_type}/{locale}" if locale else content_type
+        checkpoint = get_sync_state().get_checkpoint(content_type, locale)
+        if not checkpoint or not checkpoint.get('offset'):
+            return 0, uid_set_hash([])
+        
+        # The entries before the offset must still be exactly the ones that were synced
+        offset = checkpoint['offset']
+        uid_hash = uid_set_hash([])
+        for skip in range(0, offset, 100):
+            data = self.fetch_entries(content_type, limit=min(100, offset - skip), skip=skip, locale=locale,
+                                      fields=['uid'])
+            if not data:
+                print(f"Warning: Could not verify the {label} checkpoint, starting over")
+                return 0, uid_set_hash([])
+            uid_hash = uid_set_hash((entry['uid'] for entry in data.get('entries', [])), uid_hash)
+        if uid_hash != checkpoint.get('uid_hash'):
+            print(f"Checkpoint for {label} no longer matches the stack, starting over")
+            return 0, uid_set_hash([])
+        
+        print(f"Resuming {label} sync at entry {offset}")
+        return offset, uid_hash
+
+    def entry_sync_pipeline(self, content_type: str, locale: str = None, resume: bool = True,
+                            submit: Callable = None, encode: Callable = None) -> Tuple[SyncPipeline, int]:
+        """Full sync pipeline for one content type/locale that checkpoints after every upsert batch.
+        
+        Returns the pipeline and the offset it resumes from. Clear the
+        checkpoint (SyncState.clear_checkpoint) once the pipeline completes.
+        """
+        self.load_text_extractor(content_type)
+        state = get_sync_state()
+        if resume:
+            start, uid_hash = self.resume_point(content_type, locale)
+        else:
+            state.clear_checkpoint(content_type, locale)
+            start, uid_hash = 0, uid_set_hash([])
+        progress = {'uid_hash': uid_hash}
+        
+        def checkpoint(through: int, uids: List[str]):
+            progress['uid_hash'] = uid_set_hash(uids, progress['uid_hash'])
+            state.set_checkpoint(content_type, locale, start + through, progress['uid_hash'])
+        
+        pipeline = SyncPipeline(
+            self.iter_entry_pages(content_type, locale=locale, submit=submit, start=start, strict=True),
+            build_metadata=lambda entry: self.entry_metadata(entry, content_type),
+            upsert=lambda vectors: self.pinecone_manager.upsert_vectors(vectors)['upserted'],
+            encode=encode,
+            vector_id=lambda entry: self.entry_vector_id(entry, locale),
+            prepare=lambda entries: self.resolve_references(entries, locale),
+            on_progress=checkpoint,
+            text=embedding_text_function(content_type),
+            upsert_workers=config.PINECONE_UPSERT_WORKERS
+        )
+        return pipeline, start
+
+    def sync_entries_to_pinecone(self, content_type: str = 'product', locale: str = None, resume: bool = True) -> Dict:
+        """Stream all entries through the fetch -> embed -> upsert pipeline into Pinecone.
+        
+        Progress is checkpointed after every upsert batch; with resume, an
+        interrupted sync continues from its checkpoint instead of entry 0.
+        """
+        if not self.pinecone_manager:
+            print("Pinecone not available, cannot sync")
+            return {}
+        
+        print(f"Starting sync of {content_type} entries to Pinecone...")
+        
+        pipeline, start = self.entry_sync_pipeline(content_type, locale, resume=resume)
+        summary = pipeline.run()
+        summary['resumed_from'] = start
+        get_sync_state().clear_checkpoint(content_type, locale)
+        
+        # Collect catalog terms for the offline synonym table (synonym_graph.py)
+        try:
+            update_mined_terms([], counts=pipeline.term_counts)
+        except Exception as e:
+            print(f"Warning: Could not update mined terms: {e}")
+        
+        if not summary['entries']:
+            print("No entries found to sync")
         else:
-            print("No embeddings generated, sync aborted")
+            print(f"Synced {summary['upserted']}/{summary['entries']} entries in {summary['seconds']}s")
+            for name, stats in summary['stages'].items():
+                print(f"   {name}: {stats['items_per_second']} items/s, "
+                      f"avg queue depth {stats['avg_queue_depth']} (max {stats['max_queue_depth']})")
+        return summary
 
     def get_entry_details(self, content_type: str, entry_uid: str) -> Dict:
         """Fetch a specific entry by UID"""
         url = f"{self.base_url}/content_types/{content_type}/entries/{entry_uid}"
         
         params = {'environment': self.environment}
+        if config.CONTENTSTACK_FIELD_PROJECTION:
+            self.load_text_extractor(content_type)
+            params['only[BASE][]'] = projected_fields(content_type)
         
         headers = {
             "api_key": self.stack_api_key,
@@ -135,9 +468,7 @@ class ContentstackFetcher:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._get_json(url, headers, params, content_type)
         except requests.exceptions.RequestException as e:
             print(f"Error fetching entry {entry_uid}: {e}")
             return {}
@@ -0,0 +1,289 @@
+"""
+Local stand-in for the Contentstack Delivery API
+
+Serves the endpoints the fetchers use (entry pages and single entries, with
+locale, uid[$in] queries, only[BASE][] projection and ETag / If-None-Match,
+content type schemas, and the Sync API) from an in-memory stack, so full and delta syncs can be
+exercised without a real stack or network access. --rate-limit answers 429
+past a per-second read budget and sends X-RateLimit-* headers like the real
+API:
+
+    python contentstack_stub_server.py --port 8765 --seed entries.json --schema content-types.json
+    CONTENTSTACK_API_BASE_URL=http://127.0.0.1:8765/v3 python webhook_full.py
+
+entries.json is {"<content_type>": [{"uid": ..., "title": ...}, ...]}. The
+stack is changed through the stub's own endpoints:
+
+    POST   /stub/content_types/<ct>/entries               publish (create or update) an entry
+    POST   /stub/content_types/<ct>/entries/<uid>/unpublish
+    DELETE /stub/content_types/<ct>/entries/<uid>
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+class StubStack:
+    """Published entries plus an append-only event log that backs the Sync API"""
+
+    def __init__(self, page_size: int = 100, rate_limit: int = 0):
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.throttled_count = 0
+        self._window = (0, 0)  # (second, requests in that second)
+        self.entries: Dict[str, Dict[str, Dict]] = {}
+        self.content_types: Dict[str, Dict] = {}
+        self.events: List[Dict] = []
+        self.request_count = 0
+        self.not_modified_count = 0
+        self._cursors: Dict[str, Tuple[str, List[Dict], int]] = {}
+        self._lock = threading.Lock()
+
+    def take_request(self) -> Optional[int]:
+        """Count a read against the per-second limit; returns the requests left, or None if over it"""
+        with self._lock:
+            self.request_count += 1
+            if not self.rate_limit:
+                return 0
+            second = int(time.time())
+            count = self._window[1] + 1 if self._window[0] == second else 1
+            self._window = (second, count)
+            if count > self.rate_limit:
+                self.throttled_count += 1
+                return None
+            return self.rate_limit - count
+
+    def _event(self, event_type: str, content_type: str, data: Dict):
+        self.events.append({
+            'type': event_type,
+            'event_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'content_type_uid': content_type,
+            'data': data
+        })
+
+    @staticmethod
+    def _key(uid: str, locale: str = None) -> str:
+        return f"{uid}:{locale}" if locale else uid
+
+    def publish(self, content_type: str, entry: Dict):
+        with self._lock:
+            self.entries.setdefault(content_type, {})[self._key(entry['uid'], entry.get('locale'))] = entry
+            self._event('entry_published', content_type, entry)
+
+    def unpublish(self, content_type: str, uid: str, deleted: bool = False, locale: str = None) -> bool:
+        with self._lock:
+            if self.entries.get(content_type, {}).pop(self._key(uid, locale), None) is None:
+                return False
+            data = {'uid': uid, 'locale': locale} if locale else {'uid': uid}
+            self._event('entry_deleted' if deleted else 'entry_unpublished', content_type, data)
+            return True
+
+    def list_entries(self, content_type: str, skip: int, limit: int, locale: str = None,
+                     uids: List[str] = None) -> Dict:
+        """One page of entries (only the given uids, if any); a locale request tags every entry with it"""
+        with self._lock:
+            entries = list(self.entries.get(content_type, {}).values())
+        if uids is not None:
+            entries = [entry for entry in entries if entry['uid'] in set(uids)]
+        if locale:
+            entries = [dict(entry, locale=locale) for entry in entries]
+        return {'entries': entries[skip:skip + limit], 'count': len(entries)}
+
+    def get_entry(self, content_type: str, uid: str) -> Dict:
+        with self._lock:
+            return self.entries.get(content_type, {}).get(uid)
+
+    def sync_page(self, params: Dict[str, str]) -> Tuple[int, Dict]:
+        """One Sync API page: an initial sync, a delta since a sync token, or the next page of either"""
+        with self._lock:
+            if 'pagination_token' in params:
+                cursor = self._cursors.pop(params['pagination_token'], None)
+                if cursor is None:
+                    return 422, {'error_message': 'Invalid pagination token', 'error_code': 141}
+                content_type, items, position = cursor
+            elif params.get('init') == 'true':
+                content_type = params.get('content_type_uid', '')
+                items = [
+                    {'type': 'entry_published', 'content_type_uid': ct, 'data': entry}
+                    for ct, entries in self.entries.items()
+                    if not content_type or ct == content_type
+                    for entry in entries.values()
+                ]
+                position = len(self.events)
+            else:
+                try:
+                    content_type, start = params.get('sync_token', '').rsplit(':', 1)
+                    start = int(start)
+                except ValueError:
+                    return 422, {'error_message': 'Invalid sync token', 'error_code': 141}
+                items = [
+                    event for event in self.events[start:]
+                    if not content_type or event['content_type_uid'] == content_type
+                ]
+                position = len(self.events)
+
+            body = {'items': items[:self.page_size], 'limit': self.page_size}
+            if len(items) > self.page_size:
+                token = uuid.uuid4().hex
+                self._cursors[token] = (content_type, items[self.page_size:], position)
+                body['pagination_token'] = token
+            else:
+                body['sync_token'] = f"{content_type}:{position}"
+            return 200, body
+
+
+def project(entry: Dict, only: set) -> Dict:
+    """Apply only[BASE][] field projection; uid is always returned"""
+    if not only:
+        return entry
+    return {key: value for key, value in entry.items() if key in only or key == 'uid'}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    stack: StubStack = None
+    remaining: int = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _rate_limit_headers(self):
+        if self.stack.rate_limit:
+            self.send_header('X-RateLimit-Limit', str(self.stack.rate_limit))
+            self.send_header('X-RateLimit-Remaining', str(self.remaining))
+
+    def _send(self, status: int, body: Dict, headers: Dict = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self._rate_limit_headers()
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_cacheable(self, body: Dict):
+        """200 with an ETag, or 304 when the client's If-None-Match still matches"""
+        payload = json.dumps(body).encode('utf-8')
+        etag = f'"{hashlib.md5(payload).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.stack.not_modified_count += 1
+            self.send_response(304)
+            self._rate_limit_headers()
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self._rate_limit_headers()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        params = {key: values[-1] for key, values in query.items()}
+        only = set(query.get('only[BASE][]', []))
+        parts = url.path.strip('/').split('/')
+        remaining = self.stack.take_request()
+        if remaining is None:
+            self.remaining = 0
+            self._send(429, {'error_message': 'Too many requests', 'error_code': 429}, {'Retry-After': '1'})
+            return
+        self.remaining = remaining
+
+        if parts[:3] == ['v3', 'stacks', 'sync']:
+            self._send(*self.stack.sync_page(params))
+        elif len(parts) == 3 and parts[:2] == ['v3', 'content_types']:
+            if parts[2] in self.stack.content_types:
+                self._send(200, {'content_type': self.stack.content_types[parts[2]]})
+            else:
+                self._send(422, {'error_message': "The Content Type was not found", 'error_code': 118})
+        elif len(parts) == 4 and parts[:2] == ['v3', 'content_types'] and parts[3] == 'entries':
+            skip, limit = int(params.get('skip', 0)), int(params.get('limit', 100))
+            uids = json.loads(params['query']).get('uid', {}).get('$in') if 'query' in params else None
+            page = self.stack.list_entries(parts[2], skip, limit, params.get('locale'), uids)
+            page['entries'] = [project(entry, only) for entry in page['entries']]
+            self._send_cacheable(page)
+        elif len(parts) == 5 and parts[:2] == ['v3', 'content_types'] and parts[3] == 'entries':
+            entry = self.stack.get_entry(parts[2], parts[4])
+            if entry is None:
+                self._send(404, {'error_message': 'Entry not found', 'error_code': 141})
+            else:
+                self._send_cacheable({'entry': project(entry, only)})
+        else:
+            self._send(404, {'error_message': 'Not found'})
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) == 4 and parts[:2] == ['stub', 'content_types'] and parts[3] == 'entries':
+            entry = self._read_json()
+            if not entry.get('uid'):
+                self._send(400, {'error_message': 'uid is required'})
+                return
+            self.stack.publish(parts[2], entry)
+            self._send(201, {'entry': entry})
+        elif len(parts) == 6 and parts[:2] == ['stub', 'content_types'] and parts[5] == 'unpublish':
+            found = self.stack.unpublish(parts[2], parts[4])
+            self._send(200 if found else 404, {'unpublished': found})
+        else:
+            self._send(404, {'error_message': 'Not found'})
+
+    def do_DELETE(self):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) == 5 and parts[:2] == ['stub', 'content_types'] and parts[3] == 'entries':
+            found = self.stack.unpublish(parts[2], parts[4], deleted=True)
+            self._send(200 if found else 404, {'deleted': found})
+        else:
+            self._send(404, {'error_message': 'Not found'})
+
+
+def start_stub_server(stack: StubStack, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Serve the stack on a background thread; port 0 picks a free port"""
+    handler = type('BoundStubHandler', (StubHandler,), {'stack': stack})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Contentstack Delivery API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', help="JSON file of {content_type: [entries]} to publish at startup")
+    parser.add_argument('--schema', help="JSON list of content type definitions to serve at /content_types/<ct>")
+    parser.add_argument('--page-size', type=int, default=100, help="Items per Sync API page")
+    parser.add_argument('--rate-limit', type=int, default=0, help="Reads per second before answering 429 (0 = unlimited)")
+    args = parser.parse_args()
+
+    stack = StubStack(page_size=args.page_size, rate_limit=args.rate_limit)
+    if args.seed:
+        with open(args.seed, 'r') as f:
+            for content_type, entries in json.load(f).items():
+                for entry in entries:
+                    stack.publish(content_type, entry)
+    if args.schema:
+        with open(args.schema, 'r') as f:
+            stack.content_types = {content_type['uid']: content_type for content_type in json.load(f)}
+
+    server = ThreadingHTTPServer((args.host, args.port), type('BoundStubHandler', (StubHandler,), {'stack': stack}))
+    print(f"🧪 Contentstack stub serving on http://{args.host}:{args.port}/v3")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Per-request time budget for /search
+
+A Deadline is created when a search request arrives and handed to every stage
+(query rewrite, embedding, vector query). Stages check the remaining budget,
+bound their own timeouts by it, and record themselves as skipped when there
+is not enough time left, so the response can report what was dropped.
+"""
+import time
+from typing import Dict, List, Optional
+
+from config import config
+
+
+class DeadlineExceeded(Exception):
+    """Raised by a stage that cannot run within the remaining budget"""
+
+
+class Deadline:
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_ms / 1000.0
+        self.skipped: List[Dict[str, str]] = []
+
+    @classmethod
+    def from_header(cls, header_value: Optional[str]) -> 'Deadline':
+        """Build a deadline from the request header, falling back to the configured default"""
+        budget_ms = config.SEARCH_DEADLINE_MS
+        if header_value:
+            try:
+                budget_ms = float(header_value)
+            except ValueError:
+                pass
+        budget_ms = max(0.0, min(budget_ms, config.SEARCH_MAX_DEADLINE_MS))
+        return cls(budget_ms)
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_ms(self) -> float:
+        return self.remaining() * 1000.0
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started_at) * 1000.0
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, needed_ms: float) -> bool:
+        """True if at least needed_ms of budget is left"""
+        return self.remaining_ms() >= needed_ms
+
+    def timeout(self, cap: float = None, reserve_ms: float = 0) -> float:
+        """Timeout in seconds for a stage, keeping reserve_ms for the stages after it"""
+        seconds = max(0.0, self.remaining() - reserve_ms / 1000.0)
+        return min(seconds, cap) if cap is not None else seconds
+
+    def skip(self, stage: str, reason: str):
+        """Record that a stage was skipped or degraded"""
+        if not any(s['stage'] == stage for s in self.skipped):
+            print(f"⏱️ Skipping {stage}: {reason} ({self.remaining_ms():.0f}ms left)")
+            self.skipped.append({'stage': stage, 'reason': reason})
+
+    def report(self) -> Dict:
+        """Timing summary included in search responses"""
+        return {
+            'budget_ms': round(self.budget_ms),
+            'elapsed_ms': round(self.elapsed_ms()),
+            'skipped_stages': list(self.skipped)
+        }
@@ -0,0 +1,279 @@
+"""
+Standalone embedding sidecar served over a Unix domain socket
+
+One long-lived process loads the MiniLM model once and encodes texts for every
+web worker on the host, batching concurrent requests together:
+
+    python embedding_sidecar.py --socket /tmp/embedding-sidecar.sock
+
+Wire format (network byte order headers, little-endian float32 payload):
+    request:  b'EMB1' | uint32 count | count x (uint32 length | utf-8 bytes)
+    response: b'EMB1' | uint8 status | uint32 rows | uint32 dim | rows*dim float32
+              (status 1 = error, followed by uint32 length | utf-8 message)
+"""
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+MAGIC = b'EMB1'
+REQUEST_HEADER = struct.Struct('!4sI')
+RESPONSE_HEADER = struct.Struct('!4sBII')
+LENGTH = struct.Struct('!I')
+STATUS_OK = 0
+STATUS_ERROR = 1
+MAX_TEXTS_PER_REQUEST = 4096
+MAX_TEXT_BYTES = 1 << 20
+
+
+class SidecarError(Exception):
+    """Raised when the sidecar cannot be reached or reports an error"""
+
+
+class SidecarTimeout(SidecarError):
+    """Raised when the sidecar does not answer within the timeout"""
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Read exactly size bytes or raise ConnectionError on EOF"""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Connection closed by peer")
+        received += n
+    return bytes(buf)
+
+
+def encode_request(texts: List[str]) -> bytes:
+    parts = [REQUEST_HEADER.pack(MAGIC, len(texts))]
+    for text in texts:
+        data = text.encode('utf-8')
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def read_request(sock: socket.socket) -> List[str]:
+    magic, count = REQUEST_HEADER.unpack(_recv_exact(sock, REQUEST_HEADER.size))
+    if magic != MAGIC or count > MAX_TEXTS_PER_REQUEST:
+        raise ValueError("Malformed embedding request")
+
+    texts = []
+    for _ in range(count):
+        (length,) = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+        if length > MAX_TEXT_BYTES:
+            raise ValueError("Text too large")
+        texts.append(_recv_exact(sock, length).decode('utf-8'))
+    return texts
+
+
+def encode_response(embeddings: np.ndarray) -> bytes:
+    rows, dim = embeddings.shape
+    return RESPONSE_HEADER.pack(MAGIC, STATUS_OK, rows, dim) + embeddings.astype('<f4', copy=False).tobytes()
+
+
+def encode_error(message: str) -> bytes:
+    data = message.encode('utf-8')
+    return RESPONSE_HEADER.pack(MAGIC, STATUS_ERROR, 0, 0) + LENGTH.pack(len(data)) + data
+
+
+def read_response(sock: socket.socket) -> np.ndarray:
+    magic, status, rows, dim = RESPONSE_HEADER.unpack(_recv_exact(sock, RESPONSE_HEADER.size))
+    if magic != MAGIC:
+        raise SidecarError("Malformed embedding response")
+    if status != STATUS_OK:
+        (length,) = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+        raise SidecarError(_recv_exact(sock, length).decode('utf-8', errors='replace'))
+    payload = _recv_exact(sock, rows * dim * 4)
+    return np.frombuffer(payload, dtype='<f4').reshape(rows, dim)
+
+
+class _PendingRequest:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """Collects requests from all connections and encodes them in shared batches"""
+
+    def __init__(self, model, max_batch: int = 256, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.texts_encoded = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        pending = _PendingRequest(texts)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                size += len(pending.texts)
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: List[_PendingRequest]):
+        texts = [text for pending in batch for text in pending.texts]
+        try:
+            embeddings = np.asarray(self.model.encode(texts, batch_size=min(len(texts), 64)), dtype=np.float32)
+            self.batches += 1
+            self.texts_encoded += len(texts)
+            offset = 0
+            for pending in batch:
+                pending.result = embeddings[offset:offset + len(pending.texts)]
+                offset += len(pending.texts)
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        for pending in batch:
+            pending.done.set()
+
+
+class _SidecarHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Connections are long-lived: serve frames until the client hangs up
+        while True:
+            try:
+                texts = read_request(self.request)
+            except (ConnectionError, OSError):
+                return
+            except (ValueError, struct.error, UnicodeDecodeError) as e:
+                self.request.sendall(encode_error(str(e)))
+                return
+
+            try:
+                if texts:
+                    embeddings = self.server.batcher.encode(texts)
+                else:
+                    embeddings = np.zeros((0, 0), dtype=np.float32)
+                response = encode_response(embeddings)
+            except Exception as e:
+                response = encode_error(f"Encoding failed: {e}")
+            try:
+                self.request.sendall(response)
+            except OSError:
+                # The client stopped waiting (its deadline ran out) and closed the connection
+                return
+
+
+class EmbeddingSidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, batcher: EmbeddingBatcher):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batcher = batcher
+        super().__init__(socket_path, _SidecarHandler)
+        os.chmod(socket_path, 0o660)
+
+
+class SidecarClient:
+    """Client with one reusable connection per thread"""
+
+    def __init__(self, socket_path: str, timeout: float = 10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self, timeout: float) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def encode(self, texts: List[str], timeout: float = None) -> np.ndarray:
+        """Encode texts through the sidecar, reconnecting once on a stale connection"""
+        timeout = self.timeout if timeout is None else timeout
+        if timeout <= 0:
+            # settimeout(0) would make the socket non-blocking rather than fail fast
+            raise SidecarTimeout("No time left to wait for the embedding sidecar")
+        request = encode_request(texts)
+        for attempt in range(2):
+            sock = getattr(self._local, 'sock', None)
+            reused = sock is not None
+            try:
+                if sock is None:
+                    sock = self._connect(timeout)
+                sock.settimeout(timeout)
+                sock.sendall(request)
+                return read_response(sock)
+            except socket.timeout:
+                # The sidecar may still be encoding the batch; resending it would only queue it twice
+                self._close()
+                raise SidecarTimeout(f"Embedding sidecar did not answer within {timeout:.3f}s")
+            except (OSError, ConnectionError) as e:
+                self._close()
+                if not reused or attempt == 1:
+                    raise SidecarError(f"Embedding sidecar unavailable: {e}")
+            except SidecarError:
+                self._close()
+                raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve MiniLM embeddings over a Unix socket")
+    parser.add_argument('--socket', default=os.getenv('EMBEDDING_SIDECAR_SOCKET') or '/tmp/embedding-sidecar.sock')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    from embeddings_generator import get_embedding_model
+    model = get_embedding_model()
+    model.encode(["warmup"])
+
+    batcher = EmbeddingBatcher(model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    server = EmbeddingSidecarServer(args.socket, batcher)
+    print(f"🧠 Embedding sidecar listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Sidecar shutdown requested")
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
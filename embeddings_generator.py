@@ -1,52 +1,138 @@
 from sentence_transformers import SentenceTransformer
+from embedding_sidecar import SidecarClient, SidecarError, SidecarTimeout
+from config import config
+from deadline import Deadline, DeadlineExceeded
+from text_extractor import get_text_extractors
+from typing import Callable, List
 import os
+import threading
+import time
+
+# Common fields that might contain searchable text, for content types without a compiled schema (text_extractor.py)
+EMBEDDING_TEXT_FIELDS = ['title', 'description', 'name', 'content', 'body', 'summary']
 
 # Global model instance
 _model = None
+_model_lock = threading.Lock()
+
+# Sidecar client (only used when EMBEDDING_SIDECAR_SOCKET is configured)
+_sidecar_client = None
+_sidecar_retry_at = 0.0
 
 def get_embedding_model():
     """Get or create the sentence transformer model"""
     global _model
     if _model is None:
-        print("Loading sentence transformer model...")
-        _model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-        print("Model loaded successfully")
+        with _model_lock:
+            if _model is None:
+                print("Loading sentence transformer model...")
+                _model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+                print("Model loaded successfully")
     return _model
 
-def generate_embedding(text: str):
+def warm_up_model_in_background():
+    """Start loading the model without blocking the caller"""
+    if _model is None:
+        threading.Thread(target=get_embedding_model, name="model-warmup", daemon=True).start()
+
+def get_sidecar_client():
+    """Get the sidecar client, or None while it is disabled or backing off"""
+    global _sidecar_client
+    if not config.EMBEDDING_SIDECAR_SOCKET or time.monotonic() < _sidecar_retry_at:
+        return None
+    if _sidecar_client is None:
+        _sidecar_client = SidecarClient(config.EMBEDDING_SIDECAR_SOCKET, timeout=config.EMBEDDING_SIDECAR_TIMEOUT)
+    return _sidecar_client
+
+def encode_texts(texts: List[str], deadline: Deadline = None) -> List[List[float]]:
+    """Encode a batch of texts, preferring the shared sidecar over the in-process model"""
+    global _sidecar_retry_at
+    if not texts:
+        return []
+    if deadline is not None and deadline.expired():
+        deadline.skip('embed', 'deadline exceeded')
+        raise DeadlineExceeded("No budget left for embedding")
+
+    client = get_sidecar_client()
+    if client is not None:
+        timeout = None
+        if deadline is not None:
+            timeout = deadline.timeout(cap=config.EMBEDDING_SIDECAR_TIMEOUT)
+        try:
+            return client.encode(texts, timeout=timeout).tolist()
+        except SidecarTimeout as e:
+            if timeout is not None and timeout < config.EMBEDDING_SIDECAR_TIMEOUT:
+                # The request's own budget ran out, which says nothing about the sidecar's health
+                deadline.skip('embed', 'deadline exceeded')
+                raise DeadlineExceeded(f"Embedding did not finish within the deadline: {e}")
+            print(f"Embedding sidecar timed out, encoding in-process: {e}")
+            _sidecar_retry_at = time.monotonic() + config.EMBEDDING_SIDECAR_RETRY_AFTER
+        except SidecarError as e:
+            print(f"Embedding sidecar failed, encoding in-process: {e}")
+            _sidecar_retry_at = time.monotonic() + config.EMBEDDING_SIDECAR_RETRY_AFTER
+
+    # A cold model load can take many seconds; don't spend a request's budget on it
+    if _model is None and deadline is not None and not deadline.allows(config.MODEL_LOAD_BUDGET_MS):
+        warm_up_model_in_background()
+        deadline.skip('embed', 'embedding model still loading')
+        raise DeadlineExceeded("Embedding model not loaded yet")
+
+    model = get_embedding_model()
+    return model.encode(texts).tolist()
+
+def generate_embedding(text: str, deadline: Deadline = None):
     """Generate embedding for a given text"""
     if not text or not text.strip():
         return None
 
     try:
-        model = get_embedding_model()
-        embedding = model.encode(text.strip())
-        return embedding.tolist()  # Convert to list for JSON serialization
+        return encode_texts([text.strip()], deadline=deadline)[0]  # Lists for JSON serialization
     except Exception as e:
         print(f"Error generating embedding: {e}")
         return None
 
-def generate_product_embedding(product_data: dict) -> list:
-    """Generate embedding from product data"""
+def query_embedding_text(query: str) -> str:
+    """The text a search query is embedded as, matching generate_product_embedding's title + description"""
+    return ' '.join([query, query]).strip()
+
+def embedding_text_function(content_type: str = None) -> Callable[[dict], str]:
+    """The text function for a content type's entries: its compiled extractor, or the field-list fallback"""
+    return get_text_extractors().get(content_type) or legacy_embedding_text
+
+def product_embedding_text(product_data: dict, content_type: str = None) -> str:
+    """Searchable text of a Contentstack entry, as embedded for the index"""
+    return embedding_text_function(content_type)(product_data)
+
+def legacy_embedding_text(product_data: dict) -> str:
+    """Searchable text from the common field names, for entries without a compiled schema"""
     # Extract relevant text fields from Contentstack entry
     text_parts = []
 
-    # Common fields that might contain searchable text
-    fields_to_check = ['title', 'description', 'name', 'content', 'body', 'summary']
-
-    for field in fields_to_check:
+    for field in EMBEDDING_TEXT_FIELDS:
         if field in product_data and product_data[field]:
             if isinstance(product_data[field], str):
                 text_parts.append(product_data[field])
             elif isinstance(product_data[field], dict) and 'value' in product_data[field]:
                 text_parts.append(str(product_data[field]['value']))
 
+    # Titles of resolved references such as the brand or category (reference_cache.py)
+    for value in product_data.values():
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, dict) and item.get('_content_type_uid'):
+                title = item.get('title') or item.get('name')
+                if isinstance(title, str) and title:
+                    text_parts.append(title)
+
     # Combine all text
-    combined_text = ' '.join(text_parts)
+    return ' '.join(text_parts).strip()
+
+def generate_product_embedding(product_data: dict, deadline: Deadline = None, content_type: str = None) -> list:
+    """Generate embedding from product data"""
+    combined_text = product_embedding_text(product_data, content_type)
 
-    if not combined_text.strip():
+    if not combined_text:
         print("No searchable text found in product data")
         return None
 
     print(f"Generating embedding for text: {combined_text[:100]}...")
-    return generate_embedding(combined_text)
+    return generate_embedding(combined_text, deadline=deadline)
@@ -0,0 +1,230 @@
+"""
+Local cache of Contentstack entries for conditional reads
+
+Entries are stored by content type, uid, locale and field set together
+with their _version. The field set is the request's only[BASE][] list ('' for
+a full entry), so a uid-only listing never overwrites the body a projected
+page or full read cached for the same entry. Every GET the fetcher makes (an
+entry page or a single entry) is remembered by URL with the response ETag,
+its field set and the (uid, locale) list it returned, so the next read can
+send If-None-Match and rebuild the body from the cache on a 304. Webhooks
+write published entries straight into the cache (projected onto every field
+set already cached for them) and drop unpublished ones, so a 304 still serves
+the latest webhook data.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from config import config
+
+
+class EntryCache:
+    def __init__(self, path: str):
+        self.path = path
+        self.not_modified = 0
+        self.modified = 0
+        self._local = threading.local()
+        conn = self._connect()
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(entries)')]
+        if columns and 'fields' not in columns:
+            # Caches written before bodies were keyed by field set are rebuilt from scratch
+            conn.execute('DROP TABLE entries')
+            conn.execute('DROP TABLE IF EXISTS responses')
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                content_type TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                locale TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (content_type, uid, locale, fields)
+            )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                request_key TEXT PRIMARY KEY,
+                etag TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                entry_keys TEXT NOT NULL,
+                extra TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )"""
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def request_key(url: str, params: Dict) -> str:
+        return f"{url}?{urlencode(sorted((params or {}).items()), doseq=True)}"
+
+    @staticmethod
+    def field_set(params: Dict) -> str:
+        """The cache key for a request's projection: its sorted only[BASE][] fields, '' for full entries"""
+        fields = (params or {}).get('only[BASE][]') or []
+        if isinstance(fields, str):
+            fields = [fields]
+        return ','.join(sorted(set(fields)))
+
+    @staticmethod
+    def _entry_locale(entry: Dict) -> str:
+        return entry.get('locale') or ''
+
+    @staticmethod
+    def _project(entry: Dict, fields: List[str]) -> Dict:
+        keep = set(fields) | {'uid', 'locale', '_version'}
+        return {key: value for key, value in entry.items() if key in keep}
+
+    def _put_entry(self, conn: sqlite3.Connection, content_type: str, entry: Dict, fields: str = ''):
+        conn.execute(
+            """INSERT INTO entries (content_type, uid, locale, fields, version, body, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(content_type, uid, locale, fields) DO UPDATE SET
+                   version = excluded.version, body = excluded.body, updated_at = excluded.updated_at
+               WHERE excluded.version >= entries.version""",
+            (content_type, entry['uid'], self._entry_locale(entry), fields, int(entry.get('_version') or 0),
+             json.dumps(entry), time.time())
+        )
+
+    def get_etag(self, request_key: str) -> Optional[str]:
+        try:
+            row = self._connect().execute(
+                'SELECT etag FROM responses WHERE request_key = ?', (request_key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Entry cache read failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def store_response(self, request_key: str, etag: str, content_type: str, data: Dict, fields: str = ''):
+        """Remember a 200 response: its entries (under its field set), ETag and non-entry fields such as count"""
+        entries = data.get('entries')
+        if entries is None:
+            entries = [data['entry']] if data.get('entry') else []
+        entries = [entry for entry in entries if entry.get('uid')]
+        extra = {key: value for key, value in data.items() if key not in ('entries', 'entry')}
+        extra['_shape'] = 'entries' if 'entries' in data else 'entry'
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            for entry in entries:
+                self._put_entry(conn, content_type, entry, fields)
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (request_key, etag, content_type, fields, entry_keys, extra, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (request_key, etag, content_type, fields,
+                 json.dumps([[entry['uid'], self._entry_locale(entry)] for entry in entries]),
+                 json.dumps(extra), time.time())
+            )
+            conn.execute('COMMIT')
+            self.modified += 1
+        except sqlite3.Error as e:
+            conn.execute('ROLLBACK')
+            print(f"Entry cache write failed: {e}")
+
+    def load_response(self, request_key: str) -> Optional[Dict]:
+        """Rebuild a cached response after a 304, or None if any of its entries is gone"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT content_type, fields, entry_keys, extra FROM responses WHERE request_key = ?', (request_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content_type, fields, entry_keys, extra = row
+            entries = []
+            for uid, locale in json.loads(entry_keys):
+                entry_row = conn.execute(
+                    'SELECT body FROM entries WHERE content_type = ? AND uid = ? AND locale = ? AND fields = ?',
+                    (content_type, uid, locale, fields)
+                ).fetchone()
+                if entry_row is None:
+                    conn.execute('DELETE FROM responses WHERE request_key = ?', (request_key,))
+                    return None
+                entries.append(json.loads(entry_row[0]))
+        except sqlite3.Error as e:
+            print(f"Entry cache read failed: {e}")
+            return None
+
+        self.not_modified += 1
+        data = json.loads(extra)
+        shape = data.pop('_shape')
+        if shape == 'entries':
+            data['entries'] = entries
+        elif entries:
+            data['entry'] = entries[0]
+        return data
+
+    def put_entry(self, content_type: str, entry: Dict):
+        """Write a published entry (e.g. from a webhook), and its projection onto each cached field set,
+        unless a newer version is cached"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            field_sets = [row[0] for row in conn.execute(
+                "SELECT fields FROM entries WHERE content_type = ? AND uid = ? AND locale = ? AND fields != ''",
+                (content_type, entry['uid'], self._entry_locale(entry))
+            )]
+            self._put_entry(conn, content_type, entry)
+            for fields in field_sets:
+                self._put_entry(conn, content_type, self._project(entry, fields.split(',')), fields)
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            conn.execute('ROLLBACK')
+            print(f"Entry cache write failed: {e}")
+
+    def delete_entry(self, content_type: str, uid: str, locale: str = None):
+        """Drop an unpublished or deleted entry; responses that listed it refetch in full"""
+        try:
+            if locale:
+                self._connect().execute(
+                    'DELETE FROM entries WHERE content_type = ? AND uid = ? AND locale = ?',
+                    (content_type, uid, locale)
+                )
+            else:
+                self._connect().execute(
+                    'DELETE FROM entries WHERE content_type = ? AND uid = ?', (content_type, uid)
+                )
+        except sqlite3.Error as e:
+            print(f"Entry cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        requests = self.not_modified + self.modified
+        return {
+            'not_modified': self.not_modified,
+            'modified': self.modified,
+            'not_modified_rate': round(self.not_modified / requests, 3) if requests else 0.0
+        }
+
+
+_entry_cache = None
+_entry_cache_lock = threading.Lock()
+
+
+def get_entry_cache() -> Optional[EntryCache]:
+    """Get or create the process-wide entry cache (None when disabled)"""
+    global _entry_cache
+    if not config.ENTRY_CACHE_PATH:
+        return None
+    if _entry_cache is None:
+        with _entry_cache_lock:
+            if _entry_cache is None:
+                try:
+                    _entry_cache = EntryCache(config.ENTRY_CACHE_PATH)
+                except sqlite3.Error as e:
+                    print(f"Entry cache unavailable: {e}")
+                    return None
+    return _entry_cache
@@ -0,0 +1,157 @@
+"""
+Embedding-similarity pruning of query expansions
+
+Rewrites such as "bluetooth headphones" and "wireless bluetooth headphones"
+differ as strings but land on the same products. The original query and its
+expansions are embedded in one batch; an expansion is dropped when its cosine
+similarity to the original or to an already kept expansion reaches the
+threshold. Kept expansions reuse their batch embedding for the vector query.
+
+PruningStats records how many expansions were pruned and how much each
+searched expansion's results overlap the original query's results. The
+offline check compares pruned and unpruned result sets directly:
+
+    python expansion_pruning.py --queries queries.txt --threshold 0.9
+"""
+import argparse
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import config
+from deadline import Deadline
+
+
+def select_distinct(query_vector: List[float], expansion_vectors: List[List[float]], threshold: float) -> List[int]:
+    """Indices of the expansions that are not near-duplicates of the query or of each other"""
+    if not expansion_vectors or threshold >= 1.0:
+        return list(range(len(expansion_vectors)))
+
+    matrix = np.asarray([query_vector] + list(expansion_vectors), dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    similarities = matrix @ matrix.T
+
+    kept_rows = [0]
+    for row in range(1, len(matrix)):
+        if similarities[row, kept_rows].max() < threshold:
+            kept_rows.append(row)
+    return [row - 1 for row in kept_rows[1:]]
+
+
+def prune_expansions(query: str, expansions: List[str], threshold: float = None,
+                     deadline: Deadline = None) -> Tuple[List[str], Dict[str, List[float]]]:
+    """Embed the query and its expansions in one batch and drop near-duplicates.
+
+    Returns the kept expansions and their embeddings. If embedding fails the
+    expansions are returned unpruned with no embeddings.
+    """
+    from embeddings_generator import encode_texts, query_embedding_text
+
+    threshold = config.EXPANSION_PRUNE_SIMILARITY if threshold is None else threshold
+    if not expansions:
+        return [], {}
+
+    try:
+        vectors = encode_texts([query_embedding_text(q) for q in [query] + expansions], deadline=deadline)
+    except Exception as e:
+        print(f"⚠️ Could not embed expansions for pruning: {e}")
+        return expansions, {}
+
+    kept = select_distinct(vectors[0], vectors[1:], threshold)
+    get_pruning_stats().add(considered=len(expansions), pruned=len(expansions) - len(kept))
+    return [expansions[i] for i in kept], {expansions[i]: vectors[i + 1] for i in kept}
+
+
+def result_overlap(base_ids: List[str], expansion_ids: List[str]) -> float:
+    """Fraction of an expansion's results the original query already returned"""
+    if not expansion_ids:
+        return 0.0
+    return len(set(base_ids) & set(expansion_ids)) / len(set(expansion_ids))
+
+
+class PruningStats:
+    """Counts pruned expansions and the result overlap of the ones searched"""
+
+    def __init__(self):
+        self.expanded_searches = 0
+        self.considered = 0
+        self.pruned = 0
+        self.searched = 0
+        self.overlap_total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, considered: int = 0, pruned: int = 0):
+        with self._lock:
+            self.expanded_searches += 1
+            self.considered += considered
+            self.pruned += pruned
+
+    def add_overlaps(self, overlaps: List[float]):
+        with self._lock:
+            self.searched += len(overlaps)
+            self.overlap_total += sum(overlaps)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'expanded_searches': self.expanded_searches,
+                'expansions_considered': self.considered,
+                'expansions_pruned': self.pruned,
+                'prune_rate': round(self.pruned / self.considered, 3) if self.considered else 0.0,
+                'expansions_searched': self.searched,
+                'mean_result_overlap': round(self.overlap_total / self.searched, 3) if self.searched else 0.0
+            }
+
+
+_pruning_stats = PruningStats()
+
+
+def get_pruning_stats() -> PruningStats:
+    return _pruning_stats
+
+
+def main():
+    from embeddings_generator import encode_texts, query_embedding_text
+    from pinecone_integration import PineconeManager
+    from query_rewriter import QueryRewriter
+
+    parser = argparse.ArgumentParser(description="Measure vector queries saved and recall kept by expansion pruning")
+    parser.add_argument('--queries', required=True, help="File with one search query per line")
+    parser.add_argument('--threshold', type=float, default=config.EXPANSION_PRUNE_SIMILARITY)
+    parser.add_argument('--num-expansions', type=int, default=5)
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.queries, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    rewriter = QueryRewriter()
+    pinecone_manager = PineconeManager()
+    full_searches = pruned_searches = 0
+    recalls = []
+    for query in queries:
+        expansions = [q for q in rewriter.expand_query(query, args.num_expansions) if q != query]
+        vectors = encode_texts([query_embedding_text(q) for q in [query] + expansions])
+        kept = set(select_distinct(vectors[0], vectors[1:], args.threshold))
+
+        full_ids, pruned_ids = set(), set()
+        for i, vector in enumerate(vectors):
+            matches = pinecone_manager.search_similar(vector, top_k=args.top_k).get('matches', [])
+            ids = {match['id'] for match in matches}
+            full_ids |= ids
+            if i == 0 or i - 1 in kept:
+                pruned_ids |= ids
+
+        full_searches += len(vectors)
+        pruned_searches += 1 + len(kept)
+        recall = len(pruned_ids & full_ids) / len(full_ids) if full_ids else 1.0
+        recalls.append(recall)
+        print(f"   '{query}': {1 + len(kept)}/{len(vectors)} vector queries, recall {recall:.3f}")
+
+    if recalls:
+        print(f"✅ {pruned_searches}/{full_searches} vector queries after pruning, "
+              f"mean recall {sum(recalls) / len(recalls):.3f}, min recall {min(recalls):.3f}")
+
+if __name__ == "__main__":
+    main()
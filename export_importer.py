@@ -0,0 +1,355 @@
+"""
+Offline index build from a Contentstack CLI export
+
+Streams entries out of an export directory (or a single entries JSON file)
+without loading whole files, and runs them through the same batched
+embed -> write pipeline as a live sync (sync_pipeline.py). The output is a
+local replica file in the layout LocalReplicaIndex reads, Pinecone, or both:
+
+    python export_importer.py ohohoh/export-dir --replica index.json
+    python export_importer.py ohohoh/entries.json --content-type product --pinecone
+
+Entry files are found at entries/<content_type>/<locale>/*.json (chunked
+exports) or entries/<content_type>/<locale>.json anywhere under the export
+directory. Each file is either a JSON array of entries or an object of
+{uid: entry}. Content type schemas in the export (content_types/schema.json
+and global_fields/globalfields.json) compile the text extractors the
+entries are embedded with (text_extractor.py).
+
+Vector ids are built from entry uids: an entry's own uid, or the key it is
+stored under in an {uid: entry} file. Entries with neither (an array of
+uid-less entries, such as a hand-made ohohoh/entries.json) get a fallback
+uid hashed from their file, position and title, so re-importing the same
+file gives the same ids; they are counted as missing_uid and reported with a
+warning, since editing or reordering the file changes those ids.
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import config
+from contentstack_fetcher import ContentstackFetcher
+from embeddings_generator import embedding_text_function
+from metadata_schema import project_metadata
+from sync_pipeline import SyncPipeline
+from synonym_graph import update_mined_terms
+from text_extractor import get_text_extractors
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _JSONStream:
+    """Buffered reader that decodes one JSON value at a time with raw_decode"""
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.bytes_read += len(chunk)
+        # Drop what has been consumed so the buffer only holds the value being decoded
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> Optional[str]:
+        """Next non-whitespace character, or None at end of file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.bytes_read - len(self.buffer) + self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number or literal ending at the buffer edge may continue in the next chunk
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_items(path: str, chunk_size: int = 1 << 16) -> Iterator[Tuple[Optional[str], Dict]]:
+    """Yield (key, value) for each element of a top-level JSON array (key None) or object"""
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _JSONStream(f, chunk_size)
+        opening = stream.peek()
+        if opening not in ('[', '{'):
+            raise ValueError(f"{path} is not a JSON array or object")
+        closing = ']' if opening == '[' else '}'
+        stream.expect(opening)
+        if stream.peek() == closing:
+            return
+        while True:
+            key = None
+            if opening == '{':
+                key = stream.value()
+                stream.expect(':')
+            yield key, stream.value()
+            if stream.peek() == closing:
+                return
+            stream.expect(',')
+
+
+def find_entry_files(path: str, content_type: str = None) -> List[Tuple[str, Optional[str], str]]:
+    """(content_type, locale, file) for every entry file in an export, or the single file given"""
+    if os.path.isfile(path):
+        return [(content_type or 'product', None, path)]
+
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        if os.path.basename(root) != 'entries':
+            continue
+        for ct in sorted(dirs):
+            if content_type and ct != content_type:
+                continue
+            ct_dir = os.path.join(root, ct)
+            for name in sorted(os.listdir(ct_dir)):
+                child = os.path.join(ct_dir, name)
+                if os.path.isdir(child):
+                    # Chunked export: entries/<ct>/<locale>/<chunk>.json plus an index.json
+                    files.extend(
+                        (ct, name, os.path.join(child, chunk))
+                        for chunk in sorted(os.listdir(child))
+                        if chunk.endswith('.json') and chunk != 'index.json'
+                    )
+                elif name.endswith('.json') and name != 'index.json':
+                    files.append((ct, name[:-len('.json')], child))
+    return files
+
+
+def fallback_uid(source: str, index: int, entry: Dict) -> str:
+    """Deterministic uid for an entry without one, from its file, position and title"""
+    digest = hashlib.blake2b(f"{source}\0{index}\0{entry.get('title') or ''}".encode('utf-8'), digest_size=8)
+    return f"export{digest.hexdigest()}"
+
+
+def iter_export_pages(path: str, locale: Optional[str], page_size: int,
+                      counts: Counter = None, source: str = None) -> Iterator[List[Dict]]:
+    """Entries from one export file in pages, with uid and locale filled in from the file layout.
+
+    Entries left without a uid get fallback_uid() (source names the file,
+    its base name by default), with a warning, and are counted under
+    counts['missing_uid'].
+    """
+    source = source or os.path.basename(path)
+    page = []
+    missing_uid = 0
+    for index, (key, entry) in enumerate(iter_json_items(path)):
+        if not isinstance(entry, dict):
+            continue
+        if key and not entry.get('uid'):
+            entry['uid'] = key
+        if not entry.get('uid'):
+            entry['uid'] = fallback_uid(source, index, entry)
+            missing_uid += 1
+        if locale and not entry.get('locale'):
+            entry['locale'] = locale
+        page.append(entry)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+    if missing_uid:
+        print(f"⚠️ {missing_uid} entries in {path} have no uid and were given ids from their position and title; "
+              f"export them from Contentstack (csdx cm:stacks:export) so each entry keeps its uid")
+    if counts is not None:
+        counts['missing_uid'] += missing_uid
+
+
+def load_export_schemas(path: str) -> int:
+    """Compile text extractors from the content type schemas in an export directory"""
+    if not os.path.isdir(path):
+        return 0
+    schema_file = global_fields_file = None
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        if os.path.basename(root) == 'content_types' and 'schema.json' in names:
+            schema_file = schema_file or os.path.join(root, 'schema.json')
+        elif os.path.basename(root) == 'global_fields' and 'globalfields.json' in names:
+            global_fields_file = global_fields_file or os.path.join(root, 'globalfields.json')
+    if not schema_file:
+        return 0
+    try:
+        return get_text_extractors().load_file(schema_file, global_fields_file)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not load content type schemas from {schema_file}: {e}")
+        return 0
+
+
+class ReplicaWriter:
+    """Streams vectors into a LocalReplicaIndex file without holding them in memory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        self._embeddings = tempfile.NamedTemporaryFile('w', dir=directory, suffix='.embeddings', delete=False)
+        self._metadata = tempfile.NamedTemporaryFile('w', dir=directory, suffix='.metadata', delete=False)
+        self.count = 0
+
+    def write(self, vectors: List[Dict]) -> int:
+        for vector in vectors:
+            separator = ',' if self.count else ''
+            self._embeddings.write(f"{separator}{json.dumps(vector['id'])}:{json.dumps(vector['values'])}")
+            self._metadata.write(f"{separator}{json.dumps(vector['id'])}:{json.dumps(project_metadata(vector['metadata']))}")
+            self.count += 1
+        return len(vectors)
+
+    def close(self):
+        """Join the two streams into {"embeddings": {...}, "metadata": {...}} and move it into place"""
+        self._embeddings.close()
+        self._metadata.close()
+        partial = f"{self.path}.partial"
+        with open(partial, 'w') as out:
+            for label, part in (('embeddings', self._embeddings.name), ('metadata', self._metadata.name)):
+                out.write('{' if label == 'embeddings' else ',')
+                out.write(f'"{label}":{{')
+                with open(part, 'r') as f:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                out.write('}')
+            out.write('}')
+        os.replace(partial, self.path)
+        self.discard()
+
+    def discard(self):
+        """Remove the temp files (after close, or when the import failed)"""
+        self._embeddings.close()
+        self._metadata.close()
+        for name in (self._embeddings.name, self._metadata.name, f"{self.path}.partial"):
+            try:
+                os.unlink(name)
+            except FileNotFoundError:
+                pass
+
+
+def import_export(path: str, content_type: str = None, replica_path: str = None,
+                  pinecone_manager=None) -> Dict:
+    """Embed every entry in an export and write it to the replica file and/or Pinecone"""
+    if not replica_path and not pinecone_manager:
+        raise ValueError("Nothing to write to: give a replica path and/or a Pinecone manager")
+
+    files = find_entry_files(path, content_type)
+    if not files:
+        print(f"⚠️ No entry files found under {path}: it has no entries/<content_type>/ directories "
+              f"(export the entries module too, or pass an entries JSON file)")
+    schemas = load_export_schemas(path)
+    if schemas:
+        print(f"Compiled text extractors for {schemas} content types")
+    writer = ReplicaWriter(replica_path) if replica_path else None
+    writer_lock = threading.Lock()
+
+    def write(vectors: List[Dict]) -> int:
+        written = 0
+        if writer:
+            # Upsert batches run concurrently; the replica file takes them one at a time
+            with writer_lock:
+                written = writer.write(vectors)
+        if pinecone_manager:
+            written = pinecone_manager.upsert_vectors(vectors, batch_size=config.SYNC_UPSERT_BATCH_SIZE)['upserted']
+        return written
+
+    start = time.time()
+    reports = []
+    term_counts = Counter()
+    try:
+        for ct, locale, entry_file in files:
+            print(f"📦 Importing {ct}/{locale or 'default'} from {entry_file}...")
+            file_counts = Counter()
+            # Fallback uids hash the file's place in the export, not where the export happens to live
+            source = os.path.relpath(entry_file, path) if os.path.isdir(path) else os.path.basename(entry_file)
+            pipeline = SyncPipeline(
+                iter_export_pages(entry_file, locale, page_size=config.SYNC_EMBED_BATCH_SIZE, counts=file_counts,
+                                  source=source),
+                build_metadata=lambda entry, ct=ct: ContentstackFetcher.entry_metadata(entry, ct),
+                upsert=write,
+                vector_id=lambda entry, locale=locale: ContentstackFetcher.entry_vector_id(entry, locale),
+                text=embedding_text_function(ct),
+                upsert_workers=config.PINECONE_UPSERT_WORKERS
+            )
+            summary = pipeline.run()
+            term_counts.update(pipeline.term_counts)
+            reports.append({'content_type': ct, 'locale': locale, 'file': entry_file,
+                            'missing_uid': file_counts['missing_uid'], **summary})
+            missing = f", {file_counts['missing_uid']} without a uid" if file_counts['missing_uid'] else ''
+            print(f"   {summary['upserted']}/{summary['entries']} entries ({summary['skipped']} skipped{missing}) "
+                  f"in {summary['seconds']}s")
+
+        if writer:
+            writer.close()
+            print(f"💾 Wrote {writer.count} vectors to {replica_path}")
+    finally:
+        if writer:
+            writer.discard()
+
+    # Collect catalog terms for the offline synonym table (synonym_graph.py)
+    try:
+        update_mined_terms([], counts=term_counts)
+    except Exception as e:
+        print(f"Warning: Could not update mined terms: {e}")
+
+    return {
+        'files': reports,
+        'entries': sum(report['entries'] for report in reports),
+        'skipped': sum(report['skipped'] for report in reports),
+        'missing_uid': sum(report['missing_uid'] for report in reports),
+        'written': sum(report['upserted'] for report in reports),
+        'seconds': round(time.time() - start, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the search index offline from a Contentstack export")
+    parser.add_argument('path', help="Export directory or a single entries JSON file")
+    parser.add_argument('--content-type', help="Only import this content type (names the entries of a single file)")
+    parser.add_argument('--replica', help="Write a local replica index file (see PINECONE_LOCAL_REPLICA_PATH)")
+    parser.add_argument('--pinecone', action='store_true', help="Upsert the vectors into Pinecone")
+    args = parser.parse_args()
+
+    pinecone_manager = None
+    if args.pinecone:
+        from pinecone_integration import PineconeManager
+        pinecone_manager = PineconeManager()
+
+    summary = import_export(args.path, args.content_type, args.replica, pinecone_manager)
+    print(f"✅ Imported {summary['written']}/{summary['entries']} entries from {len(summary['files'])} files "
+          f"in {summary['seconds']}s ({summary['skipped']} skipped)")
+    if summary['missing_uid']:
+        print(f"⚠️ {summary['missing_uid']} entries had no uid and were indexed under fallback ids")
+
+if __name__ == "__main__":
+    main()
@@ -12,9 +12,12 @@ worker_connections = 100  # Reduced connections
 timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # Configurable timeout
 keepalive = 30  # Reduced keepalive
 
-# Restart workers frequently to prevent memory accumulation
-max_requests = 20  # Frequent restarts for memory management
-max_requests_jitter = 5
+# Restart workers now and then to prevent memory accumulation. Background /sync jobs run
+# inside the worker, so keep this high enough that status polling (one request every few
+# seconds) doesn't recycle a worker mid-sync; a job that is cut off anyway is resumed from
+# its checkpoint by the next worker.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 50
 
 # Logging
 accesslog = "-"
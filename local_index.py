@@ -0,0 +1,56 @@
+"""
+In-process replica of the vector index
+
+Loads embeddings and metadata from a JSON file ({"embeddings": {id: [...]},
+"metadata": {id: {...}}}, the same layout load_existing_embeddings reads) and
+answers cosine top-k queries with a single matrix product. Metadata is
+projected onto the vector metadata schema (metadata_schema.py) as it loads. Used as the
+fallback when the Pinecone circuit breaker is open.
+"""
+import json
+from typing import Dict, List
+
+import numpy as np
+
+from metadata_schema import project_metadata
+
+
+class LocalReplicaIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        embeddings = data.get('embeddings', {})
+        metadata = data.get('metadata', {})
+        self.ids: List[str] = list(embeddings.keys())
+        self.metadata: List[Dict] = [project_metadata(metadata.get(vector_id, {})) for vector_id in self.ids]
+
+        matrix = np.asarray([embeddings[vector_id] for vector_id in self.ids], dtype=np.float32)
+        if matrix.size:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, 1e-12)
+        self.matrix = matrix
+        print(f"Loaded local replica index with {len(self.ids)} vectors from {path}")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, vector: List[float], top_k: int = 5) -> Dict:
+        """Cosine similarity top-k in the same shape as a Pinecone query response"""
+        if not self.ids:
+            return {'matches': []}
+
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.matrix @ query
+
+        k = min(top_k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return {
+            'matches': [
+                {'id': self.ids[i], 'score': float(scores[i]), 'metadata': self.metadata[i]}
+                for i in top
+            ]
+        }
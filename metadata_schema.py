@@ -0,0 +1,99 @@
+"""
+Metadata schema for vector records
+
+Every vector's metadata is projected onto one declared schema before it is
+written (Pinecone upserts and the local replica file). Each field has a kind
+and a size cap:
+
+    keyword  -> ids, locales and URLs; dropped if over the cap (a cut URL is wrong)
+    text     -> display text; cut at the cap on a word boundary, with an ellipsis
+    number   -> ints and floats; numeric strings are converted
+
+Fields outside the schema (full descriptions past the cap, event types,
+timestamps) and empty values are not stored, so a record costs a bounded
+number of bytes however large the entry is. The schema holds exactly the
+fields a search result renders, which keeps query responses small too.
+
+search_result() shapes a query match into the /search response: one copy
+of each field, with no nested raw metadata.
+"""
+from typing import Dict, List, Tuple
+
+from config import config
+
+# field -> (kind, cap in characters; None for numbers)
+METADATA_SCHEMA: Dict[str, Tuple[str, int]] = {
+    'entry_uid': ('keyword', 64),
+    'product_id': ('keyword', 128),
+    'content_type': ('keyword', 64),
+    'locale': ('keyword', 16),
+    'title': ('text', 200),
+    'name': ('text', 200),
+    'description': ('text', config.METADATA_DESCRIPTION_MAX_CHARS),
+    'price': ('number', None),
+    'category': ('text', 100),
+    'brand': ('text', 100),
+    'image_url': ('keyword', 1024),
+    'url': ('keyword', 1024),
+}
+
+
+def _truncate(value: str, cap: int) -> str:
+    if len(value) <= cap:
+        return value
+    cut = value[:cap - 1]
+    space = cut.rfind(' ')
+    if space > cap // 2:
+        cut = cut[:space]
+    return cut.rstrip() + '…'
+
+
+def project_metadata(metadata: Dict) -> Dict:
+    """Keep the schema's fields, coerced and capped; drop everything else"""
+    projected = {}
+    for name, (kind, cap) in METADATA_SCHEMA.items():
+        value = metadata.get(name)
+        if value is None or value == '':
+            continue
+        if kind == 'number':
+            if isinstance(value, bool):
+                continue
+            if not isinstance(value, (int, float)):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+            projected[name] = value
+        elif isinstance(value, str):
+            value = value.strip()
+            if kind == 'text':
+                projected[name] = _truncate(value, cap)
+            elif len(value) <= cap:
+                projected[name] = value
+    return projected
+
+
+def project_vectors(vectors: List[Dict]) -> List[Dict]:
+    """Copies of {'id', 'values', 'metadata'} vectors with projected metadata"""
+    return [{**vector, 'metadata': project_metadata(vector.get('metadata') or {})} for vector in vectors]
+
+
+def search_result(match: Dict, search_query: str) -> Dict:
+    """Shape a query match as a /search result"""
+    product_id = match['id']
+    metadata = match.get('metadata') or {}
+    return {
+        'product_id': product_id,
+        'name': metadata.get('name', metadata.get('title', f'Product {product_id}')),
+        'title': metadata.get('title', metadata.get('name', f'Product {product_id}')),
+        'description': metadata.get('description', ''),
+        'price': metadata.get('price', 0),
+        'category': metadata.get('category', ''),
+        'brand': metadata.get('brand', ''),
+        'image_url': metadata.get('image_url', ''),
+        'content_type': metadata.get('content_type', ''),
+        'url': metadata.get('url', ''),
+        'locale': metadata.get('locale', ''),
+        'score': match['score'],
+        'query_used': search_query
+    }
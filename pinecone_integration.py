@@ -1,8 +1,16 @@
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pinecone import Pinecone, ServerlessSpec
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterator, List
 import numpy as np
+from circuit_breaker import HedgeStats, pinecone_query_breaker
+from config import config
+from deadline import Deadline
+from local_index import LocalReplicaIndex
+from metadata_schema import project_vectors
+from upsert_batches import backoff_seconds, is_retryable, plan_batches, summarize
 
 # Load environment variables from .env file
 def load_env():
@@ -30,6 +38,14 @@ class PineconeManager:
         self.index_name = os.getenv('PINECONE_INDEX_NAME', 'contentstack-products')
         self.dimension = 384  # sentence-transformers dimension
 
+        # Query path protection: breaker, hedged requests and optional local replica
+        self.query_breaker = pinecone_query_breaker()
+        self.hedge_stats = HedgeStats()
+        self._query_executor = ThreadPoolExecutor(max_workers=config.PINECONE_QUERY_WORKERS, thread_name_prefix="pinecone-query")
+        self._upsert_executor = ThreadPoolExecutor(max_workers=config.PINECONE_UPSERT_WORKERS, thread_name_prefix="pinecone-upsert")
+        self._replica = None
+        self._replica_loaded = False
+
         # Create index if it doesn't exist
         self._ensure_index_exists()
 
@@ -57,53 +73,154 @@ class PineconeManager:
         # Connect to index
         self.index = self.pc.Index(self.index_name)
 
-    def upsert_embeddings(self, embeddings_data: Dict[str, List[float]], metadata: Dict[str, Any] = None):
-        """Upsert embeddings to Pinecone"""
+    def upsert_embeddings(self, embeddings_data: Dict[str, List[float]], metadata: Dict[str, Any] = None) -> Dict:
+        """Upsert {id: embedding}; metadata is either one dict for every vector or a dict of them by id"""
+        per_id = bool(metadata) and all(isinstance(metadata.get(product_id), dict) for product_id in embeddings_data)
         vectors = []
         for product_id, embedding in embeddings_data.items():
             # Convert to list if numpy array
             if isinstance(embedding, np.ndarray):
                 embedding = embedding.tolist()
 
-            # Use individual metadata or default
-            product_metadata = metadata or {'product_id': product_id}
-            # Ensure product_id is always in metadata
-            product_metadata['product_id'] = product_id
-
-            vector_data = {
+            # A copy per vector, with product_id filled in when the metadata lacks it
+            product_metadata = metadata.get(product_id) if per_id else metadata
+            vectors.append({
                 'id': product_id,
                 'values': embedding,
-                'metadata': product_metadata
-            }
-            vectors.append(vector_data)
-
-        # Upsert in batches
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
+                'metadata': {'product_id': product_id, **(product_metadata or {})}
+            })
+
+        return self.upsert_batches(vectors)
+
+    def _upsert_batch(self, batch: List[Dict[str, Any]], namespace: str = None) -> Dict:
+        """Send one batch, retrying transient failures with backoff"""
+        attempt = 0
+        while True:
             try:
-                self.index.upsert(vectors=batch)
-                print(f"Upserted batch {i//batch_size + 1} with {len(batch)} vectors")
+                self.index.upsert(vectors=batch, namespace=namespace)
+                return {'vectors': len(batch), 'ok': True, 'attempts': attempt + 1, 'error': None}
             except Exception as e:
-                print(f"Error upserting batch {i//batch_size + 1}: {e}")
+                if attempt >= config.PINECONE_UPSERT_RETRIES or not is_retryable(getattr(e, 'status', None)):
+                    print(f"Error upserting batch of {len(batch)} vectors after {attempt + 1} attempts: {e}")
+                    return {'vectors': len(batch), 'ok': False, 'attempts': attempt + 1, 'error': str(e)}
+                time.sleep(backoff_seconds(attempt))
+                attempt += 1
+
+    def upsert_batches(self, vectors: List[Dict[str, Any]], max_vectors: int = None, namespace: str = None) -> Dict:
+        """Upsert vectors in byte- and count-sized batches, several in flight, and summarize the outcome"""
+        start = time.time()
+        vectors = project_vectors(vectors)
+        batches = list(plan_batches(vectors, max_vectors=max_vectors))
+        if len(batches) > 1:
+            results = list(self._upsert_executor.map(lambda batch: self._upsert_batch(batch, namespace), batches))
+        else:
+            results = [self._upsert_batch(batch, namespace) for batch in batches]
 
-        print(f"Successfully upserted {len(vectors)} embeddings to Pinecone")
+        summary = summarize(results, time.time() - start)
+        failed = f", {summary['failed']} failed" if summary['failed'] else ''
+        print(f"Upserted {summary['upserted']}/{len(vectors)} vectors in {summary['batches']} batches{failed}")
+        return summary
 
-    def search_similar(self, query_embedding: List[float], top_k: int = 5) -> Dict:
-        """Search for similar embeddings"""
+    def upsert_vectors(self, vectors: List[Dict[str, Any]], batch_size: int = None, namespace: str = None) -> Dict:
+        """Upsert prepared {'id', 'values', 'metadata'} vectors (at most batch_size per request) and summarize the outcome"""
+        return self.upsert_batches(vectors, max_vectors=batch_size, namespace=namespace)
+
+    def search_similar(self, query_embedding: List[float], top_k: int = 5, deadline: Deadline = None) -> Dict:
+        """Search for similar embeddings (circuit-broken and hedged, with replica fallback)"""
         if isinstance(query_embedding, np.ndarray):
             query_embedding = query_embedding.tolist()
 
-        try:
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
-            return results
-        except Exception as e:
-            print(f"Error searching: {e}")
+        timeout = config.PINECONE_QUERY_TIMEOUT
+        if deadline is not None:
+            if deadline.expired():
+                deadline.skip('vector_query', 'deadline exceeded')
+                return {'matches': []}
+            timeout = deadline.timeout(cap=timeout)
+
+        if not self.query_breaker.allow_request():
+            return self._fallback_search(query_embedding, top_k, "circuit open")
+
+        self.hedge_stats.add(requests=1)
+        started = time.monotonic()
+        primary = self._query_executor.submit(self._query_index, query_embedding, top_k, timeout)
+        futures = [primary]
+
+        # Hedge: send a duplicate once the primary is slower than the rolling p95
+        hedge_delay = max(self.query_breaker.latency_percentile(95), config.PINECONE_HEDGE_MIN_DELAY_MS) / 1000.0
+        if config.PINECONE_HEDGE_ENABLED and hedge_delay < timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                futures.append(self._query_executor.submit(self._query_index, query_embedding, top_k, timeout))
+                self.hedge_stats.add(hedges_sent=1)
+
+        pending = set(futures)
+        last_error = None
+        upstream_failed = False
+        while pending:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results, latency_ms = future.result()
+                except Exception as e:
+                    last_error = e
+                    # An error before our timeout ran out is the upstream's, not the deadline's
+                    upstream_failed = upstream_failed or time.monotonic() - started < timeout
+                    continue
+                # Record the attempt's own latency so hedging doesn't inflate the p95
+                self.query_breaker.record(True, latency_ms)
+                if future is not primary:
+                    self.hedge_stats.add(hedge_wins=1)
+                return results
+
+        if timeout < config.PINECONE_QUERY_TIMEOUT and not upstream_failed:
+            # The request's deadline cut the wait short; that says nothing about Pinecone's health
+            self.query_breaker.release()
+        else:
+            self.query_breaker.record(False, (time.monotonic() - started) * 1000)
+        print(f"Error searching: {last_error or 'query timed out'}")
+        return self._fallback_search(query_embedding, top_k, "query failed")
+
+    def _query_index(self, query_embedding: List[float], top_k: int, timeout: float):
+        """One query attempt, returning (results, latency_ms)"""
+        started = time.monotonic()
+        results = self.index.query(
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=False,
+            _request_timeout=timeout
+        )
+        return results, (time.monotonic() - started) * 1000
+
+    def get_local_replica(self):
+        """Load the local replica index once, if one is configured"""
+        if not self._replica_loaded:
+            self._replica_loaded = True
+            if config.PINECONE_LOCAL_REPLICA_PATH:
+                try:
+                    self._replica = LocalReplicaIndex(config.PINECONE_LOCAL_REPLICA_PATH)
+                except Exception as e:
+                    print(f"Could not load local replica index: {e}")
+        return self._replica
+
+    def _fallback_search(self, query_embedding: List[float], top_k: int, reason: str) -> Dict:
+        replica = self.get_local_replica()
+        if replica is None:
             return {'matches': []}
+        print(f"↪️ Serving query from local replica ({reason})")
+        self.hedge_stats.add(fallbacks=1)
+        return replica.query(query_embedding, top_k=top_k)
+
+    def get_query_stats(self) -> Dict:
+        """Breaker state and hedging counters for the query path"""
+        return {
+            'breaker': self.query_breaker.stats(),
+            'hedging': self.hedge_stats.stats(),
+            'local_replica': len(self._replica) if self._replica is not None else None
+        }
 
     def delete_product(self, product_id: str):
         """Delete a product from the index"""
@@ -113,6 +230,33 @@ class PineconeManager:
         except Exception as e:
             print(f"Error deleting product {product_id}: {e}")
 
+    def delete_products(self, product_ids: List[str], batch_size: int = 1000, namespace: str = None):
+        """Delete many products from the index in batches, returning how many were deleted"""
+        deleted = 0
+        for i in range(0, len(product_ids), batch_size):
+            batch = product_ids[i:i + batch_size]
+            try:
+                self.index.delete(ids=batch, namespace=namespace)
+                deleted += len(batch)
+                print(f"Deleted batch {i//batch_size + 1} with {len(batch)} products from Pinecone")
+            except Exception as e:
+                print(f"Error deleting batch {i//batch_size + 1}: {e}")
+        return deleted
+
+    def fetch_metadata(self, ids: List[str], namespace: str = None, batch_size: int = 100) -> Dict[str, Dict]:
+        """Metadata of vectors by id; ids not in the index are left out"""
+        metadata = {}
+        for i in range(0, len(ids), batch_size):
+            response = self.index.fetch(ids=ids[i:i + batch_size], namespace=namespace)
+            for fetched_id, vector in response.vectors.items():
+                metadata[fetched_id] = vector.metadata or {}
+        return metadata
+
+    def iter_vector_ids(self, namespace: str = None) -> Iterator[List[str]]:
+        """Every vector id in a namespace, one listing page at a time (serverless indexes only)"""
+        for ids in self.index.list(namespace=namespace):
+            yield ids
+
     def get_index_stats(self):
         """Get index statistics"""
         try:
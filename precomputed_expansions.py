@@ -0,0 +1,218 @@
+"""
+Precomputed query expansions for popular searches
+
+/search records every query in a search log table. A batch job takes the top
+N logged queries, asks Gemini for their rewrites several queries per prompt
+(structured JSON output) and stores them in an expansion table that
+QueryRewriter reads before doing any LLM work:
+
+    python precomputed_expansions.py --top 500 --batch-size 20
+
+Refresh is incremental: only queries that are new or whose expansions have
+expired are sent to the LLM, so cost follows vocabulary drift, not traffic.
+
+Searches are counted in memory and written in one transaction every
+SEARCH_LOG_FLUSH_SECONDS by a background thread, so /search never waits on
+SQLite. Counts decay with a half-life of SEARCH_LOG_HALF_LIFE and queries
+not seen for SEARCH_LOG_RETENTION are pruned, which keeps the log bounded
+and lets yesterday's popular queries give way to today's.
+"""
+import argparse
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import config
+from rewrite_cache import normalize_query
+
+# How often counts are decayed and stale queries pruned
+_MAINTENANCE_SECONDS = 3600.0
+
+
+class ExpansionStore:
+    """Search log and expansion table in one SQLite file shared by all workers"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_log (
+                query TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS expansions (
+                query TEXT PRIMARY KEY,
+                rewrites TEXT NOT NULL,
+                refreshed_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS search_log_meta (key TEXT PRIMARY KEY, value REAL NOT NULL)')
+        self._pending_searches = Counter()
+        self._pending_lock = threading.Lock()
+        self._flusher = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def record_search(self, query: str):
+        """Count one search for a query (in memory; the flusher thread writes it)"""
+        with self._pending_lock:
+            self._pending_searches[normalize_query(query)] += 1
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name="search-log", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush_search_log)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(config.SEARCH_LOG_FLUSH_SECONDS)
+            self.flush_search_log()
+
+    def flush_search_log(self):
+        """Write the buffered search counts in one transaction, decaying and pruning when due"""
+        with self._pending_lock:
+            counts, self._pending_searches = self._pending_searches, Counter()
+        if not counts:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    """INSERT INTO search_log (query, count, last_seen) VALUES (?, ?, ?)
+                       ON CONFLICT(query) DO UPDATE SET count = count + excluded.count, last_seen = excluded.last_seen""",
+                    [(query, count, now) for query, count in counts.items()]
+                )
+                self._maintain(conn, now)
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            print(f"Search log write failed: {e}")
+
+    @staticmethod
+    def _maintain(conn: sqlite3.Connection, now: float):
+        """Decay counts by the time since the last decay (shared by all workers) and prune old queries"""
+        row = conn.execute("SELECT value FROM search_log_meta WHERE key = 'decayed_at'").fetchone()
+        if row is not None and now - row[0] < _MAINTENANCE_SECONDS:
+            return
+        if row is not None:
+            conn.execute('UPDATE search_log SET count = count * ?',
+                         (0.5 ** ((now - row[0]) / config.SEARCH_LOG_HALF_LIFE),))
+        conn.execute('DELETE FROM search_log WHERE last_seen < ?', (now - config.SEARCH_LOG_RETENTION,))
+        conn.execute("INSERT OR REPLACE INTO search_log_meta (key, value) VALUES ('decayed_at', ?)", (now,))
+
+    def get(self, query: str, num_expansions: int) -> Optional[List[str]]:
+        """Precomputed rewrites for a query, or None if missing or expired"""
+        try:
+            row = self._connect().execute(
+                'SELECT rewrites FROM expansions WHERE query = ? AND expires_at > ?',
+                (normalize_query(query), time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Expansion table read failed: {e}")
+            return None
+        return json.loads(row[0])[:num_expansions] if row else None
+
+    def put_many(self, rewrites_by_query: Dict[str, List[str]], ttl_seconds: float):
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO expansions (query, rewrites, refreshed_at, expires_at) VALUES (?, ?, ?, ?)',
+                [(query, json.dumps(rewrites), now, now + ttl_seconds) for query, rewrites in rewrites_by_query.items()]
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+    def queries_needing_refresh(self, top_n: int) -> List[str]:
+        """Top logged queries that have no expansion or an expired one"""
+        rows = self._connect().execute(
+            """SELECT l.query FROM (SELECT query, count FROM search_log ORDER BY count DESC LIMIT ?) l
+               LEFT JOIN expansions e ON e.query = l.query
+               WHERE e.query IS NULL OR e.expires_at <= ?
+               ORDER BY l.count DESC""",
+            (top_n, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+_expansion_store = None
+_expansion_store_lock = threading.Lock()
+
+
+def get_expansion_store() -> Optional[ExpansionStore]:
+    """Get or create the process-wide expansion store (None when disabled)"""
+    global _expansion_store
+    if not config.PRECOMPUTED_EXPANSIONS_PATH:
+        return None
+    if _expansion_store is None:
+        with _expansion_store_lock:
+            if _expansion_store is None:
+                try:
+                    _expansion_store = ExpansionStore(config.PRECOMPUTED_EXPANSIONS_PATH)
+                except sqlite3.Error as e:
+                    print(f"Precomputed expansions unavailable: {e}")
+                    return None
+    return _expansion_store
+
+
+def refresh_expansions(top_n: int, batch_size: int, num_rewrites: int, ttl_seconds: float) -> Dict:
+    """Send new or expired popular queries to Gemini in multi-query batches"""
+    from query_rewriter import QueryRewriter
+
+    store = get_expansion_store()
+    if store is None:
+        raise ValueError("PRECOMPUTED_EXPANSIONS_PATH is not configured")
+
+    queries = store.queries_needing_refresh(top_n)
+    print(f"🔄 {len(queries)} of the top {top_n} queries need (re)expansion")
+
+    rewriter = QueryRewriter(mode='llm')
+    refreshed = failed = 0
+    for i in range(0, len(queries), batch_size):
+        batch = queries[i:i + batch_size]
+        results = rewriter.rewrite_batch(batch, num_rewrites)
+        usable = {query: rewrites for query, rewrites in results.items() if rewrites}
+        if usable:
+            store.put_many(usable, ttl_seconds)
+        refreshed += len(usable)
+        failed += len(batch) - len(usable)
+        print(f"   Batch {i // batch_size + 1}: {len(usable)}/{len(batch)} queries expanded")
+
+    return {'candidates': len(queries), 'refreshed': refreshed, 'failed': failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute Gemini expansions for the most popular queries")
+    parser.add_argument('--top', type=int, default=500, help="How many of the most frequent queries to keep expanded")
+    parser.add_argument('--batch-size', type=int, default=20, help="Queries per Gemini prompt")
+    parser.add_argument('--num-rewrites', type=int, default=5)
+    parser.add_argument('--ttl', type=float, default=config.PRECOMPUTED_EXPANSIONS_TTL)
+    args = parser.parse_args()
+
+    summary = refresh_expansions(args.top, args.batch_size, args.num_rewrites, args.ttl)
+    print(f"✅ Refreshed {summary['refreshed']} queries ({summary['failed']} failed)")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,46 @@
 import os
 import google.generativeai as genai
 from config import config
-from typing import List
+from deadline import Deadline
+from rewrite_cache import get_rewrite_cache
+from synonym_graph import get_synonym_table
+from precomputed_expansions import get_expansion_store
+from typing import Dict, List
 import json
 
 class QueryRewriter:
-    def __init__(self):
+    def __init__(self, mode: str = None):
+        # 'llm': Gemini rewrites; 'local': synonym table, Gemini only for out-of-vocabulary queries
+        self.mode = (mode or config.QUERY_EXPANSION_MODE).lower()
+        if self.mode not in ('llm', 'local'):
+            raise ValueError(f"Unknown query expansion mode: {self.mode}")
+
         api_key = config.GEMINI_API_KEY
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not configured")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model = None
+        if self.mode == 'local':
+            if get_synonym_table() is None:
+                raise ValueError(f"Synonym table not found at {config.SYNONYM_TABLE_PATH}; run synonym_graph.py")
+            use_llm = bool(api_key) and config.QUERY_EXPANSION_LLM_FALLBACK
+        else:
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not configured")
+            use_llm = True
 
-    def rewrite_query(self, query: str, num_rewrites: int = 3) -> List[str]:
-        """Rewrite a query into multiple semantically similar forms"""
-        prompt = f"""
+        if use_llm:
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel('gemini-2.5-flash')
+
+    def local_rewrites(self, query: str, num_rewrites: int) -> List[str]:
+        """Expansions from the synonym table (empty for out-of-vocabulary queries)"""
+        if self.mode != 'local':
+            return []
+        table = get_synonym_table()
+        return table.expand(query, num_rewrites) if table else []
+
+    @staticmethod
+    def build_prompt(query: str, num_rewrites: int) -> str:
+        """Build the Gemini prompt used to rewrite a query"""
+        return f"""
         Given the search query: "{query}"
         
         Generate {num_rewrites} different but semantically similar search queries that would help find the same or related products. 
@@ -36,36 +61,142 @@ class QueryRewriter:
         Rewrites: ["bluetooth headphones", "wireless earbuds", "cordless headphones"]
         """
 
+    @staticmethod
+    def parse_rewrites(result_text: str, num_rewrites: int) -> List[str]:
+        """Parse the model response into a list of rewritten queries"""
+        result_text = result_text.strip()
+
+        # Try to parse as JSON
         try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text.strip()
-            
-            # Try to parse as JSON
-            try:
-                rewrites = json.loads(result_text)
-                if isinstance(rewrites, list) and all(isinstance(r, str) for r in rewrites):
-                    return rewrites[:num_rewrites]  # Limit to requested number
-            except json.JSONDecodeError:
-                # Fallback: extract queries from text
-                lines = result_text.split('\n')
-                rewrites = []
-                for line in lines:
-                    line = line.strip()
-                    if line and not line.startswith('[') and not line.startswith(']'):
-                        # Remove quotes and commas
-                        line = line.strip('"').strip("'").strip(',')
-                        if line:
-                            rewrites.append(line)
-                return rewrites[:num_rewrites]
-                
+            rewrites = json.loads(result_text)
+            if isinstance(rewrites, list) and all(isinstance(r, str) for r in rewrites):
+                return rewrites[:num_rewrites]  # Limit to requested number
+        except json.JSONDecodeError:
+            # Fallback: extract queries from text
+            lines = result_text.split('\n')
+            rewrites = []
+            for line in lines:
+                line = line.strip()
+                if line and not line.startswith('[') and not line.startswith(']'):
+                    # Remove quotes and commas
+                    line = line.strip('"').strip("'").strip(',')
+                    if line:
+                        rewrites.append(line)
+            return rewrites[:num_rewrites]
+        return []
+
+    @staticmethod
+    def build_batch_prompt(queries: List[str], num_rewrites: int) -> str:
+        """Build one Gemini prompt that rewrites several queries at once"""
+        return f"""
+        For each search query in the JSON array below, generate {num_rewrites} different but semantically similar
+        search queries that would help find the same or related products (synonyms, different phrasings,
+        common variations, broader or narrower related concepts).
+        
+        Queries: {json.dumps(queries)}
+        
+        Respond with a JSON array with one object per query, in the same order:
+        [{{"query": "<original query>", "rewrites": ["...", "..."]}}]
+        """
+
+    @staticmethod
+    def parse_batch_rewrites(result_text: str, queries: List[str], num_rewrites: int) -> Dict[str, List[str]]:
+        """Map each query to its rewrites; queries missing from the response map to []"""
+        rewrites_by_query = {query: [] for query in queries}
+        try:
+            items = json.loads(result_text.strip())
+        except json.JSONDecodeError:
+            return rewrites_by_query
+        if not isinstance(items, list):
+            return rewrites_by_query
+
+        for item in items:
+            if not isinstance(item, dict) or item.get('query') not in rewrites_by_query:
+                continue
+            rewrites = item.get('rewrites')
+            if isinstance(rewrites, list):
+                rewrites_by_query[item['query']] = [r for r in rewrites if isinstance(r, str)][:num_rewrites]
+        return rewrites_by_query
+
+    def rewrite_batch(self, queries: List[str], num_rewrites: int = 5) -> Dict[str, List[str]]:
+        """Rewrite several queries with a single structured-output Gemini call"""
+        try:
+            response = self.model.generate_content(
+                self.build_batch_prompt(queries, num_rewrites),
+                generation_config={'response_mime_type': 'application/json'}
+            )
+            return self.parse_batch_rewrites(response.text, queries, num_rewrites)
+        except Exception as e:
+            print(f"Error rewriting query batch: {e}")
+            return {query: [] for query in queries}
+
+    @staticmethod
+    def is_timeout_error(error: Exception) -> bool:
+        """Timeouts come from our own budget, so they are not negatively cached"""
+        return isinstance(error, TimeoutError) or 'timeout' in str(error).lower() or 'deadline' in str(error).lower()
+
+    def rewrite_query(self, query: str, num_rewrites: int = 3, timeout: float = None) -> List[str]:
+        """Rewrite a query into multiple semantically similar forms"""
+        rewrites = self.local_rewrites(query, num_rewrites)
+        if rewrites or self.model is None:
+            return rewrites
+        return self.rewrite_with_llm(query, num_rewrites, timeout=timeout)
+
+    def rewrite_with_llm(self, query: str, num_rewrites: int = 3, timeout: float = None) -> List[str]:
+        """Rewrite a query with Gemini, going through the shared rewrite cache"""
+        cache = get_rewrite_cache()
+        if cache is not None:
+            hit, cached = cache.get(query, num_rewrites)
+            if hit:
+                return cached
+
+        prompt = self.build_prompt(query, num_rewrites)
+        request_options = {'timeout': timeout} if timeout is not None else None
+
+        try:
+            response = self.model.generate_content(prompt, request_options=request_options)
+            rewrites = self.parse_rewrites(response.text, num_rewrites)
         except Exception as e:
             print(f"Error rewriting query: {e}")
+            if cache is not None and not self.is_timeout_error(e):
+                cache.put(query, num_rewrites, [])
             return []
 
-    def expand_query(self, query: str, num_expansions: int = 5) -> List[str]:
+        # Unparseable responses come back empty and are cached as failures
+        if cache is not None:
+            cache.put(query, num_rewrites, rewrites)
+        return rewrites
+
+    def expand_query(self, query: str, num_expansions: int = 5, deadline: Deadline = None) -> List[str]:
         """Expand a query with multiple related search terms"""
-        rewrites = self.rewrite_query(query, num_expansions)
-        
+        # Precomputed and local expansions are lookups, so they never need budget
+        store = get_expansion_store()
+        precomputed = store.get(query, num_expansions) if store else None
+        if precomputed:
+            return self.merge_expansions(query, precomputed)
+
+        rewrites = self.local_rewrites(query, num_expansions)
+        if rewrites or self.model is None:
+            return self.merge_expansions(query, rewrites)
+
+        timeout = None
+        if deadline is not None:
+            # Leave enough budget to embed and search the original query afterwards
+            if not deadline.allows(config.REWRITE_MIN_BUDGET_MS + config.SEARCH_RESERVE_MS):
+                deadline.skip('rewrite', 'not enough budget for the LLM rewrite')
+                return [query]
+            timeout = deadline.timeout(reserve_ms=config.SEARCH_RESERVE_MS)
+
+        rewrites = self.rewrite_with_llm(query, num_expansions, timeout=timeout)
+        if deadline is not None and not rewrites and not deadline.allows(config.SEARCH_RESERVE_MS):
+            deadline.skip('rewrite', 'LLM rewrite timed out')
+        return self.merge_expansions(query, rewrites)
+
+    @staticmethod
+    def merge_expansions(query: str, rewrites: List[str]) -> List[str]:
+        """Put the original query first and drop case-insensitive duplicates"""
+        rewrites = list(rewrites)
+
         # Always include the original query
         if query not in rewrites:
             rewrites.insert(0, query)
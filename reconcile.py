@@ -0,0 +1,353 @@
+"""
+Set-difference reconciliation between Pinecone and Contentstack
+
+Deletes normally arrive as entry_unpublished/entry_deleted webhooks, so a
+missed webhook leaves a ghost vector in the index, and a missed publish
+leaves an entry unsearchable. Reconciliation compares the two id sets
+directly:
+
+    live ids   = vector ids of every published entry of the synced content
+                 types and locales (uid-only page fetches)
+    index ids  = every vector id in the namespace (Pinecone list)
+    stale      = index ids - live ids   -> batched deletes
+    missing    = live ids - index ids   -> fetched by uid and upserted
+
+The index holds every content type and locale, so a stale id is only
+deleted once its metadata (fetched in batches) shows it belongs to one of
+the reconciled content type/locale pairs; vectors of the others are counted
+as out_of_scope and left alone. Offset pages shift when entries are
+published or removed mid-listing, which can skip a live entry, so each
+in-scope candidate is then looked up again by uid (uid[$in] queries) and
+only the ones Contentstack no longer returns are deleted; the others are
+counted as still_live.
+
+To stay memory-bounded on millions of ids, ids are spooled to temp files
+while they are listed and only their 64-bit hashes are kept in memory, as
+sorted numpy arrays (8 bytes per id). The differences are taken on the
+hash arrays; the spools are then streamed once to turn the differing hashes
+back into ids. A hash collision can only hide a difference, never delete a
+live vector.
+
+    python reconcile.py --dry-run
+    python reconcile.py --content-types product,article --locales en-us,fr-fr
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from contentstack_fetcher import projected_fields, vector_id
+from sync_orchestrator import parse_list
+from embeddings_generator import embedding_text_function
+from sync_pipeline import SyncPipeline
+
+# Ids hashed and compared per chunk while streaming a spool
+_CHUNK_SIZE = 100000
+# Most uids a Delivery API uid[$in] query returns in one page
+_UID_QUERY_SIZE = 100
+# Stale ids whose metadata is fetched per Pinecone fetch request
+_METADATA_FETCH_SIZE = 100
+
+
+def id_hashes(ids: Iterable[str]) -> np.ndarray:
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big') for value in ids),
+        dtype=np.uint64
+    )
+
+
+class IdSpool:
+    """Append-only file of tab-separated id rows plus the sorted, unique hashes of their first column"""
+
+    def __init__(self, label: str):
+        self._file = tempfile.NamedTemporaryFile('w', prefix=f"reconcile-{label}-", suffix='.tsv',
+                                                 delete=False, encoding='utf-8')
+        self._chunks = []
+        self.count = 0
+
+    def add(self, rows: List[Tuple[str, ...]]):
+        if not rows:
+            return
+        self._file.write(''.join('\t'.join(row) + '\n' for row in rows))
+        self._chunks.append(id_hashes(row[0] for row in rows))
+        self.count += len(rows)
+
+    def hashes(self) -> np.ndarray:
+        """Close the spool and return its sorted unique hashes"""
+        self._file.close()
+        hashes = np.unique(np.concatenate(self._chunks)) if self._chunks else np.empty(0, dtype=np.uint64)
+        self._chunks = []
+        return hashes
+
+    def rows_in(self, wanted: np.ndarray) -> Iterator[List[str]]:
+        """Stream the rows whose id hash is in the sorted array wanted"""
+        if not len(wanted):
+            return
+        with open(self._file.name, 'r', encoding='utf-8') as f:
+            while True:
+                rows = [line.rstrip('\n').split('\t') for _, line in zip(range(_CHUNK_SIZE), f)]
+                if not rows:
+                    return
+                keep = np.isin(id_hashes(row[0] for row in rows), wanted, assume_unique=False)
+                for row, selected in zip(rows, keep):
+                    if selected:
+                        yield row
+
+    def rows(self) -> Iterator[List[str]]:
+        """Close the spool and stream all of its rows"""
+        self._file.close()
+        with open(self._file.name, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line.rstrip('\n').split('\t')
+
+    def remove(self):
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except OSError:
+            pass
+
+
+class Reconciler:
+    def __init__(self, fetcher, content_types: List[str], locales: List[str] = None, namespace: str = None,
+                 dry_run: bool = False, force: bool = False):
+        self.fetcher = fetcher
+        self.namespace = namespace
+        self.dry_run = dry_run
+        self.force = force
+        self.jobs = [
+            (content_type, locale)
+            for content_type in content_types
+            for locale in (locales or [None])
+        ]
+        self.stage = 'pending'
+        self.counts = {'live': 0, 'indexed': 0, 'stale': 0, 'out_of_scope': 0, 'still_live': 0, 'missing': 0,
+                       'deleted': 0, 'upserted': 0}
+        self.started_at = None
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, amount: int):
+        with self._lock:
+            self.counts[name] += amount
+
+    def _list_live(self, spool: IdSpool):
+        """Spool (vector id, job number, uid) for every published entry"""
+        for number, (content_type, locale) in enumerate(self.jobs):
+            pages = self.fetcher.iter_entry_pages(content_type, locale=locale, strict=True, fields=['uid'])
+            for entries in pages:
+                rows = [
+                    (vector_id(entry['uid'], entry.get('locale') or locale), str(number), entry['uid'])
+                    for entry in entries if entry.get('uid')
+                ]
+                spool.add(rows)
+                self._count('live', len(rows))
+
+    def _list_index(self, spool: IdSpool):
+        for ids in self.fetcher.pinecone_manager.iter_vector_ids(namespace=self.namespace):
+            spool.add([(value,) for value in ids])
+            self._count('indexed', len(ids))
+
+    @staticmethod
+    def _run_lister(lister, spool: IdSpool, errors: List[Exception]):
+        try:
+            lister(spool)
+        except Exception as e:
+            print(f"❌ Reconcile listing failed: {e}")
+            errors.append(e)
+
+    def _confirm_missing(self, content_type: str, locale: Optional[str], candidates: List[Tuple[str, str]]) -> List[str]:
+        """The ids of (id, uid) candidates whose entries a uid[$in] query no longer returns"""
+        gone = []
+        for i in range(0, len(candidates), _UID_QUERY_SIZE):
+            chunk = candidates[i:i + _UID_QUERY_SIZE]
+            entries = self.fetcher.fetch_entries_by_uid(content_type, [uid for _, uid in chunk], locale, fields=['uid'])
+            live_uids = {entry.get('uid') for entry in entries}
+            gone.extend(value for value, uid in chunk if uid not in live_uids)
+        return gone
+
+    def _scope_stale(self, spool: IdSpool, stale: np.ndarray) -> IdSpool:
+        """Spool the stale ids that belong to a reconciled content type and locale and are really gone"""
+        scope = {(content_type, locale or config.CONTENTSTACK_DEFAULT_LOCALE): locale for content_type, locale in self.jobs}
+        scoped = IdSpool('stale')
+
+        def add(ids: List[str]):
+            metadata = self.fetcher.pinecone_manager.fetch_metadata(ids, namespace=self.namespace)
+            candidates = {}
+            for value in ids:
+                # Ids gone since the listing, or without metadata, are left alone
+                fields = metadata.get(value) or {}
+                key = (fields.get('content_type'), fields.get('locale') or config.CONTENTSTACK_DEFAULT_LOCALE)
+                if key in scope:
+                    candidates.setdefault(key, []).append((value, fields.get('entry_uid') or value.split(':')[0]))
+            in_scope = sum(len(group) for group in candidates.values())
+            self._count('out_of_scope', len(ids) - in_scope)
+            for key, group in candidates.items():
+                gone = self._confirm_missing(key[0], scope[key], group)
+                scoped.add([(value,) for value in gone])
+                self._count('still_live', len(group) - len(gone))
+
+        batch = []
+        for row in spool.rows_in(stale):
+            batch.append(row[0])
+            if len(batch) >= _METADATA_FETCH_SIZE:
+                add(batch)
+                batch = []
+        if batch:
+            add(batch)
+        return scoped
+
+    def _delete(self, spool: IdSpool):
+        batch = []
+        for row in spool.rows():
+            batch.append(row[0])
+            if len(batch) >= config.RECONCILE_DELETE_BATCH_SIZE:
+                self._count('deleted', self.fetcher.pinecone_manager.delete_products(
+                    batch, batch_size=config.RECONCILE_DELETE_BATCH_SIZE, namespace=self.namespace))
+                batch = []
+        if batch:
+            self._count('deleted', self.fetcher.pinecone_manager.delete_products(
+                batch, batch_size=config.RECONCILE_DELETE_BATCH_SIZE, namespace=self.namespace))
+
+    def _missing_pages(self, rows: Iterator[List[str]], content_type: str,
+                       locale: Optional[str]) -> Iterator[List[Dict]]:
+        fields = projected_fields(content_type) if config.CONTENTSTACK_FIELD_PROJECTION else None
+        uids = []
+        for row in rows:
+            uids.append(row[2])
+            if len(uids) >= _UID_QUERY_SIZE:
+                yield self.fetcher.fetch_entries_by_uid(content_type, uids, locale, fields=fields)
+                uids = []
+        if uids:
+            yield self.fetcher.fetch_entries_by_uid(content_type, uids, locale, fields=fields)
+
+    def _upsert(self, spool: IdSpool, missing: np.ndarray):
+        """Embed and upsert the missing entries, one pipeline per content type/locale"""
+        rows = spool.rows_in(missing)
+        row = next(rows, None)
+        while row is not None:
+            # The live spool is written job by job, so each job's rows are contiguous
+            number = row[1]
+            content_type, locale = self.jobs[int(number)]
+            self.fetcher.load_text_extractor(content_type)
+
+            def job_rows():
+                nonlocal row
+                while row is not None and row[1] == number:
+                    yield row
+                    row = next(rows, None)
+
+            pipeline = SyncPipeline(
+                self._missing_pages(job_rows(), content_type, locale),
+                build_metadata=lambda entry, content_type=content_type: self.fetcher.entry_metadata(entry, content_type),
+                upsert=lambda vectors: self.fetcher.pinecone_manager.upsert_vectors(
+                    vectors, batch_size=config.SYNC_UPSERT_BATCH_SIZE, namespace=self.namespace)['upserted'],
+                vector_id=lambda entry, locale=locale: self.fetcher.entry_vector_id(entry, locale),
+                prepare=lambda entries, locale=locale: self.fetcher.resolve_references(entries, locale),
+                text=embedding_text_function(content_type),
+                upsert_workers=config.PINECONE_UPSERT_WORKERS
+            )
+            summary = pipeline.run()
+            self._count('upserted', summary['upserted'])
+
+    def run(self) -> Dict:
+        """List both id sets, diff them and apply the deletes and upserts"""
+        if not self.fetcher.pinecone_manager:
+            raise ValueError("Pinecone not available, cannot reconcile")
+
+        self.started_at = time.time()
+        live_spool = IdSpool('live')
+        index_spool = IdSpool('index')
+        stale_spool = None
+        deletes_skipped = None
+        try:
+            self.stage = 'listing'
+            print(f"🔎 Listing live entries of {len(self.jobs)} content type/locale pairs and the index ids...")
+            errors = []
+            listers = [
+                threading.Thread(target=self._run_lister, args=(lister, spool, errors), name=f"reconcile-{name}",
+                                 daemon=True)
+                for name, lister, spool in (('live', self._list_live, live_spool),
+                                            ('index', self._list_index, index_spool))
+            ]
+            for thread in listers:
+                thread.start()
+            for thread in listers:
+                thread.join()
+            if errors:
+                # A partial listing would turn every unlisted entry into a delete
+                raise errors[0]
+
+            self.stage = 'diffing'
+            live = live_spool.hashes()
+            indexed = index_spool.hashes()
+            unlisted = np.setdiff1d(indexed, live, assume_unique=True)
+            missing = np.setdiff1d(live, indexed, assume_unique=True)
+            stale_spool = self._scope_stale(index_spool, unlisted)
+            stale = stale_spool.count
+            with self._lock:
+                self.counts['stale'] = stale
+                self.counts['missing'] = len(missing)
+            print(f"   {len(live)} live ids, {len(indexed)} index ids: {stale} stale, {len(missing)} missing "
+                  f"({self.counts['out_of_scope']} other content types/locales and "
+                  f"{self.counts['still_live']} entries missed by the listing left alone)")
+
+            if stale and len(indexed) and stale / len(indexed) > config.RECONCILE_MAX_DELETE_FRACTION \
+                    and not self.force:
+                deletes_skipped = (f"{stale} of {len(indexed)} vectors would be deleted, more than "
+                                   f"RECONCILE_MAX_DELETE_FRACTION={config.RECONCILE_MAX_DELETE_FRACTION}; "
+                                   f"rerun with force to apply")
+                print(f"⚠️ {deletes_skipped}")
+
+            if not self.dry_run:
+                if not deletes_skipped:
+                    self.stage = 'deleting'
+                    self._delete(stale_spool)
+                self.stage = 'upserting'
+                self._upsert(live_spool, missing)
+            self.stage = 'completed'
+        finally:
+            live_spool.remove()
+            index_spool.remove()
+            if stale_spool is not None:
+                stale_spool.remove()
+
+        summary = {**self.progress(), 'dry_run': self.dry_run}
+        if deletes_skipped:
+            summary['deletes_skipped'] = deletes_skipped
+        print(f"✅ Reconciled: {summary['deleted']} stale vectors deleted, {summary['upserted']} missing entries "
+              f"upserted in {summary['seconds']}s")
+        return summary
+
+    def progress(self) -> Dict:
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            'stage': self.stage,
+            **counts,
+            'seconds': round(time.time() - self.started_at, 2) if self.started_at else 0.0
+        }
+
+
+def main():
+    from contentstack_fetcher import ContentstackFetcher
+
+    parser = argparse.ArgumentParser(description="Delete stale vectors and upsert missing entries")
+    parser.add_argument('--content-types', default=config.SYNC_CONTENT_TYPES)
+    parser.add_argument('--locales', default=config.SYNC_LOCALES, help="Comma-separated; empty uses the stack default")
+    parser.add_argument('--namespace', default=None, help="Pinecone namespace (default namespace if omitted)")
+    parser.add_argument('--dry-run', action='store_true', help="Only report the stale and missing counts")
+    parser.add_argument('--force', action='store_true',
+                        help="Delete even more than RECONCILE_MAX_DELETE_FRACTION of the index")
+    args = parser.parse_args()
+
+    Reconciler(ContentstackFetcher(), parse_list(args.content_types), parse_list(args.locales), args.namespace,
+               dry_run=args.dry_run, force=args.force).run()
+
+if __name__ == "__main__":
+    main()
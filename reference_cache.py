@@ -0,0 +1,150 @@
+"""
+Batched resolution of referenced entries with a shared LRU cache
+
+Delivery API entries carry reference fields as stubs
+({"uid": ..., "_content_type_uid": "brand"}). Instead of include[] (which
+repeats the same brand payload in every product) or one follow-up call per
+entry, a sync batch collects every referenced uid, looks them up in a
+process-wide LRU cache and fetches only the misses with one uid[$in] query
+per content type and locale. The stubs are then replaced in place with the referenced
+entries, the same shape include[] returns, so embedding text can use them.
+Webhooks refresh or drop cached references when those entries change.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from config import config
+
+# Fields fetched for a referenced entry; they are all its embedding text needs
+REFERENCE_TEXT_FIELDS = ['title', 'name']
+
+_MISSING = object()
+
+
+def reference_fields() -> List[str]:
+    return [field.strip() for field in config.CONTENTSTACK_REFERENCE_FIELDS.split(',') if field.strip()]
+
+
+def _locale_key(locale: Optional[str]) -> str:
+    return locale or config.CONTENTSTACK_DEFAULT_LOCALE
+
+
+def _reference_stubs(entry: Dict) -> Iterator[Tuple[str, int, Dict]]:
+    """(field, position, stub) for every reference in the entry's reference fields"""
+    for field in reference_fields():
+        value = entry.get(field)
+        items = value if isinstance(value, list) else [value]
+        for position, item in enumerate(items):
+            if isinstance(item, dict) and item.get('uid') and item.get('_content_type_uid'):
+                yield field, position, item
+
+
+class ReferenceCache:
+    """Thread-safe LRU of referenced entries keyed by (content type, uid, locale)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self._entries: 'OrderedDict[Tuple[str, str, str], object]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, content_type: str, uid: str, locale: str = None, record: bool = True):
+        """The cached entry, None if it is known not to exist, or _MISSING"""
+        key = (content_type, uid, _locale_key(locale))
+        with self._lock:
+            if key not in self._entries:
+                if record:
+                    self.misses += 1
+                return _MISSING
+            if record:
+                self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, content_type: str, uid: str, entry: Optional[Dict], locale: str = None):
+        key = (content_type, uid, _locale_key(locale))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, content_type: str, entry: Dict):
+        """Replace a cached reference after a publish webhook; entries nobody references are not added"""
+        locale = _locale_key(entry.get('locale'))
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == content_type and key[1] == entry.get('uid')]:
+                if key[2] == locale:
+                    self._entries[key] = {field: entry.get(field) for field in ['uid'] + REFERENCE_TEXT_FIELDS}
+                else:
+                    # Other locales may have fallen back to this one; fetch them again when next needed
+                    del self._entries[key]
+
+    def invalidate(self, content_type: str, uid: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == content_type and key[1] == uid]:
+                del self._entries[key]
+
+    def missing(self, entries: List[Dict], locale: str = None) -> Dict[Tuple[str, Optional[str]], Set[str]]:
+        """Referenced uids per (content type, locale) that the cache cannot answer"""
+        missing = {}
+        seen = set()
+        for entry in entries:
+            entry_locale = entry.get('locale') or locale
+            for _, _, stub in _reference_stubs(entry):
+                key = (stub['_content_type_uid'], entry_locale)
+                if (key, stub['uid']) in seen:
+                    continue
+                seen.add((key, stub['uid']))
+                if self.get(key[0], stub['uid'], entry_locale) is _MISSING:
+                    missing.setdefault(key, set()).add(stub['uid'])
+        return missing
+
+    def store(self, content_type: str, uids: Set[str], fetched: List[Dict], locale: str = None):
+        """Cache a uid[$in] result; uids it did not return are cached as missing"""
+        by_uid = {entry['uid']: entry for entry in fetched if entry.get('uid')}
+        with self._lock:
+            self.fetched += len(by_uid)
+        for uid in uids:
+            self.put(content_type, uid, by_uid.get(uid), locale)
+
+    def attach(self, entries: List[Dict], locale: str = None):
+        """Replace reference stubs with the cached entries (stubs without one are left as-is)"""
+        for entry in entries:
+            for field, position, stub in list(_reference_stubs(entry)):
+                resolved = self.get(stub['_content_type_uid'], stub['uid'], entry.get('locale') or locale, record=False)
+                if resolved is _MISSING or resolved is None:
+                    continue
+                resolved = {**resolved, '_content_type_uid': stub['_content_type_uid']}
+                if isinstance(entry[field], list):
+                    entry[field][position] = resolved
+                else:
+                    entry[field] = resolved
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'fetched': self.fetched,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+_reference_cache = None
+_reference_cache_lock = threading.Lock()
+
+
+def get_reference_cache() -> ReferenceCache:
+    """Get or create the process-wide reference cache"""
+    global _reference_cache
+    if _reference_cache is None:
+        with _reference_cache_lock:
+            if _reference_cache is None:
+                _reference_cache = ReferenceCache(config.REFERENCE_CACHE_SIZE)
+    return _reference_cache
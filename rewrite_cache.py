@@ -0,0 +1,122 @@
+"""
+Disk-backed cache for Gemini query rewrites
+
+SQLite in WAL mode, so every worker process on a host shares one cache file.
+Entries are keyed by the normalized query and the number of rewrites asked
+for. Successful rewrites live for a long TTL; failures and unparseable
+responses are cached for a short negative TTL so a broken query doesn't hit
+the LLM on every search.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from config import config
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so trivial variants share a cache entry"""
+    return _WHITESPACE.sub(' ', query.strip().lower())
+
+
+class RewriteCache:
+    def __init__(self, path: str, ttl_seconds: float, negative_ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._connect().execute(
+            """CREATE TABLE IF NOT EXISTS rewrites (
+                cache_key TEXT PRIMARY KEY,
+                rewrites TEXT,
+                failed INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(query: str, num_rewrites: int) -> str:
+        return f"{num_rewrites}:{normalize_query(query)}"
+
+    def get(self, query: str, num_rewrites: int) -> Tuple[bool, Optional[List[str]]]:
+        """Return (hit, rewrites); a cached failure is a hit with an empty list"""
+        try:
+            row = self._connect().execute(
+                'SELECT rewrites, failed FROM rewrites WHERE cache_key = ? AND expires_at > ?',
+                (self.make_key(query, num_rewrites), time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Rewrite cache read failed: {e}")
+            return False, None
+
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        rewrites, failed = row
+        return True, [] if failed else json.loads(rewrites)
+
+    def put(self, query: str, num_rewrites: int, rewrites: List[str]):
+        """Cache rewrites; an empty list is stored as a negative entry"""
+        failed = not rewrites
+        ttl = self.negative_ttl_seconds if failed else self.ttl_seconds
+        try:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO rewrites (cache_key, rewrites, failed, expires_at) VALUES (?, ?, ?, ?)',
+                (self.make_key(query, num_rewrites), None if failed else json.dumps(rewrites), int(failed), time.time() + ttl)
+            )
+        except sqlite3.Error as e:
+            print(f"Rewrite cache write failed: {e}")
+
+    def purge_expired(self) -> int:
+        """Delete expired entries, returning how many were removed"""
+        cursor = self._connect().execute('DELETE FROM rewrites WHERE expires_at <= ?', (time.time(),))
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+_rewrite_cache = None
+_rewrite_cache_lock = threading.Lock()
+
+
+def get_rewrite_cache() -> Optional[RewriteCache]:
+    """Get or create the process-wide rewrite cache (None when disabled)"""
+    global _rewrite_cache
+    if not config.REWRITE_CACHE_PATH:
+        return None
+    if _rewrite_cache is None:
+        with _rewrite_cache_lock:
+            if _rewrite_cache is None:
+                try:
+                    _rewrite_cache = RewriteCache(
+                        config.REWRITE_CACHE_PATH,
+                        config.REWRITE_CACHE_TTL,
+                        config.REWRITE_CACHE_NEGATIVE_TTL
+                    )
+                except sqlite3.Error as e:
+                    print(f"Rewrite cache unavailable: {e}")
+                    return None
+    return _rewrite_cache
@@ -0,0 +1,86 @@
+"""
+Search-first scheduling for background work
+
+Searches and background syncs share the embedding model and the CPU. The
+web app marks every /search request as active on a process-wide gate, and
+background sync jobs call wait_for_idle() before each embedding batch, so a
+batch only starts once no search is in flight (and none finished in the
+last few milliseconds). The wait is capped so a steady stream of searches
+slows a sync down but never stalls it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from config import config
+
+# Searches arriving this close together count as one busy period
+_QUIET_SECONDS = 0.05
+
+
+class SearchPriorityGate:
+    def __init__(self, max_wait_seconds: float):
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.yields = 0
+        self.waited_seconds = 0.0
+        self._last_search_end = 0.0
+        self._condition = threading.Condition()
+
+    def enter(self):
+        with self._condition:
+            self.active += 1
+
+    def exit(self):
+        with self._condition:
+            self.active -= 1
+            self._last_search_end = time.monotonic()
+            self._condition.notify_all()
+
+    @contextmanager
+    def search(self):
+        self.enter()
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def wait_for_idle(self):
+        """Block background work while searches are running, for at most max_wait_seconds"""
+        start = time.monotonic()
+        deadline = start + self.max_wait_seconds
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.active == 0 and now - self._last_search_end >= _QUIET_SECONDS:
+                    break
+                if now >= deadline:
+                    break
+                self._condition.wait(timeout=min(deadline - now, _QUIET_SECONDS))
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                self.yields += 1
+                self.waited_seconds += waited
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                'active_searches': self.active,
+                'background_yields': self.yields,
+                'background_waited_seconds': round(self.waited_seconds, 2)
+            }
+
+
+_search_gate = None
+_search_gate_lock = threading.Lock()
+
+
+def get_search_gate() -> SearchPriorityGate:
+    """Get or create the process-wide search priority gate"""
+    global _search_gate
+    if _search_gate is None:
+        with _search_gate_lock:
+            if _search_gate is None:
+                _search_gate = SearchPriorityGate(config.SYNC_SEARCH_YIELD_SECONDS)
+    return _search_gate
@@ -0,0 +1,295 @@
+"""
+Background sync jobs
+
+POST /sync used to run the whole sync inside the request, which ties up a
+web worker for minutes and dies with the worker's timeout. Instead a sync
+is recorded as a job in a small SQLite table and run by a background worker
+thread; the request returns the job id straight away and GET /sync/<id>
+reports its status and progress (entries fetched, embedded and upserted,
+throughput and ETA, from SyncOrchestrator.progress()). Reconciliation runs
+(reconcile.py) are jobs too and report their own counts.
+
+Progress is written to the table every few seconds, so any process sharing
+the table can answer a status request. Jobs that were queued or running in
+a process that is gone (a recycled or crashed web worker) are marked
+interrupted, and the next process to start claims them and runs them again
+from the sync checkpoints (sync_state.py), up to SYNC_JOB_MAX_RESUMES times.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from queue import Queue
+from typing import Callable, Dict, List, Optional
+
+from config import config
+from reconcile import Reconciler
+from sync_orchestrator import SyncOrchestrator
+
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+# How often a running job's progress is written to the table
+_PROGRESS_INTERVAL_SECONDS = 2.0
+
+
+def _process_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner: str) -> bool:
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        # Another machine's jobs cannot be checked from here
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SyncJobStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS sync_jobs (
+                id TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                resumes INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(sync_jobs)')]
+        if 'resumes' not in columns:
+            conn.execute('ALTER TABLE sync_jobs ADD COLUMN resumes INTEGER NOT NULL DEFAULT 0')
+        self.mark_orphans_interrupted()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def mark_orphans_interrupted(self):
+        """Jobs left queued or running by a process that no longer exists will never finish"""
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT id, owner FROM sync_jobs WHERE status IN (?, ?)', JOB_ACTIVE_STATUSES
+        ).fetchall()
+        for row in rows:
+            if not _owner_alive(row['owner']):
+                self._mark_interrupted(row['id'])
+
+    def _mark_interrupted(self, job_id: str):
+        self.update(job_id, status='interrupted', finished_at=time.time(),
+                    error='The process running this job exited')
+
+    def _check_owner(self, job: Dict) -> Dict:
+        """An active job whose process has since exited is marked interrupted on read"""
+        if job['status'] in JOB_ACTIVE_STATUSES and not _owner_alive(job['owner']):
+            self._mark_interrupted(job['id'])
+            job = self.get(job['id'])
+        return job
+
+    def create(self, params: Dict) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        self._connect().execute(
+            'INSERT INTO sync_jobs (id, params, status, owner, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, json.dumps(params, sort_keys=True), 'queued', _process_owner(), time.time())
+        )
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        for name in ('progress', 'result'):
+            if name in fields:
+                fields[name] = json.dumps(fields[name])
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._connect().execute(
+            f'UPDATE sync_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id)
+        )
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for name in ('params', 'progress', 'result'):
+            job[name] = json.loads(job[name]) if job[name] else None
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._connect().execute('SELECT * FROM sync_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._check_owner(self._row_to_job(row)) if row else None
+
+    def find_active(self, params: Dict) -> Optional[Dict]:
+        """The oldest queued or running job with these params whose process is still alive"""
+        rows = self._connect().execute(
+            'SELECT * FROM sync_jobs WHERE params = ? AND status IN (?, ?) ORDER BY created_at',
+            (json.dumps(params, sort_keys=True), *JOB_ACTIVE_STATUSES)
+        ).fetchall()
+        for row in rows:
+            job = self._check_owner(self._row_to_job(row))
+            if job['status'] in JOB_ACTIVE_STATUSES:
+                return job
+        return None
+
+    def resumable(self, max_resumes: int) -> List[Dict]:
+        """Interrupted jobs that may still be run again, oldest first"""
+        rows = self._connect().execute(
+            "SELECT * FROM sync_jobs WHERE status = 'interrupted' AND resumes < ? ORDER BY created_at",
+            (max_resumes,)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim(self, job_id: str, max_resumes: int) -> bool:
+        """Take an interrupted job over for this process; False if another process got it first"""
+        cursor = self._connect().execute(
+            """UPDATE sync_jobs SET status = 'queued', owner = ?, resumes = resumes + 1, finished_at = NULL,
+                   error = NULL
+               WHERE id = ? AND status = 'interrupted' AND resumes < ?""",
+            (_process_owner(), job_id, max_resumes)
+        )
+        return cursor.rowcount == 1
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        rows = self._connect().execute(
+            'SELECT * FROM sync_jobs ORDER BY created_at DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+class SyncJobRunner:
+    """Runs sync jobs one at a time on a background thread"""
+
+    def __init__(self, store: SyncJobStore):
+        self.store = store
+        self._queue = Queue()
+        self._active = {}  # job id -> SyncOrchestrator or Reconciler, for live progress
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._work, name="sync-jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, params: Dict, fetcher) -> Dict:
+        """Queue a sync; an identical sync that is already queued or running is returned instead"""
+        with self._lock:
+            existing = self.store.find_active(params)
+            if existing:
+                return existing
+            job_id = self.store.create(params)
+        self._queue.put((job_id, params, fetcher))
+        print(f"🗂️ Queued sync job {job_id}: {params}")
+        return self.store.get(job_id)
+
+    def resume_interrupted(self, get_fetcher: Callable) -> int:
+        """Claim the jobs an exited process left interrupted and run them again from their checkpoints"""
+        jobs = self.store.resumable(config.SYNC_JOB_MAX_RESUMES)
+        if not jobs:
+            return 0
+        fetcher = get_fetcher()
+        if not fetcher or not fetcher.pinecone_manager:
+            print(f"⚠️ {len(jobs)} interrupted sync jobs cannot be resumed: Contentstack or Pinecone unavailable")
+            return 0
+        resumed = 0
+        for job in jobs:
+            with self._lock:
+                # A job queued again by hand since the interruption already covers this one
+                if self.store.find_active(job['params']) or not self.store.claim(job['id'], config.SYNC_JOB_MAX_RESUMES):
+                    continue
+            params = dict(job['params'])
+            if params.get('mode') == 'full':
+                params['resume'] = True
+            self._queue.put((job['id'], params, fetcher))
+            resumed += 1
+            print(f"🔁 Resuming interrupted sync job {job['id']} (attempt {job['resumes'] + 1})")
+        return resumed
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            runner = self._active.get(job_id)
+        if runner is not None:
+            job['progress'] = runner.progress()
+        return job
+
+    def _work(self):
+        while True:
+            job_id, params, fetcher = self._queue.get()
+            try:
+                self._run(job_id, params, fetcher)
+            except Exception as e:
+                # _run records its own failures; this only guards the worker thread
+                print(f"❌ Sync job {job_id} crashed: {e}")
+
+    def _run(self, job_id: str, params: Dict, fetcher):
+        self.store.update(job_id, status='running', started_at=time.time())
+        print(f"🔄 Running sync job {job_id}...")
+        try:
+            if params.get('mode') == 'delta':
+                result = fetcher.delta_sync_to_pinecone(params['content_type'], reset=params.get('reset', False))
+            else:
+                if params.get('mode') == 'reconcile':
+                    runner = Reconciler(fetcher, params['content_types'], params.get('locales'),
+                                        dry_run=params.get('dry_run', False), force=params.get('force', False))
+                else:
+                    runner = SyncOrchestrator(fetcher, params['content_types'], params.get('locales'),
+                                              resume=params.get('resume', True))
+                with self._lock:
+                    self._active[job_id] = runner
+                stop = threading.Event()
+                monitor = threading.Thread(target=self._record_progress, args=(job_id, runner, stop),
+                                           name=f"sync-job-{job_id}-progress", daemon=True)
+                monitor.start()
+                try:
+                    result = runner.run()
+                finally:
+                    stop.set()
+                    monitor.join()
+                    with self._lock:
+                        self._active.pop(job_id, None)
+                self.store.update(job_id, progress=runner.progress())
+        except Exception as e:
+            print(f"❌ Sync job {job_id} failed: {e}")
+            self.store.update(job_id, status='failed', finished_at=time.time(), error=str(e))
+            return
+        status = 'failed' if result.get('failed_jobs') else 'completed'
+        self.store.update(job_id, status=status, finished_at=time.time(), result=result)
+        print(f"✅ Sync job {job_id} {status}")
+
+    def _record_progress(self, job_id: str, runner, stop: threading.Event):
+        while not stop.wait(_PROGRESS_INTERVAL_SECONDS):
+            try:
+                self.store.update(job_id, progress=runner.progress())
+            except sqlite3.Error as e:
+                print(f"Warning: Could not record sync job progress: {e}")
+
+
+_sync_job_runner = None
+_sync_job_runner_lock = threading.Lock()
+
+
+def get_sync_job_runner() -> SyncJobRunner:
+    """Get or create the process-wide sync job runner"""
+    global _sync_job_runner
+    if _sync_job_runner is None:
+        with _sync_job_runner_lock:
+            if _sync_job_runner is None:
+                _sync_job_runner = SyncJobRunner(SyncJobStore(config.SYNC_JOBS_PATH))
+    return _sync_job_runner
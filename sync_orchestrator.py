@@ -0,0 +1,250 @@
+"""
+Multi content-type, multi-locale sync orchestrator
+
+One run syncs every (content type, locale) pair as its own streaming
+pipeline (sync_pipeline.py). All jobs share one page-fetch pool and one
+embedding pool. Both pools are FairExecutors: each job gets its own FIFO
+queue and workers take tasks from the queues round-robin, so a
+30k-entry content type gets the same share of the pools as a 50-entry one
+instead of queueing everyone behind it.
+
+progress() can be polled from another thread while run() is going; it
+sums what the live pipelines have fetched, embedded and upserted so far.
+Embedding batches wait for in-flight searches first (search_priority.py).
+
+    python sync_orchestrator.py --content-types product,article,faq --locales en-us,fr-fr,de-de
+"""
+import argparse
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from config import config
+from embeddings_generator import encode_texts
+from search_priority import get_search_gate
+from sync_state import get_sync_state
+from synonym_graph import update_mined_terms
+
+
+class FairExecutor:
+    """Thread pool that serves per-key FIFO queues round-robin"""
+
+    def __init__(self, max_workers: int, name: str):
+        self.name = name
+        self._queues: 'OrderedDict[str, deque]' = OrderedDict()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key: str, fn: Callable, *args) -> Future:
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError(f"{self.name} pool is shut down")
+            self._queues.setdefault(key, deque()).append((future, fn, args))
+            self._condition.notify()
+        return future
+
+    def submitter(self, key: str) -> Callable:
+        """A submit(fn, *args) bound to one key, shaped like Executor.submit"""
+        return lambda fn, *args: self.submit(key, fn, *args)
+
+    def _next_task(self):
+        with self._condition:
+            while not self._queues and not self._shutdown:
+                self._condition.wait()
+            if not self._queues:
+                return None
+            # Take from the key at the front, then move that key to the back
+            key, tasks = self._queues.popitem(last=False)
+            task = tasks.popleft()
+            if tasks:
+                self._queues[key] = tasks
+            return task
+
+    def _work(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            future, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+class SyncOrchestrator:
+    def __init__(self, fetcher, content_types: List[str], locales: List[str] = None,
+                 max_parallel_jobs: int = None, resume: bool = True):
+        self.fetcher = fetcher
+        self.resume = resume
+        self.jobs = [
+            (content_type, locale)
+            for content_type in content_types
+            for locale in (locales or [None])
+        ]
+        self.max_parallel_jobs = max_parallel_jobs or config.SYNC_MAX_PARALLEL_JOBS
+        # job key -> (pipeline, resumed from, total entries or None), for progress()
+        self.pipelines = {}
+        self.finished_jobs = 0
+        self.started_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def job_key(content_type: str, locale: Optional[str]) -> str:
+        return f"{content_type}/{locale}" if locale else content_type
+
+    @staticmethod
+    def _encode(texts: List[str]) -> List[List[float]]:
+        # Searches share the embedding model; let in-flight ones finish first
+        get_search_gate().wait_for_idle()
+        return encode_texts(texts)
+
+    def _run_job(self, content_type: str, locale: Optional[str], fetch_pool: FairExecutor,
+                 embed_pool: FairExecutor, run_start: float) -> Dict:
+        key = self.job_key(content_type, locale)
+        started = time.time()
+        pipeline, start = self.fetcher.entry_sync_pipeline(
+            content_type, locale, resume=self.resume,
+            submit=fetch_pool.submitter(key),
+            encode=lambda texts: embed_pool.submit(key, self._encode, texts).result()
+        )
+        total = self.fetcher.count_entries(content_type, locale)
+        with self._lock:
+            self.pipelines[key] = (pipeline, start, total)
+        try:
+            summary = pipeline.run()
+            summary['resumed_from'] = start
+            get_sync_state().clear_checkpoint(content_type, locale)
+            status = 'completed'
+        except Exception as e:
+            print(f"❌ Sync job {key} failed: {e}")
+            summary = {'error': str(e)}
+            status = 'failed'
+        with self._lock:
+            self.finished_jobs += 1
+        return {
+            **summary,
+            'job': key,
+            'content_type': content_type,
+            'locale': locale,
+            'status': status,
+            'queued_seconds': round(started - run_start, 2),
+            'seconds': round(time.time() - started, 2),
+            'term_counts': pipeline.term_counts
+        }
+
+    def run(self) -> Dict:
+        """Run every job and return the per-job timing report"""
+        if not self.fetcher.pinecone_manager:
+            raise ValueError("Pinecone not available, cannot sync")
+
+        run_start = time.time()
+        self.started_at = run_start
+        print(f"🔄 Syncing {len(self.jobs)} jobs ({self.max_parallel_jobs} at a time)...")
+        fetch_pool = FairExecutor(config.CONTENTSTACK_FETCH_WORKERS, 'sync-fetch')
+        embed_pool = FairExecutor(config.SYNC_EMBED_WORKERS, 'sync-embed')
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_parallel_jobs, thread_name_prefix="sync-job") as jobs:
+                futures = [
+                    jobs.submit(self._run_job, content_type, locale, fetch_pool, embed_pool, run_start)
+                    for content_type, locale in self.jobs
+                ]
+                reports = [future.result() for future in futures]
+        finally:
+            fetch_pool.shutdown()
+            embed_pool.shutdown()
+
+        # Collect catalog terms for the offline synonym table (synonym_graph.py)
+        term_counts = Counter()
+        for report in reports:
+            term_counts.update(report.pop('term_counts'))
+        try:
+            update_mined_terms([], counts=term_counts)
+        except Exception as e:
+            print(f"Warning: Could not update mined terms: {e}")
+
+        for report in reports:
+            print(f"   {report['job']}: {report['status']}, {report.get('upserted', 0)}/{report.get('entries', 0)} "
+                  f"entries in {report['seconds']}s (queued {report['queued_seconds']}s)")
+        return {
+            'jobs': reports,
+            'entries': sum(report.get('entries', 0) for report in reports),
+            'upserted': sum(report.get('upserted', 0) for report in reports),
+            'failed_jobs': sum(1 for report in reports if report['status'] == 'failed'),
+            'seconds': round(time.time() - run_start, 2)
+        }
+
+    def progress(self) -> Dict:
+        """Entries fetched, embedded and upserted so far across all jobs, with throughput and ETA"""
+        with self._lock:
+            pipelines = list(self.pipelines.values())
+            finished_jobs = self.finished_jobs
+        fetched = sum(pipeline.fetch_stats.items for pipeline, _, _ in pipelines)
+        embedded = sum(pipeline.embed_stats.items for pipeline, _, _ in pipelines)
+        upserted = sum(pipeline.upserted for pipeline, _, _ in pipelines)
+        resumed = sum(start for _, start, _ in pipelines)
+        # Unknown until every job has started and counted its entries
+        known = len(pipelines) == len(self.jobs) and all(total is not None for _, _, total in pipelines)
+        total = sum(total - start for _, start, total in pipelines) if known else None
+
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        rate = embedded / elapsed if elapsed else 0.0
+        eta = None
+        if total is not None and rate:
+            eta = round(max(0, total - embedded) / rate, 1)
+        return {
+            'jobs': len(self.jobs),
+            'finished_jobs': finished_jobs,
+            'total': total,
+            'resumed_from': resumed,
+            'fetched': fetched,
+            'embedded': embedded,
+            'upserted': upserted,
+            'elapsed_seconds': round(elapsed, 1),
+            'entries_per_second': round(rate, 1),
+            'eta_seconds': eta
+        }
+
+
+def parse_list(value: str) -> List[str]:
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def main():
+    from contentstack_fetcher import ContentstackFetcher
+
+    parser = argparse.ArgumentParser(description="Sync several content types and locales in one run")
+    parser.add_argument('--content-types', default=config.SYNC_CONTENT_TYPES)
+    parser.add_argument('--locales', default=config.SYNC_LOCALES, help="Comma-separated; empty uses the stack default")
+    parser.add_argument('--parallel-jobs', type=int, default=config.SYNC_MAX_PARALLEL_JOBS)
+    parser.add_argument('--restart', action='store_true', help="Ignore checkpoints of interrupted syncs")
+    args = parser.parse_args()
+
+    orchestrator = SyncOrchestrator(
+        ContentstackFetcher(), parse_list(args.content_types), parse_list(args.locales), args.parallel_jobs,
+        resume=not args.restart
+    )
+    summary = orchestrator.run()
+    print(f"✅ Synced {summary['upserted']}/{summary['entries']} entries across {len(summary['jobs'])} jobs "
+          f"in {summary['seconds']}s ({summary['failed_jobs']} failed)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Streaming fetch -> embed -> upsert pipeline for full syncs
+
+Three stages run on their own threads and hand batches over bounded queues:
+
+    page fetcher --(pages)--> batch encoder --(vectors)--> batch upserter
+
+A full queue blocks the stage feeding it, so memory is bounded by the queue
+sizes and batch sizes rather than the catalog size, and Pinecone upserts
+overlap with encoding. With upsert_workers, several upsert batches are in
+flight at once. Each stage reports its throughput and the depth of the
+queue it reads from.
+
+Entries keep their order through the stages, so after each upsert batch the
+pipeline can report (via on_progress) how many leading entries are fully
+done, which is what resumable syncs checkpoint.
+"""
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
+from config import config
+from embeddings_generator import encode_texts, product_embedding_text
+from synonym_graph import count_terms
+
+_DONE = object()
+
+
+class StageStats:
+    """Items processed, busy time and input queue depth of one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.max_depth = 0
+
+    def sample_depth(self, depth: int):
+        self.depth_total += depth
+        self.depth_samples += 1
+        self.max_depth = max(self.max_depth, depth)
+
+    def add(self, items: int, seconds: float):
+        self.items += items
+        self.batches += 1
+        self.busy_seconds += seconds
+
+    def stats(self) -> Dict:
+        return {
+            'items': self.items,
+            'batches': self.batches,
+            'busy_seconds': round(self.busy_seconds, 2),
+            'items_per_second': round(self.items / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            'avg_queue_depth': round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0.0,
+            'max_queue_depth': self.max_depth
+        }
+
+
+class SyncPipeline:
+    def __init__(self, pages: Iterable[List[Dict]], build_metadata: Callable[[Dict], Dict],
+                 upsert: Callable[[List[Dict]], int], embed_batch_size: int = None,
+                 upsert_batch_size: int = None, queue_size: int = None,
+                 encode: Callable[[List[str]], List[List[float]]] = None,
+                 vector_id: Callable[[Dict], str] = None, prepare: Callable[[List[Dict]], None] = None,
+                 on_progress: Callable[[int, List[str]], None] = None,
+                 text: Callable[[Dict], str] = None, upsert_workers: int = 1):
+        self.pages = pages
+        self.build_metadata = build_metadata
+        self.upsert = upsert
+        self.encode = encode or encode_texts
+        self.text = text or product_embedding_text
+        self.vector_id = vector_id or (lambda entry: entry['uid'])
+        self.prepare = prepare
+        self.on_progress = on_progress
+        self.embed_batch_size = embed_batch_size or config.SYNC_EMBED_BATCH_SIZE
+        self.upsert_batch_size = upsert_batch_size or config.SYNC_UPSERT_BATCH_SIZE
+        # Upsert batches in flight at once; upsert must be thread-safe when this is above 1
+        self.upsert_workers = max(1, upsert_workers)
+        queue_size = queue_size or config.SYNC_QUEUE_SIZE
+
+        self.page_queue = queue.Queue(maxsize=queue_size)
+        self.vector_queue = queue.Queue(maxsize=queue_size)
+        self.fetch_stats = StageStats('fetch')
+        self.embed_stats = StageStats('embed')
+        self.upsert_stats = StageStats('upsert')
+        self.term_counts = Counter()
+        self.skipped = 0
+        self.upserted = 0
+        self._progress_stalled = False
+        self._errors = []
+        self._failed = threading.Event()
+
+    def _put(self, q: queue.Queue, item):
+        """Blocking put that gives up once another stage has failed"""
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue, stats: StageStats):
+        while not self._failed.is_set():
+            stats.sample_depth(q.qsize())
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _run_stage(self, stage: Callable[[], None]):
+        try:
+            stage()
+        except Exception as e:
+            print(f"❌ Sync pipeline stage failed: {e}")
+            self._errors.append(e)
+            self._failed.set()
+
+    def _fetch(self):
+        pages = iter(self.pages)
+        while not self._failed.is_set():
+            start = time.time()
+            page = next(pages, None)
+            if page is None:
+                break
+            self.fetch_stats.add(len(page), time.time() - start)
+            if page:
+                self._put(self.page_queue, page)
+        self._put(self.page_queue, _DONE)
+
+    def _encode_batch(self, entries: List[Dict]) -> List[Dict]:
+        if self.prepare:
+            # e.g. resolve the batch's references with one request per referenced content type
+            self.prepare(entries)
+        texts = [self.text(entry) for entry in entries]
+        embeddable = [(entry, text) for entry, text in zip(entries, texts) if entry.get('uid') and text]
+        self.skipped += len(entries) - len(embeddable)
+        count_terms(texts, self.term_counts)
+        if not embeddable:
+            return []
+
+        embeddings = self.encode([text for _, text in embeddable])
+        return [
+            {'id': self.vector_id(entry), 'values': embedding, 'metadata': self.build_metadata(entry)}
+            for (entry, _), embedding in zip(embeddable, embeddings)
+        ]
+
+    def _embed(self):
+        pending_entries = []
+        pending_vectors = []
+        # (vectors pending when the batch finished, entries consumed so far, the batch's uids)
+        marks = []
+        consumed = 0
+
+        def flush(count: int):
+            """Queue the first count pending vectors with the progress of the batches they finish"""
+            nonlocal pending_vectors
+            done = [mark for mark in marks if mark[0] <= count]
+            del marks[:len(done)]
+            marks[:] = [(vectors - count, through, uids) for vectors, through, uids in marks]
+            progress = (done[-1][1], [uid for _, _, uids in done for uid in uids]) if done else None
+            self._put(self.vector_queue, (pending_vectors[:count], progress))
+            pending_vectors = pending_vectors[count:]
+
+        while True:
+            page = self._get(self.page_queue, self.embed_stats)
+            if page is not _DONE:
+                pending_entries.extend(page)
+            # Encode full batches as they fill, and whatever is left at the end
+            while len(pending_entries) >= self.embed_batch_size or (page is _DONE and pending_entries):
+                batch = pending_entries[:self.embed_batch_size]
+                pending_entries = pending_entries[self.embed_batch_size:]
+                start = time.time()
+                pending_vectors.extend(self._encode_batch(batch))
+                self.embed_stats.add(len(batch), time.time() - start)
+                consumed += len(batch)
+                marks.append((len(pending_vectors), consumed, [entry['uid'] for entry in batch if entry.get('uid')]))
+
+                while len(pending_vectors) >= self.upsert_batch_size:
+                    flush(self.upsert_batch_size)
+            if page is _DONE:
+                break
+        if pending_vectors or marks:
+            flush(len(pending_vectors))
+        self._put(self.vector_queue, _DONE)
+
+    def _timed_upsert(self, vectors: List[Dict]):
+        start = time.time()
+        return self.upsert(vectors), time.time() - start
+
+    def _upsert(self):
+        # Up to upsert_workers batches are in flight; they are settled in order so progress stays ordered
+        executor = None
+        if self.upsert_workers > 1:
+            executor = ThreadPoolExecutor(max_workers=self.upsert_workers, thread_name_prefix="sync-upsert-batch")
+        in_flight = deque()
+
+        def settle():
+            future, vectors, progress = in_flight.popleft()
+            if future is not None:
+                upserted, seconds = future.result()
+                self.upserted += upserted
+                self.upsert_stats.add(len(vectors), seconds)
+                if upserted < len(vectors):
+                    # Never checkpoint past a batch that did not fully land
+                    self._progress_stalled = True
+            if progress and self.on_progress and not self._progress_stalled:
+                self.on_progress(*progress)
+
+        try:
+            while True:
+                item = self._get(self.vector_queue, self.upsert_stats)
+                if item is _DONE:
+                    break
+                vectors, progress = item
+                future = None
+                if vectors:
+                    if executor is not None:
+                        future = executor.submit(self._timed_upsert, vectors)
+                    else:
+                        future = Future()
+                        future.set_result(self._timed_upsert(vectors))
+                in_flight.append((future, vectors, progress))
+                while len(in_flight) >= self.upsert_workers:
+                    settle()
+            while in_flight:
+                settle()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def run(self) -> Dict:
+        """Run all stages to completion and return the per-stage report"""
+        start = time.time()
+        threads = [
+            threading.Thread(target=self._run_stage, args=(stage,), name=f"sync-{name}", daemon=True)
+            for name, stage in (('fetch', self._fetch), ('embed', self._embed), ('upsert', self._upsert))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+        return {
+            'entries': self.fetch_stats.items,
+            'skipped': self.skipped,
+            'upserted': self.upserted,
+            'seconds': round(time.time() - start, 2),
+            'stages': {
+                stats.name: stats.stats()
+                for stats in (self.fetch_stats, self.embed_stats, self.upsert_stats)
+            }
+        }
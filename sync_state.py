@@ -0,0 +1,143 @@
+"""
+State for incremental (delta) syncs and resumable full syncs
+
+Stores the Contentstack Sync API token per environment and content type in a
+small JSON file, written atomically so an interrupted sync never leaves a
+half-written token behind. collapse_sync_items() turns a batch of Sync API
+events into the entries to upsert and the vector ids to delete, keyed by
+vector_id() so each locale of an entry is tracked on its own.
+
+The same file holds full sync checkpoints: per content type and locale, the
+entry offset every entry before which has been upserted, plus an
+order-independent hash of those uids so a resumed run can check that the
+entries before the offset are still the same ones.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import config
+
+
+def vector_id(entry_uid: str, locale: str = None) -> str:
+    """Pinecone id of an entry: the bare uid in the default locale, uid:locale in the others"""
+    if not locale or locale == config.CONTENTSTACK_DEFAULT_LOCALE:
+        return entry_uid
+    return f"{entry_uid}:{locale}"
+
+
+def collapse_sync_items(items: List[Dict], content_type: str) -> Tuple[Dict[str, Dict], Set[str]]:
+    """Reduce Sync API items to (entries to upsert by vector id, vector ids to delete)"""
+    published = {}
+    removed = set()
+    # Items are in event order, so the last event for an entry and locale decides its fate
+    for item in items:
+        data = item.get('data') or {}
+        if not data.get('uid') or item.get('content_type_uid', content_type) != content_type:
+            continue
+        key = vector_id(data['uid'], data.get('locale'))
+        if item.get('type') == 'entry_published':
+            published[key] = data
+            removed.discard(key)
+        elif item.get('type') in ('entry_unpublished', 'entry_deleted'):
+            published.pop(key, None)
+            removed.add(key)
+    return published, removed
+
+
+def uid_set_hash(uids: Iterable[str], initial: str = None) -> str:
+    """XOR of per-uid digests: the same for the same set in any order, and extendable batch by batch"""
+    value = int(initial, 16) if initial else 0
+    for uid in uids:
+        value ^= int.from_bytes(hashlib.blake2b(uid.encode('utf-8'), digest_size=8).digest(), 'big')
+    return f"{value:016x}"
+
+
+class SyncState:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content_type: str, environment: str = None) -> str:
+        return f"{environment or config.CONTENTSTACK_ENVIRONMENT}:{content_type}"
+
+    def _load(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read sync state from {self.path}: {e}")
+            return {}
+
+    def _write(self, state: Dict):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get_sync_token(self, content_type: str) -> Optional[str]:
+        """Token to resume from, or None if the content type was never synced"""
+        with self._lock:
+            return self._load().get(self.make_key(content_type), {}).get('sync_token')
+
+    def set_sync_token(self, content_type: str, sync_token: str, **details):
+        """Persist the token reached by a completed sync"""
+        with self._lock:
+            state = self._load()
+            state[self.make_key(content_type)] = {'sync_token': sync_token, 'synced_at': time.time(), **details}
+            self._write(state)
+
+    def checkpoint_key(self, content_type: str, locale: str = None) -> str:
+        return f"checkpoint:{self.make_key(content_type)}:{locale or ''}"
+
+    def get_checkpoint(self, content_type: str, locale: str = None) -> Optional[Dict]:
+        """Progress of an unfinished full sync, or None"""
+        with self._lock:
+            return self._load().get(self.checkpoint_key(content_type, locale))
+
+    def set_checkpoint(self, content_type: str, locale: str, offset: int, uid_hash: str, **details):
+        """Record that every entry before offset has been upserted"""
+        with self._lock:
+            state = self._load()
+            key = self.checkpoint_key(content_type, locale)
+            started_at = state.get(key, {}).get('started_at', time.time())
+            state[key] = {
+                'content_type': content_type,
+                'locale': locale,
+                'offset': offset,
+                'uid_hash': uid_hash,
+                'started_at': started_at,
+                'updated_at': time.time(),
+                **details
+            }
+            self._write(state)
+
+    def clear_checkpoint(self, content_type: str, locale: str = None):
+        """Drop the checkpoint once a full sync completes"""
+        with self._lock:
+            state = self._load()
+            if state.pop(self.checkpoint_key(content_type, locale), None) is not None:
+                self._write(state)
+
+    def clear(self, content_type: str):
+        """Forget the token so the next delta sync starts with a full initial sync"""
+        with self._lock:
+            state = self._load()
+            if state.pop(self.make_key(content_type), None) is not None:
+                self._write(state)
+
+
+_sync_state = None
+
+
+def get_sync_state() -> SyncState:
+    global _sync_state
+    if _sync_state is None:
+        _sync_state = SyncState(config.SYNC_STATE_PATH)
+    return _sync_state
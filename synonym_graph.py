@@ -0,0 +1,202 @@
+"""
+Catalog-derived synonym graph for offline query expansion
+
+Build step (offline): take the catalog vocabulary (vocabulary.json plus terms
+mined during sync), embed every term once with the MiniLM model and keep each
+term's top-k nearest neighbours as a compact JSON table:
+
+    python synonym_graph.py --output synonym_table.json --top-k 5
+
+Query step (online): SynonymTable.expand() swaps in-vocabulary query terms for
+their neighbours, which takes microseconds and needs no network access.
+"""
+import argparse
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import config
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9\-']*")
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'into', 'is', 'it',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with', 'your', 'our'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with trailing punctuation stripped"""
+    return [token.strip("-'") for token in _TOKEN.findall(text.lower()) if token.strip("-'")]
+
+
+def is_indexable_term(term: str) -> bool:
+    return len(term) > 1 and term not in STOPWORDS and not term.isdigit()
+
+
+def count_terms(texts: Iterable[str], counts: Counter = None) -> Counter:
+    """Count indexable terms in catalog text, adding to counts if given"""
+    counts = Counter() if counts is None else counts
+    for text in texts:
+        counts.update(term for term in tokenize(text) if is_indexable_term(term))
+    return counts
+
+
+def update_mined_terms(texts: Iterable[str], path: str = None, counts: Counter = None):
+    """Add term counts from catalog text (or precomputed counts) to the mined terms file (called during sync)"""
+    path = path or config.MINED_TERMS_PATH
+    if not path:
+        return
+
+    new_counts = count_terms(texts, counts)
+    # Sync jobs in several worker processes add to the same file; the lock keeps their updates from interleaving
+    with open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        counts = Counter()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    counts.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Could not read mined terms from {path}: {e}")
+        counts.update(new_counts)
+
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp',
+                                        dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(counts), f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def load_vocabulary(vocabulary_path: str, mined_terms_path: str = None, min_count: int = 1) -> List[str]:
+    """Collect the normalized, de-duplicated term list to embed"""
+    terms = set()
+    if vocabulary_path and os.path.exists(vocabulary_path):
+        with open(vocabulary_path, 'r') as f:
+            for raw in json.load(f):
+                terms.update(term for term in tokenize(raw) if is_indexable_term(term))
+
+    if mined_terms_path and os.path.exists(mined_terms_path):
+        with open(mined_terms_path, 'r') as f:
+            for term, count in json.load(f).items():
+                if count >= min_count and is_indexable_term(term):
+                    terms.add(term)
+
+    return sorted(terms)
+
+
+def build_synonym_table(terms: List[str], top_k: int = 5, min_similarity: float = 0.5,
+                        block_size: int = 1024) -> Dict[str, List[Tuple[str, float]]]:
+    """Embed every term once and keep its top-k nearest neighbours"""
+    import numpy as np
+    from embeddings_generator import encode_texts
+
+    if len(terms) < 2:
+        return {}
+
+    vectors = []
+    for i in range(0, len(terms), 256):
+        vectors.extend(encode_texts(terms[i:i + 256]))
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    k = min(top_k, len(terms) - 1)
+    table = {}
+    # Row blocks keep the similarity matrix memory at block_size x len(terms)
+    for start in range(0, len(terms), block_size):
+        scores = matrix[start:start + block_size] @ matrix.T
+        for row, term_index in enumerate(range(start, min(start + block_size, len(terms)))):
+            scores[row, term_index] = -1.0  # never a neighbour of itself
+            top = np.argpartition(-scores[row], k - 1)[:k]
+            top = top[np.argsort(-scores[row, top])]
+            neighbours = [
+                (terms[j], round(float(scores[row, j]), 3))
+                for j in top if scores[row, j] >= min_similarity
+            ]
+            if neighbours:
+                table[terms[term_index]] = neighbours
+    return table
+
+
+class SynonymTable:
+    def __init__(self, path: str):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        self.path = path
+        self.neighbours: Dict[str, List[Tuple[str, float]]] = {
+            term: [tuple(pair) for pair in pairs] for term, pairs in data.get('terms', {}).items()
+        }
+
+    def __len__(self):
+        return len(self.neighbours)
+
+    def expand(self, query: str, num_expansions: int) -> List[str]:
+        """Variants of the query with one in-vocabulary term swapped for a neighbour, best first"""
+        tokens = tokenize(query)
+        candidates = []
+        for i, token in enumerate(tokens):
+            for neighbour, score in self.neighbours.get(token, []):
+                variant = ' '.join(tokens[:i] + [neighbour] + tokens[i + 1:])
+                candidates.append((score, variant))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        expansions = []
+        for _, variant in candidates:
+            if variant not in expansions:
+                expansions.append(variant)
+            if len(expansions) >= num_expansions:
+                break
+        return expansions
+
+
+_synonym_table = None
+_synonym_table_lock = threading.Lock()
+
+
+def get_synonym_table() -> Optional[SynonymTable]:
+    """Load the synonym table once (None if it has not been built)"""
+    global _synonym_table
+    if _synonym_table is None and config.SYNONYM_TABLE_PATH and os.path.exists(config.SYNONYM_TABLE_PATH):
+        with _synonym_table_lock:
+            if _synonym_table is None:
+                try:
+                    _synonym_table = SynonymTable(config.SYNONYM_TABLE_PATH)
+                    print(f"Loaded synonym table with {len(_synonym_table)} terms")
+                except (OSError, ValueError) as e:
+                    print(f"Could not load synonym table: {e}")
+    return _synonym_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the catalog synonym table for local query expansion")
+    parser.add_argument('--vocabulary', default='vocabulary.json')
+    parser.add_argument('--mined', default=config.MINED_TERMS_PATH)
+    parser.add_argument('--min-count', type=int, default=2, help="Minimum occurrences for a mined term")
+    parser.add_argument('--output', default=config.SYNONYM_TABLE_PATH or 'synonym_table.json')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--min-similarity', type=float, default=0.5)
+    args = parser.parse_args()
+
+    terms = load_vocabulary(args.vocabulary, args.mined, args.min_count)
+    print(f"🔤 Embedding {len(terms)} terms...")
+    table = build_synonym_table(terms, top_k=args.top_k, min_similarity=args.min_similarity)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'model': 'sentence-transformers/all-MiniLM-L6-v2',
+            'top_k': args.top_k,
+            'min_similarity': args.min_similarity,
+            'terms': table
+        }, f, separators=(',', ':'))
+    print(f"✅ Wrote {len(table)} terms with neighbours to {args.output}")
+
+if __name__ == "__main__":
+    main()
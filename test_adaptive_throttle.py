@@ -0,0 +1,105 @@
+import asyncio
+
+from adaptive_throttle import AdaptiveThrottler
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def make_throttler(concurrency=2, max_retries=2):
+    return AdaptiveThrottler('test', initial_rate=1000, max_rate=0, initial_concurrency=concurrency,
+                             max_concurrency=concurrency, max_retries=max_retries, backoff_seconds=0.01)
+
+
+def test_errors_release_their_slot():
+    """A request that raises gives its concurrency slot back"""
+    print("🔍 Testing slot release on errors...")
+    throttler = make_throttler(concurrency=1)
+
+    def broken():
+        raise ValueError("bad response body")
+
+    for _ in range(3):
+        try:
+            throttler.request(broken)
+            raise AssertionError("the error should reach the caller")
+        except ValueError:
+            pass
+    assert throttler.in_flight == 0, throttler.stats()
+    # With one slot, a leaked slot would block this request forever
+    assert throttler.request(FakeResponse).status_code == 200
+    print("   ✅ Three failed requests left no slot taken")
+
+
+def test_exhausted_retries_release_their_slot():
+    print("🔍 Testing slot release after the last retry...")
+    throttler = make_throttler(concurrency=1, max_retries=2)
+    attempts = []
+
+    def unreachable():
+        attempts.append(1)
+        raise ConnectionError("connection refused")
+
+    try:
+        throttler.request(unreachable, retry_exceptions=(ConnectionError,))
+        raise AssertionError("the error should reach the caller once retries run out")
+    except ConnectionError:
+        pass
+    assert len(attempts) == 3 and throttler.in_flight == 0, throttler.stats()
+    print(f"   ✅ Gave up after {len(attempts)} attempts with no slot taken")
+
+
+def test_cancelled_async_requests_release_their_slot():
+    print("🔍 Testing slot release on cancellation...")
+    throttler = make_throttler(concurrency=1)
+
+    async def run():
+        async def slow():
+            await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(throttler.request_async(slow))
+        await asyncio.sleep(0.05)
+        assert throttler.in_flight == 1
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        async def ok():
+            return FakeResponse()
+
+        return await asyncio.wait_for(throttler.request_async(ok), timeout=1.0)
+
+    assert asyncio.run(run()).status_code == 200
+    assert throttler.in_flight == 0, throttler.stats()
+    print("   ✅ A cancelled request freed its slot")
+
+
+def test_429_halves_the_limits_and_is_retried():
+    print("🔍 Testing 429 handling...")
+    throttler = make_throttler(concurrency=4)
+    rate = throttler.rate
+    responses = [FakeResponse(429, {'Retry-After': '0'}), FakeResponse(200)]
+
+    response = throttler.request(lambda: responses.pop(0))
+    stats = throttler.stats()
+    assert response.status_code == 200 and stats['throttled'] == 1 and stats['retries'] == 1, stats
+    assert stats['rate'] < rate and stats['concurrency'] < 4, stats
+    assert stats['in_flight'] == 0, stats
+    print(f"   ✅ Retried the 429; rate {rate:.0f} -> {stats['rate']}, concurrency 4 -> {stats['concurrency']}")
+
+
+def main():
+    print("🧪 Running adaptive throttle tests")
+    test_errors_release_their_slot()
+    test_exhausted_retries_release_their_slot()
+    test_cancelled_async_requests_release_their_slot()
+    test_429_halves_the_limits_and_is_retried()
+    print("🎉 All adaptive throttle tests passed!")
+
+if __name__ == "__main__":
+    main()
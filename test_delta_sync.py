@@ -0,0 +1,145 @@
+import os
+import tempfile
+
+# Point the fetcher at the local stub before config is imported
+os.environ.setdefault('CONTENTSTACK_STACK_API_KEY', 'stub_api_key')
+os.environ.setdefault('CONTENTSTACK_DELIVERY_TOKEN', 'stub_delivery_token')
+os.environ['SYNC_STATE_PATH'] = os.path.join(tempfile.mkdtemp(), 'sync_state.json')
+
+from contentstack_stub_server import StubStack, start_stub_server
+
+stack = StubStack(page_size=3)
+server = start_stub_server(stack)
+os.environ['CONTENTSTACK_API_BASE_URL'] = f"http://127.0.0.1:{server.server_port}/v3"
+
+from config import config
+from contentstack_fetcher import ContentstackFetcher, vector_id
+
+
+class RecordingPinecone:
+    """Records upserts and deletes instead of calling Pinecone"""
+
+    def __init__(self, fail_deletes=False):
+        self.upserted = []
+        self.deleted = []
+        self.fail_deletes = fail_deletes
+
+    def upsert_embeddings(self, embeddings_data, metadata=None):
+        self.upserted.extend(embeddings_data.keys())
+        return {'upserted': len(embeddings_data), 'failed': 0, 'errors': []}
+
+    def delete_products(self, product_ids):
+        if self.fail_deletes:
+            return 0
+        self.deleted.extend(product_ids)
+        return len(product_ids)
+
+
+def make_fetcher():
+    fetcher = ContentstackFetcher()
+    fetcher.pinecone_manager = RecordingPinecone()
+    # Skip the embedding model; the sync logic only needs one vector per entry
+    fetcher.build_entry_vectors = lambda entries, content_type: (
+        {vector_id(entry['uid'], entry.get('locale')): [0.0] for entry in entries},
+        {vector_id(entry['uid'], entry.get('locale')): {'content_type': content_type} for entry in entries}
+    )
+    return fetcher
+
+
+def test_initial_sync_pages_through_everything():
+    """An initial sync upserts every published entry and stores a token"""
+    print("🔍 Testing initial sync...")
+    for i in range(7):
+        stack.publish('product', {'uid': f'p{i}', 'title': f'Product {i}'})
+    stack.publish('blog', {'uid': 'b0', 'title': 'Not a product'})
+
+    fetcher = make_fetcher()
+    summary = fetcher.delta_sync_to_pinecone('product')
+    assert summary['mode'] == 'initial', summary
+    assert sorted(fetcher.pinecone_manager.upserted) == [f'p{i}' for i in range(7)]
+    print(f"   ✅ Initial sync upserted {summary['upserted']} entries")
+
+
+def test_delta_sync_applies_only_changes():
+    """A later sync only sees entries published, unpublished or deleted since the token"""
+    print("🔍 Testing delta sync...")
+    stack.publish('product', {'uid': 'p1', 'title': 'Product 1 (edited)'})
+    stack.publish('product', {'uid': 'p7', 'title': 'Product 7'})
+    stack.unpublish('product', 'p2')
+    stack.unpublish('product', 'p3', deleted=True)
+    stack.publish('product', {'uid': 'p8', 'title': 'Product 8'})
+    stack.unpublish('product', 'p8', deleted=True)
+    stack.publish('blog', {'uid': 'b1', 'title': 'Still not a product'})
+
+    fetcher = make_fetcher()
+    summary = fetcher.delta_sync_to_pinecone('product')
+    assert summary['mode'] == 'delta', summary
+    assert sorted(fetcher.pinecone_manager.upserted) == ['p1', 'p7']
+    assert sorted(fetcher.pinecone_manager.deleted) == ['p2', 'p3', 'p8']
+    assert summary['upserted'] == 2 and summary['deleted'] == 3, summary
+    print(f"   ✅ Delta sync upserted {summary['upserted']} and deleted {summary['deleted']} entries")
+
+
+def test_delta_sync_without_changes_is_a_no_op():
+    print("🔍 Testing delta sync with no changes...")
+    fetcher = make_fetcher()
+    summary = fetcher.delta_sync_to_pinecone('product')
+    assert summary['items'] == 0, summary
+    assert not fetcher.pinecone_manager.upserted and not fetcher.pinecone_manager.deleted
+    print("   ✅ Nothing to apply")
+
+
+def test_failed_deletes_keep_the_old_token():
+    """Removals that did not reach Pinecone are retried by the next delta sync"""
+    print("🔍 Testing failed deletes...")
+    stack.unpublish('product', 'p0')
+
+    fetcher = make_fetcher()
+    fetcher.pinecone_manager = RecordingPinecone(fail_deletes=True)
+    try:
+        fetcher.delta_sync_to_pinecone('product')
+        raise AssertionError("delta sync should fail when deletes fail")
+    except RuntimeError:
+        pass
+
+    fetcher = make_fetcher()
+    summary = fetcher.delta_sync_to_pinecone('product')
+    assert fetcher.pinecone_manager.deleted == ['p0'], fetcher.pinecone_manager.deleted
+    print(f"   ✅ Retried {summary['deleted']} removal after a failed delete")
+
+
+def test_locales_of_an_entry_sync_independently():
+    """Unpublishing one locale of an entry deletes only that locale's vector"""
+    print("🔍 Testing multi-locale delta sync...")
+    stack.publish('product', {'uid': 'p9', 'title': 'Product 9'})
+    stack.publish('product', {'uid': 'p9', 'title': 'Produit 9', 'locale': 'fr-fr'})
+    stack.unpublish('product', 'p9', locale='fr-fr')
+
+    fetcher = make_fetcher()
+    fetcher.delta_sync_to_pinecone('product')
+    assert fetcher.pinecone_manager.upserted == ['p9'], fetcher.pinecone_manager.upserted
+    assert fetcher.pinecone_manager.deleted == ['p9:fr-fr'], fetcher.pinecone_manager.deleted
+    print("   ✅ Kept the default locale and deleted only fr-fr")
+
+
+def test_reset_starts_a_new_initial_sync():
+    print("🔍 Testing reset...")
+    fetcher = make_fetcher()
+    summary = fetcher.delta_sync_to_pinecone('product', reset=True)
+    assert summary['mode'] == 'initial', summary
+    assert sorted(fetcher.pinecone_manager.upserted) == ['p1', 'p4', 'p5', 'p6', 'p7', 'p9']
+    print(f"   ✅ Reset re-synced {summary['upserted']} published entries")
+
+
+def main():
+    print(f"🧪 Running delta sync tests against {config.CONTENTSTACK_API_BASE_URL}")
+    test_initial_sync_pages_through_everything()
+    test_delta_sync_applies_only_changes()
+    test_delta_sync_without_changes_is_a_no_op()
+    test_failed_deletes_keep_the_old_token()
+    test_locales_of_an_entry_sync_independently()
+    test_reset_starts_a_new_initial_sync()
+    print("🎉 All delta sync tests passed!")
+
+if __name__ == "__main__":
+    main()
@@ -12,9 +12,9 @@ def test_pinecone_search():
     try:
         sync_response = requests.post('http://localhost:5000/sync', timeout=30)
         print(f"Sync Status: {sync_response.status_code}")
-        if sync_response.status_code == 200:
+        if sync_response.status_code == 202:
             sync_data = sync_response.json()
-            print(f"✅ Sync successful: {sync_data}")
+            print(f"✅ Sync queued: {sync_data}")
         else:
             print(f"⚠️ Sync response: {sync_response.text}")
     except Exception as e:
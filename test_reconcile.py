@@ -0,0 +1,117 @@
+import os
+import tempfile
+
+# Point the fetcher at the local stub before config is imported
+os.environ.setdefault('CONTENTSTACK_STACK_API_KEY', 'stub_api_key')
+os.environ.setdefault('CONTENTSTACK_DELIVERY_TOKEN', 'stub_delivery_token')
+os.environ['SYNC_STATE_PATH'] = os.path.join(tempfile.mkdtemp(), 'sync_state.json')
+
+from contentstack_stub_server import StubStack, start_stub_server
+
+stack = StubStack()
+server = start_stub_server(stack)
+os.environ['CONTENTSTACK_API_BASE_URL'] = f"http://127.0.0.1:{server.server_port}/v3"
+
+from config import config
+from contentstack_fetcher import ContentstackFetcher, vector_id
+from reconcile import Reconciler
+
+
+class RecordingIndex:
+    """An in-memory namespace: vector ids with their metadata, recording deletes"""
+
+    def __init__(self, metadata):
+        self.metadata = dict(metadata)
+        self.deleted = []
+
+    def iter_vector_ids(self, namespace=None):
+        ids = sorted(self.metadata)
+        for i in range(0, len(ids), 100):
+            yield ids[i:i + 100]
+
+    def fetch_metadata(self, ids, namespace=None):
+        return {value: self.metadata[value] for value in ids if value in self.metadata}
+
+    def delete_products(self, product_ids, batch_size=1000, namespace=None):
+        for value in product_ids:
+            self.metadata.pop(value, None)
+        self.deleted.extend(product_ids)
+        return len(product_ids)
+
+    def upsert_vectors(self, vectors, batch_size=100, namespace=None):
+        raise AssertionError(f"nothing should be missing, got {[vector['id'] for vector in vectors]}")
+
+
+def indexed(content_type, uid, locale=None):
+    """An index entry for an entry as a sync writes it"""
+    return vector_id(uid, locale), {
+        'entry_uid': uid,
+        'content_type': content_type,
+        'locale': locale or config.CONTENTSTACK_DEFAULT_LOCALE
+    }
+
+
+def make_fetcher(metadata):
+    fetcher = ContentstackFetcher()
+    fetcher.pinecone_manager = RecordingIndex(metadata)
+    return fetcher
+
+
+def test_only_stale_vectors_of_the_reconciled_scope_are_deleted():
+    """Vectors of other content types and locales are left alone"""
+    print("🔍 Testing scoped stale deletes...")
+    for i in range(5):
+        stack.publish('product', {'uid': f'p{i}', 'title': f'Product {i}'})
+    stack.publish('article', {'uid': 'a1', 'title': 'Article 1'})
+
+    fetcher = make_fetcher(dict(
+        [indexed('product', f'p{i}') for i in range(5)] + [
+            indexed('product', 'p9'),               # unpublished without a webhook
+            indexed('product', 'p1', 'fr-fr'),      # another locale
+            indexed('article', 'a1'),               # another content type
+            indexed('article', 'a2')                # stale, but not being reconciled
+        ]
+    ))
+    summary = Reconciler(fetcher, ['product']).run()
+    assert fetcher.pinecone_manager.deleted == ['p9'], fetcher.pinecone_manager.deleted
+    assert summary['out_of_scope'] == 3, summary
+    print(f"   ✅ Deleted {summary['deleted']} stale vector, left {summary['out_of_scope']} out of scope")
+
+
+def test_entries_skipped_by_shifting_pages_are_kept():
+    """A live entry the offset listing missed is re-checked by uid and not deleted"""
+    print("🔍 Testing page shift during listing...")
+    for i in range(150):
+        stack.publish('shoe', {'uid': f's{i:03d}', 'title': f'Shoe {i}'})
+
+    # Unpublishing s000 once the first page is served moves s100 onto the first page
+    list_entries = stack.list_entries
+
+    def shifting_list_entries(content_type, skip, limit, locale=None, uids=None):
+        page = list_entries(content_type, skip, limit, locale, uids)
+        if content_type == 'shoe' and skip == 0 and uids is None and stack.unpublish('shoe', 's000'):
+            print("   ↪️ Unpublished s000 between pages")
+        return page
+
+    stack.list_entries = shifting_list_entries
+    try:
+        fetcher = make_fetcher(dict(
+            [indexed('shoe', f's{i:03d}') for i in range(150)] + [indexed('shoe', 's999')]
+        ))
+        summary = Reconciler(fetcher, ['shoe']).run()
+    finally:
+        stack.list_entries = list_entries
+
+    assert fetcher.pinecone_manager.deleted == ['s999'], fetcher.pinecone_manager.deleted
+    assert summary['still_live'] == 1, summary
+    print(f"   ✅ Kept {summary['still_live']} entry the listing skipped, deleted {summary['deleted']}")
+
+
+def main():
+    print(f"🧪 Running reconcile tests against {config.CONTENTSTACK_API_BASE_URL}")
+    test_only_stale_vectors_of_the_reconciled_scope_are_deleted()
+    test_entries_skipped_by_shifting_pages_are_kept()
+    print("🎉 All reconcile tests passed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import time
+
+# Short backoffs and few retries keep the retry tests fast; set before config is imported
+os.environ['WEBHOOK_RETRY_BACKOFF'] = '0.05'
+os.environ['WEBHOOK_MAX_RETRIES'] = '2'
+
+from webhook_coalescer import WebhookCoalescer
+
+
+class RecordingIndexer:
+    """Applies batches like index_webhook_batch, failing the first batches it is told to"""
+
+    def __init__(self, fail_batches=0, fail_deletes=0, fail_upserts=0):
+        self.batches = []
+        self.fail_batches = fail_batches
+        self.fail_deletes = fail_deletes
+        self.fail_upserts = fail_upserts
+        self.during_apply = None
+
+    def __call__(self, batch):
+        self.batches.append(sorted((event['key'], event['action']) for event in batch))
+        if self.during_apply:
+            self.during_apply()
+            self.during_apply = None
+        if self.fail_batches:
+            self.fail_batches -= 1
+            raise RuntimeError("Pinecone unavailable")
+        upserts = sum(1 for event in batch if event['action'] == 'upsert')
+        deletes = len(batch) - upserts
+        failed, failed_deletes = 0, 0
+        if self.fail_upserts and upserts:
+            self.fail_upserts -= 1
+            failed = upserts
+        if self.fail_deletes and deletes:
+            self.fail_deletes -= 1
+            failed_deletes = deletes
+        return {'upserted': upserts - failed, 'deleted': deletes - failed_deletes, 'failed': failed,
+                'failed_deletes': failed_deletes}
+
+
+def wait_for_retry(coalescer):
+    """Sleep out the backoff and take the requeued batch"""
+    time.sleep(coalescer.stats()['retry_in_seconds'] + 0.1)
+    return coalescer.take_due()
+
+
+def test_events_for_the_same_entry_coalesce():
+    """Only the newest event per entry reaches the index"""
+    print("🔍 Testing coalescing...")
+    coalescer = WebhookCoalescer(window_seconds=0.0, max_batch=100)
+    coalescer.add('p1', 'upsert', 'product', {'uid': 'p1'})
+    coalescer.add('p2', 'upsert', 'product', {'uid': 'p2'})
+    assert coalescer.add('p1', 'delete', 'product', {'uid': 'p1'})
+
+    batch = coalescer.take_due()
+    assert sorted((event['key'], event['action']) for event in batch) == [('p1', 'delete'), ('p2', 'upsert')]
+    assert coalescer.stats()['coalesced'] == 1
+    print("   ✅ Two events for p1 became one delete")
+
+
+def test_failed_batch_is_retried_after_a_backoff():
+    print("🔍 Testing retry of a failed batch...")
+    coalescer = WebhookCoalescer(window_seconds=0.0, max_batch=100)
+    indexer = RecordingIndexer(fail_batches=1)
+    coalescer.add('p1', 'upsert', 'product', {'uid': 'p1'})
+    coalescer.apply(coalescer.take_due(), indexer)
+
+    assert coalescer.take_due() == [], "a requeued batch must wait out its backoff"
+    coalescer.apply(wait_for_retry(coalescer), indexer)
+    assert indexer.batches == [[('p1', 'upsert')], [('p1', 'upsert')]], indexer.batches
+    stats = coalescer.stats()
+    assert stats['requeued'] == 1 and stats['upserted'] == 1 and stats['pending'] == 0, stats
+    print(f"   ✅ Retried after the backoff, {stats['failed_batches']} failed batch")
+
+
+def test_newer_event_wins_over_a_requeued_one():
+    """An event that arrives while its entry's batch fails is not overwritten by the retry"""
+    print("🔍 Testing requeue against a newer event...")
+    coalescer = WebhookCoalescer(window_seconds=0.0, max_batch=100)
+    indexer = RecordingIndexer(fail_batches=1)
+    indexer.during_apply = lambda: coalescer.add('p1', 'delete', 'product', {'uid': 'p1'})
+    coalescer.add('p1', 'upsert', 'product', {'uid': 'p1'})
+    coalescer.add('p2', 'upsert', 'product', {'uid': 'p2'})
+    coalescer.apply(coalescer.take_due(), indexer)
+
+    coalescer.apply(wait_for_retry(coalescer), indexer)
+    assert indexer.batches[-1] == [('p1', 'delete'), ('p2', 'upsert')], indexer.batches
+    print("   ✅ The retry kept the newer delete for p1")
+
+
+def test_partial_failures_requeue_only_the_failed_action():
+    """Failed upserts requeue the upserts; deletes that did not land requeue the deletes"""
+    print("🔍 Testing partial failures...")
+    for failure, requeued in (({'fail_upserts': 1}, 'upsert'), ({'fail_deletes': 1}, 'delete')):
+        coalescer = WebhookCoalescer(window_seconds=0.0, max_batch=100)
+        indexer = RecordingIndexer(**failure)
+        coalescer.add('p1', 'upsert', 'product', {'uid': 'p1'})
+        coalescer.add('p2', 'delete', 'product', {'uid': 'p2'})
+        coalescer.apply(coalescer.take_due(), indexer)
+
+        retry = wait_for_retry(coalescer)
+        assert [event['action'] for event in retry] == [requeued], retry
+        coalescer.apply(retry, indexer)
+        assert coalescer.stats()['pending'] == 0
+    print("   ✅ Only the failed upserts or deletes were retried")
+
+
+def test_events_are_dropped_after_max_retries():
+    print("🔍 Testing the retry limit...")
+    coalescer = WebhookCoalescer(window_seconds=0.0, max_batch=100)
+    indexer = RecordingIndexer(fail_batches=10)
+    coalescer.add('p1', 'upsert', 'product', {'uid': 'p1'})
+    batch = coalescer.take_due()
+    while batch:
+        coalescer.apply(batch, indexer)
+        batch = wait_for_retry(coalescer)
+
+    stats = coalescer.stats()
+    assert len(indexer.batches) == 3, indexer.batches  # the first attempt and WEBHOOK_MAX_RETRIES=2 retries
+    assert stats['dropped'] == 1 and stats['pending'] == 0, stats
+    print(f"   ✅ Dropped after {len(indexer.batches) - 1} retries")
+
+
+def test_exit_flush_retries_failed_events():
+    """The exit flush keeps retrying within its budget instead of giving up after one attempt"""
+    print("🔍 Testing the exit flush...")
+    coalescer = WebhookCoalescer(window_seconds=60.0, max_batch=100)
+    indexer = RecordingIndexer(fail_batches=1, fail_deletes=1)
+    coalescer.start(indexer)
+    coalescer.add('p1', 'upsert', 'product', {'uid': 'p1'})
+    coalescer.add('p2', 'delete', 'product', {'uid': 'p2'})
+    coalescer.flush()
+
+    stats = coalescer.stats()
+    assert len(indexer.batches) == 3, indexer.batches
+    assert stats['upserted'] == 1 and stats['deleted'] == 1 and stats['pending'] == 0, stats
+    print(f"   ✅ Flushed everything in {len(indexer.batches)} attempts")
+
+
+def main():
+    print("🧪 Running webhook coalescer tests")
+    test_events_for_the_same_entry_coalesce()
+    test_failed_batch_is_retried_after_a_backoff()
+    test_newer_event_wins_over_a_requeued_one()
+    test_partial_failures_requeue_only_the_failed_action()
+    test_events_are_dropped_after_max_retries()
+    test_exit_flush_retries_failed_events()
+    print("🎉 All webhook coalescer tests passed!")
+
+if __name__ == "__main__":
+    main()
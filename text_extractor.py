@@ -0,0 +1,282 @@
+"""
+Schema-compiled embedding text extractors
+
+Without a schema, embedding text comes from a fixed list of field names
+(EMBEDDING_TEXT_FIELDS), which misses rich-text, JSON RTE, group and
+modular-block content and picks up nothing from custom field names. An
+extractor is compiled once per content type from its schema (a Delivery
+API content type, a webhook payload's content_type, or an export's
+content_types/schema.json). Compiling walks the schema and emits one getter
+per text leaf, already bound to its path and to the cleaner for its
+format:
+
+    text                  -> as-is
+    text + markdown       -> markdown syntax stripped
+    text + rich text      -> HTML tags stripped, entities unescaped
+    json + JSON RTE       -> text leaves of the document tree
+    reference             -> titles of resolved references (reference_cache.py)
+    group / global field  -> its fields, under the group's path
+    modular blocks        -> every block's fields, under field/block uid
+
+Extracting an entry is then a flat loop over those getters; no per-entry
+walk of keys that are not text. fields lists the top-level field uids the
+getters read, which is what a projected fetch has to ask for.
+"""
+import html
+import json
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import config
+
+# Text fields that are never search text
+_SKIPPED_TEXT_FIELDS = {'url'}
+# JSON RTE elements that continue the surrounding line instead of starting a block
+_INLINE_RTE_TYPES = {'a', 'span', 'inlineCode', 'fragment'}
+
+_HTML_DROP = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_HTML_TAG = re.compile(r'<[^>]+>')
+_MD_IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_MD_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_MD_LINE_MARKERS = re.compile(r'^\s{0,3}(?:#{1,6}\s+|>\s?|[-*+]\s+|\d+\.\s+)', re.MULTILINE)
+_MD_EMPHASIS = re.compile(r'[*_~`]+')
+_WHITESPACE = re.compile(r'\s+')
+
+# A getter appends the text it finds in an entry to parts
+Getter = Callable[[Dict, List[str]], None]
+
+
+def _plain(value) -> str:
+    return value if isinstance(value, str) else ''
+
+
+def strip_html(value) -> str:
+    if not isinstance(value, str):
+        return ''
+    text = _HTML_TAG.sub(' ', _HTML_DROP.sub(' ', value))
+    return _WHITESPACE.sub(' ', html.unescape(text)).strip()
+
+
+def strip_markdown(value) -> str:
+    if not isinstance(value, str):
+        return ''
+    text = _MD_LINK.sub(r'\1', _MD_IMAGE.sub(' ', value))
+    text = _MD_EMPHASIS.sub('', _MD_LINE_MARKERS.sub('', text))
+    return _WHITESPACE.sub(' ', _HTML_TAG.sub(' ', text)).strip()
+
+
+def _rte_node_text(node: Dict) -> str:
+    if 'text' in node:
+        return node['text'] if isinstance(node['text'], str) else ''
+    parts = []
+    for child in node.get('children') or []:
+        if not isinstance(child, dict):
+            continue
+        text = _rte_node_text(child)
+        if 'text' not in child and child.get('type') not in _INLINE_RTE_TYPES:
+            # Block elements (paragraphs, headings, list items...) are separate runs of text
+            text = f" {text} "
+        parts.append(text)
+    return ''.join(parts)
+
+
+def json_rte_text(value) -> str:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return ''
+    if not isinstance(value, dict):
+        return ''
+    return _WHITESPACE.sub(' ', _rte_node_text(value)).strip()
+
+
+def reference_titles(value) -> str:
+    """Title of a reference that reference_cache.py has resolved (stubs have none)"""
+    if not isinstance(value, dict) or not value.get('_content_type_uid'):
+        return ''
+    title = value.get('title') or value.get('name')
+    return title if isinstance(title, str) else ''
+
+
+def _emit(value, clean: Callable, parts: List[str]):
+    for item in value if isinstance(value, list) else (value,):
+        text = clean(item)
+        if text:
+            parts.append(text)
+
+
+def _walk(entry: Dict, path: Tuple[str, ...]) -> List:
+    """Values at path, stepping into every element of multiple groups and block lists"""
+    values = [entry]
+    for key in path:
+        found = []
+        for value in values:
+            for item in value if isinstance(value, list) else (value,):
+                if isinstance(item, dict) and item.get(key) is not None:
+                    found.append(item[key])
+        values = found
+    return values
+
+
+def _leaf_getter(path: Tuple[str, ...], clean: Callable) -> Getter:
+    if len(path) == 1:
+        key = path[0]
+
+        def get(entry: Dict, parts: List[str]):
+            value = entry.get(key)
+            if value:
+                _emit(value, clean, parts)
+        return get
+
+    def get_nested(entry: Dict, parts: List[str]):
+        for value in _walk(entry, path):
+            _emit(value, clean, parts)
+    return get_nested
+
+
+class TextExtractor:
+    def __init__(self, content_type: str, getters: List[Getter], fields: List[str], paths: List[str]):
+        self.content_type = content_type
+        self.getters = getters
+        self.fields = fields
+        self.paths = paths
+
+    def __call__(self, entry: Dict) -> str:
+        parts = []
+        for getter in self.getters:
+            getter(entry, parts)
+        return ' '.join(parts).strip()
+
+
+def compile_extractor(content_type: Dict, global_fields: Dict[str, Dict] = None) -> TextExtractor:
+    """Compile a content type definition ({"uid", "schema": [...]}) into an extractor"""
+    global_fields = global_fields or {}
+    getters = []
+    paths = []
+
+    def compile_fields(schema: Iterable[Dict], path: Tuple[str, ...]):
+        for field in schema or []:
+            uid = field.get('uid')
+            if not uid:
+                continue
+            data_type = field.get('data_type')
+            metadata = field.get('field_metadata') or {}
+            field_path = path + (uid,)
+            clean = None
+            if data_type == 'text' and uid not in _SKIPPED_TEXT_FIELDS:
+                if metadata.get('markdown'):
+                    clean = strip_markdown
+                elif metadata.get('allow_rich_text'):
+                    clean = strip_html
+                else:
+                    clean = _plain
+            elif data_type == 'json' and metadata.get('allow_json_rte'):
+                clean = json_rte_text
+            elif data_type == 'reference':
+                clean = reference_titles
+            elif data_type == 'group':
+                compile_fields(field.get('schema'), field_path)
+            elif data_type == 'global_field':
+                compile_fields(field.get('schema') or global_fields.get(field.get('reference_to'), {}).get('schema'),
+                               field_path)
+            elif data_type == 'blocks':
+                for block in field.get('blocks') or []:
+                    block_schema = block.get('schema') or global_fields.get(block.get('reference_to'), {}).get('schema')
+                    if block.get('uid'):
+                        compile_fields(block_schema, field_path + (block['uid'],))
+            if clean is not None:
+                getters.append(_leaf_getter(field_path, clean))
+                paths.append('.'.join(field_path))
+
+    compile_fields(content_type.get('schema'), ())
+    fields = list(dict.fromkeys(path.split('.', 1)[0] for path in paths))
+    return TextExtractor(content_type.get('uid', ''), getters, fields, paths)
+
+
+def _content_type_list(data) -> List[Dict]:
+    """Content types from a schema file or API response in any of the shapes Contentstack uses"""
+    if isinstance(data, dict):
+        if 'content_types' in data:
+            data = data['content_types']
+        elif 'content_type' in data:
+            data = [data['content_type']]
+        elif 'schema' in data:
+            data = [data]
+        else:
+            data = list(data.values())
+    return [item for item in data or [] if isinstance(item, dict) and item.get('uid')]
+
+
+class TextExtractorRegistry:
+    """Compiled extractors by content type uid, plus the global fields they may include"""
+
+    def __init__(self):
+        self._extractors: Dict[str, TextExtractor] = {}
+        self._global_fields: Dict[str, Dict] = {}
+        self._unavailable_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def register_global_fields(self, global_fields: Iterable[Dict]):
+        with self._lock:
+            for global_field in global_fields:
+                if isinstance(global_field, dict) and global_field.get('uid'):
+                    self._global_fields[global_field['uid']] = global_field
+
+    def register(self, content_type: Dict) -> TextExtractor:
+        with self._lock:
+            global_fields = dict(self._global_fields)
+        extractor = compile_extractor(content_type, global_fields)
+        with self._lock:
+            self._extractors[extractor.content_type] = extractor
+            self._unavailable_until.pop(extractor.content_type, None)
+        return extractor
+
+    def load_file(self, path: str, global_fields_path: str = None) -> int:
+        """Register every content type in a schema file; returns how many were registered"""
+        if global_fields_path:
+            with open(global_fields_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.register_global_fields(_content_type_list(data))
+        with open(path, 'r', encoding='utf-8') as f:
+            content_types = _content_type_list(json.load(f))
+        for content_type in content_types:
+            self.register(content_type)
+        return len(content_types)
+
+    def get(self, content_type: Optional[str]) -> Optional[TextExtractor]:
+        return self._extractors.get(content_type) if content_type else None
+
+    def should_fetch(self, content_type: str) -> bool:
+        """Whether a schema fetch is worth trying (no extractor yet, no recent failure)"""
+        with self._lock:
+            return content_type not in self._extractors and \
+                time.monotonic() >= self._unavailable_until.get(content_type, 0.0)
+
+    def mark_unavailable(self, content_type: str, retry_after: float = 300.0):
+        with self._lock:
+            self._unavailable_until[content_type] = time.monotonic() + retry_after
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_text_extractors() -> TextExtractorRegistry:
+    """Get or create the process-wide extractor registry, preloaded from CONTENTSTACK_SCHEMA_PATH"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = TextExtractorRegistry()
+                if config.CONTENTSTACK_SCHEMA_PATH:
+                    try:
+                        count = registry.load_file(config.CONTENTSTACK_SCHEMA_PATH,
+                                                   config.CONTENTSTACK_GLOBAL_FIELDS_PATH or None)
+                        print(f"Compiled text extractors for {count} content types")
+                    except (OSError, ValueError) as e:
+                        print(f"Warning: Could not load content type schemas: {e}")
+                _registry = registry
+    return _registry
@@ -0,0 +1,78 @@
+"""
+Byte-size-aware batching for Pinecone upserts
+
+Pinecone rejects upsert requests over 2 MB or 1000 vectors. Fixed batches
+of 100 either overflow that with large metadata or waste round trips with
+small metadata, so batches are cut by an estimate of their serialized size
+as well as by count. The estimate is an upper bound computed without
+serializing the floats (a float never takes more than 24 characters of
+JSON), which keeps batching cheap on large imports.
+
+Both Pinecone managers send the batches several at a time and retry
+transient failures (connection errors, 429, 5xx) with jittered exponential
+backoff; the per-call summary reports what landed and what did not.
+"""
+import json
+import random
+from typing import Dict, Iterator, List, Optional
+
+from config import config
+
+# Upper bound of one float in a JSON array, separator included
+_FLOAT_BYTES = 24
+# Braces, keys and separators of one vector object
+_VECTOR_OVERHEAD_BYTES = 64
+_REQUEST_OVERHEAD_BYTES = 64
+_MAX_BACKOFF_SECONDS = 10.0
+
+
+def estimate_vector_bytes(vector: Dict) -> int:
+    """Upper bound of the JSON size of one {'id', 'values', 'metadata'} vector"""
+    size = _VECTOR_OVERHEAD_BYTES + len(str(vector.get('id', '')).encode('utf-8'))
+    size += _FLOAT_BYTES * len(vector.get('values') or [])
+    if vector.get('metadata'):
+        size += len(json.dumps(vector['metadata']).encode('utf-8'))
+    return size
+
+
+def plan_batches(vectors: List[Dict], max_bytes: int = None, max_vectors: int = None) -> Iterator[List[Dict]]:
+    """Split vectors into request-sized batches, in order"""
+    max_bytes = max_bytes or config.PINECONE_UPSERT_MAX_BYTES
+    max_vectors = max_vectors or config.PINECONE_UPSERT_MAX_VECTORS
+    batch = []
+    batch_bytes = _REQUEST_OVERHEAD_BYTES
+    for vector in vectors:
+        size = estimate_vector_bytes(vector)
+        if batch and (len(batch) >= max_vectors or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = _REQUEST_OVERHEAD_BYTES
+        # A single vector over the limit still goes alone, so Pinecone reports it
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def is_retryable(status: Optional[int]) -> bool:
+    """Connection errors (no status), throttling and server errors are worth another try"""
+    return status is None or status == 429 or status >= 500
+
+
+def backoff_seconds(attempt: int) -> float:
+    return min(_MAX_BACKOFF_SECONDS, config.PINECONE_UPSERT_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def summarize(results: List[Dict], seconds: float) -> Dict:
+    """Combine per-batch results ({'vectors', 'ok', 'attempts', 'error'}) into one upsert summary"""
+    upserted = sum(result['vectors'] for result in results if result['ok'])
+    failed = [result for result in results if not result['ok']]
+    return {
+        'upserted': upserted,
+        'failed': sum(result['vectors'] for result in failed),
+        'batches': len(results),
+        'failed_batches': len(failed),
+        'retries': sum(result['attempts'] - 1 for result in results),
+        'seconds': round(seconds, 2),
+        'errors': [result['error'] for result in failed][:5]
+    }
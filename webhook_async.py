@@ -0,0 +1,486 @@
+"""
+ASGI variant of the search API (same /search, /webhook and /health contract as webhook_full.py)
+
+/sync has no background jobs here: it runs the full or delta sync inline and
+answers 200 with status "sync_completed" once it is done, without a job_id
+to poll.
+
+Run with an async server, e.g.:
+    uvicorn webhook_async:app --host 0.0.0.0 --port $PORT
+    gunicorn -k uvicorn.workers.UvicornWorker webhook_async:app
+"""
+from quart import Quart, request, jsonify
+import asyncio
+import logging
+import os
+import time
+from typing import List, Dict
+from dotenv import load_dotenv
+from async_clients import (
+    create_http_client,
+    AsyncEmbedder,
+    AsyncContentstackFetcher,
+    AsyncPineconeManager,
+    AsyncQueryRewriter
+)
+from deadline import Deadline
+from precomputed_expansions import get_expansion_store
+from expansion_pruning import result_overlap, get_pruning_stats
+from sync_state import get_sync_state, collapse_sync_items
+from entry_cache import get_entry_cache
+from reference_cache import get_reference_cache
+from text_extractor import get_text_extractors
+from contentstack_fetcher import vector_id
+from metadata_schema import search_result
+from webhook_coalescer import EXIT_FLUSH_SECONDS, build_webhook_vectors, get_webhook_coalescer, webhook_action
+from embeddings_generator import encode_texts
+from config import config
+
+# Load environment variables
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+
+# Allow localhost, network IP, Launch domain, and ngrok frontend domain
+ALLOWED_ORIGINS = [
+    'http://localhost:3000',
+    'http://localhost:3001',
+    'http://192.168.1.14:3000',
+    'http://192.168.1.14:3001',
+    'https://contentstack-semantic-search-71c585.eu-contentstackapps.com'
+]
+if config.NGROK_FRONTEND_DOMAIN:
+    ALLOWED_ORIGINS.append(f'https://{config.NGROK_FRONTEND_DOMAIN}')
+
+@app.before_request
+async def handle_preflight():
+    if request.method == "OPTIONS":
+        return jsonify({})
+
+@app.after_request
+async def add_cors_headers(response):
+    origin = request.headers.get('Origin')
+    if origin in ALLOWED_ORIGINS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+
+    response.headers['Access-Control-Allow-Headers'] = f'Content-Type, {config.SEARCH_DEADLINE_HEADER}'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    return response
+
+# Global managers (created inside the event loop at startup)
+_http_client = None
+_embedder = None
+_pinecone_manager = None
+_contentstack_fetcher = None
+_query_rewriter = None
+_webhook_indexer = None
+_webhook_indexer_stop = None
+
+# How often the webhook indexer task checks for a due batch
+_WEBHOOK_POLL_SECONDS = 0.05
+
+@app.before_serving
+async def startup():
+    """Create the shared HTTP client, embedding executor and API clients"""
+    global _http_client, _embedder, _pinecone_manager, _contentstack_fetcher, _query_rewriter
+    global _webhook_indexer, _webhook_indexer_stop
+    _http_client = create_http_client()
+    _embedder = AsyncEmbedder()
+
+    try:
+        _pinecone_manager = AsyncPineconeManager(_http_client)
+    except Exception as e:
+        print(f"Failed to initialize Pinecone: {e}")
+    try:
+        _contentstack_fetcher = AsyncContentstackFetcher(_http_client)
+    except Exception as e:
+        print(f"Failed to initialize Contentstack fetcher: {e}")
+    try:
+        _query_rewriter = AsyncQueryRewriter(_http_client)
+    except Exception as e:
+        print(f"Failed to initialize query rewriter: {e}")
+    _webhook_indexer_stop = asyncio.Event()
+    _webhook_indexer = asyncio.create_task(run_webhook_indexer())
+
+@app.after_serving
+async def shutdown():
+    """Index pending webhook events, then close pooled connections and the embedding executor"""
+    if _webhook_indexer is not None:
+        # Let a batch being indexed finish, then index whatever is still buffered, retrying failures for a while
+        _webhook_indexer_stop.set()
+        await _webhook_indexer
+        coalescer = get_webhook_coalescer()
+        deadline = time.monotonic() + EXIT_FLUSH_SECONDS
+        while True:
+            pending = coalescer.take_all()
+            if pending:
+                await apply_webhook_batch(pending)
+            delay = coalescer.exit_retry_delay(deadline)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+    if _http_client is not None:
+        await _http_client.aclose()
+    if _embedder is not None:
+        _embedder.shutdown()
+
+async def search_one(search_query: str, top_k: int, deadline: Deadline,
+                     query_embedding: List[float] = None) -> List[Dict]:
+    """Embed one query (unless already embedded) and return its Pinecone matches"""
+    if query_embedding is None:
+        try:
+            query_embedding = await asyncio.wait_for(
+                _embedder.embed_query(search_query, deadline=deadline),
+                timeout=deadline.timeout()
+            )
+        except asyncio.TimeoutError:
+            deadline.skip('embed', 'embedding timed out')
+            return []
+    if not query_embedding:
+        print(f"⚠️ Failed to generate embedding for: {search_query}")
+        return []
+
+    results = await _pinecone_manager.search_similar(query_embedding, top_k=min(top_k, 10), deadline=deadline)
+    return [search_result(match, search_query) for match in results.get('matches', [])]
+
+async def index_webhook_batch(events: List[Dict]) -> Dict:
+    """Apply a coalesced batch of webhook events: one batched upsert and one batched delete"""
+    if not _pinecone_manager:
+        raise RuntimeError("Pinecone manager not available")
+
+    upserts = [event for event in events if event['action'] == 'upsert']
+    deletes = [event['key'] for event in events if event['action'] == 'delete']
+    upserted = failed = 0
+    if upserts:
+        if _contentstack_fetcher:
+            by_content_type = {}
+            for event in upserts:
+                by_content_type.setdefault(event['content_type'], []).append(event['entry'])
+            for content_type, entries in by_content_type.items():
+                await _contentstack_fetcher.resolve_references(entries)
+                await _contentstack_fetcher.load_text_extractor(content_type)
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(_embedder.executor, build_webhook_vectors, upserts, encode_texts)
+        if vectors:
+            summary = await _pinecone_manager.upsert_vectors(vectors)
+            upserted, failed = summary['upserted'], summary['failed']
+    deleted = await _pinecone_manager.delete_products(deletes) if deletes else 0
+    print(f"✅ Indexed webhook batch: {upserted} upserted, {deleted} deleted from {len(events)} events")
+    return {'upserted': upserted, 'deleted': deleted, 'failed': failed, 'failed_deletes': len(deletes) - deleted}
+
+async def apply_webhook_batch(events: List[Dict]):
+    try:
+        result = await index_webhook_batch(events)
+    except Exception as e:
+        print(f"❌ Could not index a batch of {len(events)} webhook events: {e}")
+        result = None
+    get_webhook_coalescer().finish(events, result)
+
+async def run_webhook_indexer():
+    """Apply coalesced webhook batches as they come due, one at a time"""
+    coalescer = get_webhook_coalescer()
+    while not _webhook_indexer_stop.is_set():
+        batch = coalescer.take_due()
+        if batch:
+            await apply_webhook_batch(batch)
+        else:
+            await asyncio.sleep(_WEBHOOK_POLL_SECONDS)
+
+@app.route('/webhook', methods=['POST'])
+async def webhook():
+    """Contentstack webhook endpoint"""
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Content-Type must be application/json"}), 400
+
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Invalid JSON data"}), 400
+
+        event_type = data.get('event')
+        entry_data = data.get('data', {}).get('entry', {})
+        entry_uid = entry_data.get('uid')
+        entry_vector_id = vector_id(entry_uid, entry_data.get('locale')) if entry_uid else None
+        print(f"=== WEBHOOK {event_type} for {data.get('content_type_uid', 'N/A')}/{entry_uid} ===")
+
+        if not entry_uid:
+            return jsonify({"status": "success", "message": "No entry UID to process"}), 200
+
+        # Keep the shared entry cache in step so conditional reads serve the latest data
+        entry_cache = get_entry_cache()
+        content_type = data.get('content_type_uid')
+        if entry_cache and content_type:
+            loop = asyncio.get_running_loop()
+            if event_type in ['entry_published', 'entry_updated', 'entry_created']:
+                await loop.run_in_executor(None, entry_cache.put_entry, content_type, entry_data)
+            elif event_type in ['entry_unpublished', 'entry_deleted']:
+                await loop.run_in_executor(
+                    None, entry_cache.delete_entry, content_type, entry_uid, entry_data.get('locale')
+                )
+
+        # Payloads carry the content type schema; recompiling keeps the text extractor current
+        content_type_schema = data.get('data', {}).get('content_type')
+        if isinstance(content_type_schema, dict) and content_type_schema.get('schema'):
+            get_text_extractors().register(content_type_schema)
+
+        # Entries that reference this one (e.g. products of a brand) read it from the reference cache
+        if content_type:
+            if event_type in ['entry_published', 'entry_updated', 'entry_created']:
+                get_reference_cache().refresh(content_type, entry_data)
+            elif event_type in ['entry_unpublished', 'entry_deleted']:
+                get_reference_cache().invalidate(content_type, entry_uid)
+
+        action = webhook_action(event_type)
+        if action is None:
+            print(f"Unhandled event type: {event_type}")
+            return jsonify({"status": "success", "message": f"Ignored {event_type} for entry {entry_uid}"}), 200
+
+        # Indexing happens in coalesced batches on the webhook indexer task
+        get_webhook_coalescer().add(entry_vector_id, action, content_type, entry_data)
+        return jsonify({"status": "accepted", "message": f"Queued {event_type} for entry {entry_uid}"}), 202
+
+    except Exception as e:
+        print(f"❌ Critical webhook error: {e}")
+        return jsonify({
+            "status": "error",
+            "message": "Webhook processing failed",
+            "error": str(e)
+        }), 500
+
+@app.route('/search', methods=['POST'])
+async def search():
+    """Search endpoint for semantic product search"""
+    data = None
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Content-Type must be application/json"}), 400
+
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Invalid JSON data"}), 400
+
+        query = data.get('query', '').strip()
+        top_k = min(data.get('top_k', config.DEFAULT_TOP_K), 20)  # Limit to prevent timeouts
+        use_rewrite = data.get('rewrite', False)
+
+        if not query:
+            return jsonify({"error": "Query parameter is required"}), 400
+
+        # Overall time budget shared by rewrite, embedding and vector query
+        deadline = Deadline.from_header(request.headers.get(config.SEARCH_DEADLINE_HEADER))
+
+        # Feed the search log (buffered in memory; written by a background thread)
+        expansion_store = get_expansion_store()
+        if expansion_store:
+            expansion_store.record_search(query)
+
+        print(f"🔍 Search query: '{query}' (top_k: {top_k}, rewrite: {use_rewrite}, budget: {deadline.budget_ms:.0f}ms)")
+
+        if not _pinecone_manager:
+            return jsonify({
+                "query": query,
+                "results": [],
+                "error": "Search service temporarily unavailable",
+                "status": "service_unavailable"
+            }), 503
+
+        # Speculative search: the original query is retrieved right away while
+        # the LLM rewrite runs alongside it, so expansion is off the critical path
+        base_task = asyncio.create_task(search_one(query, top_k, deadline))
+
+        expansion_status = "not_requested"
+        expansions = []
+        if use_rewrite:
+            if _query_rewriter:
+                rewrite_task = asyncio.create_task(_query_rewriter.expand_query(query, 2, deadline=deadline))  # Limit expansions
+                try:
+                    # shield() lets a late rewrite finish and land in the rewrite cache
+                    expanded_queries = await asyncio.wait_for(
+                        asyncio.shield(rewrite_task),
+                        timeout=deadline.timeout(reserve_ms=config.EXPANSION_MIN_BUDGET_MS)
+                    )
+                    expansions = [q for q in expanded_queries[:3] if q != query]  # Limit total queries
+                    expansion_status = "expanded" if expansions else "no_expansions"
+                    print(f"📝 Expanded to {len(expansions) + 1} queries: {[query] + expansions}")
+                except asyncio.TimeoutError:
+                    deadline.skip('rewrite', 'LLM rewrite did not return within budget')
+                    expansion_status = "timeout"
+            else:
+                expansion_status = "unavailable"
+
+        expansion_tasks = []
+        if expansions:
+            if deadline.allows(config.EXPANSION_MIN_BUDGET_MS):
+                # One batch embedding drops near-duplicate rewrites before they cost a vector query
+                expansions, expansion_vectors = await _embedder.prune_expansions(query, expansions, deadline=deadline)
+                if not expansions:
+                    expansion_status = "pruned"
+                expansion_tasks = [
+                    asyncio.create_task(search_one(q, top_k, deadline, expansion_vectors.get(q)))
+                    for q in expansions
+                ]
+            else:
+                deadline.skip('expansion_search', f'dropped {len(expansions)} expanded queries')
+                expansion_status = "timeout"
+
+        # Base results always come first; expansion results merge in only if they are ready in time
+        per_query_results = [(query, await base_task)]
+        searched_expansions = []
+        if expansion_tasks:
+            done, pending = await asyncio.wait(expansion_tasks, timeout=deadline.timeout())
+            for task in pending:
+                task.cancel()
+            if pending:
+                deadline.skip('expansion_search', 'expanded query search did not return within budget')
+            for search_query, task in zip(expansions, expansion_tasks):
+                if task in done and task.exception() is None:
+                    per_query_results.append((search_query, task.result()))
+                    searched_expansions.append(search_query)
+                elif task in done:
+                    print(f"⚠️ Search error for query '{search_query}': {task.exception()}")
+            if not searched_expansions:
+                expansion_status = "timeout" if pending else "failed"
+            else:
+                base_ids = [result['product_id'] for result in per_query_results[0][1]]
+                get_pruning_stats().add_overlaps([
+                    result_overlap(base_ids, [result['product_id'] for result in results])
+                    for _, results in per_query_results[1:]
+                ])
+
+        all_results = []
+        seen_ids = set()
+        for search_query, results in per_query_results:
+            for result in results:
+                if result['product_id'] not in seen_ids and len(all_results) < top_k:
+                    all_results.append(result)
+                    seen_ids.add(result['product_id'])
+
+        all_results.sort(key=lambda x: x['score'], reverse=True)
+        final_results = all_results[:top_k]
+
+        print(f"✅ Found {len(final_results)} unique results")
+
+        return jsonify({
+            "query": query,
+            "expanded_queries": [query] + searched_expansions,
+            "expanded": bool(searched_expansions),
+            "expansion_status": expansion_status,
+            "results": final_results,
+            "total_results": len(final_results),
+            "status": "degraded" if deadline.skipped else "success",
+            "deadline": deadline.report()
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Critical search error: {e}")
+        return jsonify({
+            "error": "Internal server error",
+            "message": str(e),
+            "query": data.get('query', '') if data else '',
+            "status": "error"
+        }), 500
+
+async def build_entry_vectors(entries: List[Dict], content_type: str) -> List[Dict]:
+    """Embed entries and shape them as Pinecone vectors"""
+    entries = [entry for entry in entries if entry.get('uid')]
+    await _contentstack_fetcher.resolve_references(entries)
+    await _contentstack_fetcher.load_text_extractor(content_type)
+    embeddings = await asyncio.gather(*(_embedder.embed_entry(entry, content_type=content_type) for entry in entries))
+
+    vectors = []
+    for entry, embedding in zip(entries, embeddings):
+        if not embedding:
+            print(f"Warning: Could not generate embedding for entry {entry['uid']}")
+            continue
+        vectors.append({
+            'id': vector_id(entry['uid'], entry.get('locale')),
+            'values': embedding,
+            'metadata': {
+                'entry_uid': entry['uid'],
+                'product_id': vector_id(entry['uid'], entry.get('locale')),
+                'content_type': content_type,
+                'title': entry.get('title', ''),
+                'locale': entry.get('locale', config.CONTENTSTACK_DEFAULT_LOCALE),
+                'url': entry.get('url', '')
+            }
+        })
+    return vectors
+
+async def delta_sync(content_type: str, reset: bool) -> Dict:
+    """Apply only the Sync API changes since the stored sync token"""
+    state = get_sync_state()
+    if reset:
+        state.clear(content_type)
+    sync_token = state.get_sync_token(content_type)
+    mode = 'delta' if sync_token else 'initial'
+
+    items, new_sync_token = await _contentstack_fetcher.fetch_sync_items(content_type, sync_token)
+    published, removed = collapse_sync_items(items, content_type)
+    upserted = {'upserted': 0}
+    if published:
+        upserted = await _pinecone_manager.upsert_vectors(await build_entry_vectors(list(published.values()), content_type))
+        if upserted['failed']:
+            # Keep the old token so the next delta sync retries these changes
+            raise RuntimeError(f"{upserted['failed']} vectors failed to upsert: {upserted['errors']}")
+    if removed:
+        deleted = await _pinecone_manager.delete_products(sorted(removed))
+        if deleted < len(removed):
+            # Keep the old token so the next delta sync retries these removals
+            raise RuntimeError(f"Only {deleted}/{len(removed)} removed entries were deleted from Pinecone")
+
+    state.set_sync_token(content_type, new_sync_token, mode=mode)
+    return {'mode': mode, 'items': len(items), 'upserted': upserted['upserted'], 'deleted': len(removed)}
+
+@app.route('/sync', methods=['POST'])
+async def sync_entries():
+    """Manually trigger a full or incremental (mode=delta) sync of Contentstack entries to Pinecone"""
+    content_type = request.args.get('content_type', 'product')
+    mode = request.args.get('mode', 'full')
+
+    print(f"🔄 Starting manual {mode} sync for content type: {content_type}")
+
+    if not _contentstack_fetcher or not _pinecone_manager:
+        return jsonify({"error": "Contentstack fetcher not available"}), 503
+
+    try:
+        if mode == 'delta':
+            summary = await delta_sync(content_type, reset=request.args.get('reset', 'false').lower() == 'true')
+            return jsonify({"status": "sync_completed", "content_type": content_type, **summary}), 200
+
+        entries = await _contentstack_fetcher.fetch_all_entries(content_type)
+        await _pinecone_manager.upsert_vectors(await build_entry_vectors(entries, content_type))
+        return jsonify({"status": "sync_completed", "content_type": content_type}), 200
+    except Exception as e:
+        print(f"❌ Sync error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """Health check endpoint"""
+    return jsonify({
+        "status": "healthy",
+        "services": {
+            "pinecone": "available" if _pinecone_manager else "unavailable",
+            "contentstack": "available" if _contentstack_fetcher else "unavailable",
+            "query_rewriter": "available" if _query_rewriter else "unavailable"
+        },
+        "embedding_workers": _embedder.max_workers if _embedder else 0,
+        "pinecone_query_path": _pinecone_manager.get_query_stats() if _pinecone_manager else None,
+        "expansion_pruning": get_pruning_stats().stats(),
+        "contentstack_throttle": _contentstack_fetcher.throttler.stats() if _contentstack_fetcher else None,
+        "reference_cache": get_reference_cache().stats(),
+        "webhook_batching": get_webhook_coalescer().stats(),
+        "configuration": config.get_status(),
+        "ngrok_domain": config.NGROK_DOMAIN
+    }), 200
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', config.FLASK_PORT))
+    logger.info(f"🚀 Starting async Contentstack Semantic Search API on port {port}...")
+    app.run(host='0.0.0.0', port=port)
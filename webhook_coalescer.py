@@ -0,0 +1,348 @@
+"""
+Coalesced, micro-batched webhook indexing
+
+A bulk publish in Contentstack fires hundreds of /webhook calls within
+seconds. Indexing each one inside its request costs one model call and one
+one-vector upsert per event, ties up the web workers searches need, and
+re-indexes an entry once per edit. Instead the webhook handlers only record
+what the event asks for, keyed by vector id (entry uid + locale):
+
+    publish/update/create  -> upsert, with the payload's entry
+    unpublish/delete       -> delete
+
+A later event for the same key replaces the pending one (last event wins).
+The first event into an empty buffer opens a window of
+WEBHOOK_COALESCE_SECONDS; when it closes, or once WEBHOOK_BATCH_SIZE keys
+are pending, a single worker takes the buffer and applies it: one batched
+encode and upsert for the upserts, one batched delete for the deletes.
+Batches are applied one at a time, in order, so a delete that arrives
+after an upsert is never overtaken by it.
+
+A batch that fails goes back into the buffer, and so do its upserts or its
+deletes when only some of them landed (apply_batch reports 'failed' and
+'failed_deletes'), except for keys a newer event has replaced meanwhile. No
+batch is taken until a backoff of WEBHOOK_RETRY_BACKOFF seconds, doubled per
+consecutive failure, has passed. An event is dropped after
+WEBHOOK_MAX_RETRIES retries. The Flask worker's buffer is flushed at
+interpreter exit and the async server's at shutdown, retrying failures for
+up to EXIT_FLUSH_SECONDS.
+
+stats() reports the window each batch actually waited, batch sizes, how
+many events were absorbed by coalescing, and the receipt-to-indexed
+latency of the applied events.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from config import config
+from embeddings_generator import embedding_text_function
+
+PUBLISH_EVENTS = ('entry_published', 'entry_updated', 'entry_created')
+REMOVE_EVENTS = ('entry_unpublished', 'entry_deleted')
+
+# Applied events whose latency the percentiles are computed over
+_LATENCY_SAMPLES = 1000
+_MAX_RETRY_BACKOFF_SECONDS = 60.0
+# How long an exit flush keeps retrying failed events
+EXIT_FLUSH_SECONDS = 10.0
+
+
+def webhook_action(event_type: str) -> Optional[str]:
+    if event_type in PUBLISH_EVENTS:
+        return 'upsert'
+    if event_type in REMOVE_EVENTS:
+        return 'delete'
+    return None
+
+
+def webhook_metadata(entry: Dict, content_type: str, entry_vector_id: str) -> Dict:
+    """Pinecone metadata for a webhook entry (projected onto metadata_schema.py when written)"""
+    image = entry.get('image')
+    return {
+        'entry_uid': entry.get('uid'),
+        'product_id': entry_vector_id,
+        'content_type': content_type,
+        'title': entry.get('title', ''),
+        'name': entry.get('name', entry.get('title', '')),
+        'description': entry.get('description', ''),
+        'price': entry.get('price', 0),
+        'category': entry.get('category', ''),
+        'brand': entry.get('brand', ''),
+        'image_url': image.get('url', '') if isinstance(image, dict) else '',
+        'locale': entry.get('locale', config.CONTENTSTACK_DEFAULT_LOCALE),
+        'url': entry.get('url', '')
+    }
+
+
+def build_webhook_vectors(events: List[Dict], encode: Callable[[List[str]], List[List[float]]]) -> List[Dict]:
+    """Embed a batch's upsert events with one encode call and shape them as Pinecone vectors"""
+    embeddable = []
+    for event in events:
+        text = embedding_text_function(event['content_type'])(event['entry'])
+        if text:
+            embeddable.append((event, text))
+        else:
+            print(f"⚠️ No searchable text for webhook entry {event['key']}")
+    if not embeddable:
+        return []
+
+    embeddings = encode([text for _, text in embeddable])
+    return [
+        {
+            'id': event['key'],
+            'values': embedding,
+            'metadata': webhook_metadata(event['entry'], event['content_type'], event['key'])
+        }
+        for (event, _), embedding in zip(embeddable, embeddings)
+    ]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class WebhookCoalescer:
+    def __init__(self, window_seconds: float, max_batch: int):
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._pending: Dict[str, Dict] = {}
+        self._window_opened = None
+        self._paused_until = 0.0
+        self._failures = 0
+        self._condition = threading.Condition()
+        # Held while a batch is applied, so the exit flush never overtakes the worker
+        self._apply_lock = threading.Lock()
+        self._thread = None
+        self._apply_batch = None
+        self.received = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.requeued = 0
+        self.dropped = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.failed_vectors = 0
+        self.failed_deletes = 0
+        self.max_batch_size = 0
+        self._applied_events = 0
+        self._windows_waited = 0.0
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+
+    def add(self, key: str, action: str, content_type: str, entry: Dict) -> bool:
+        """Buffer an event; returns True when it replaced a pending event for the same key"""
+        now = time.monotonic()
+        with self._condition:
+            previous = self._pending.pop(key, None)
+            self.received += 1
+            if previous is not None:
+                self.coalesced += 1
+            self._pending[key] = {
+                'key': key,
+                'action': action,
+                'content_type': content_type,
+                'entry': entry,
+                # Latency counts from the first event the batch absorbed for this key
+                'received_at': previous['received_at'] if previous else now
+            }
+            if self._window_opened is None:
+                self._window_opened = now
+            self._condition.notify_all()
+        return previous is not None
+
+    def _due_in(self, now: float) -> Optional[float]:
+        if not self._pending:
+            return None
+        paused = max(0.0, self._paused_until - now)
+        if len(self._pending) >= self.max_batch:
+            return paused
+        return max(paused, self._window_opened + self.window_seconds - now)
+
+    def _take(self, now: float) -> List[Dict]:
+        keys = list(self._pending)[:self.max_batch]
+        batch = [self._pending.pop(key) for key in keys]
+        self._windows_waited += now - self._window_opened
+        # Keys left over from a full batch are already due
+        self._window_opened = min((event['received_at'] for event in self._pending.values()), default=None)
+        return batch
+
+    def wait_for_batch(self) -> List[Dict]:
+        """Block until a batch is due and take it"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = self._due_in(now)
+                if due == 0.0:
+                    return self._take(now)
+                self._condition.wait(due)
+
+    def take_due(self) -> List[Dict]:
+        """The due batch, if any, without waiting (for event-loop pollers)"""
+        with self._condition:
+            now = time.monotonic()
+            return self._take(now) if self._due_in(now) == 0.0 else []
+
+    def take_all(self) -> List[Dict]:
+        """Everything pending, regardless of the window (for shutdown)"""
+        with self._condition:
+            batch = list(self._pending.values())
+            self._pending.clear()
+            self._window_opened = None
+            return batch
+
+    def record(self, batch: List[Dict], result: Optional[Dict]):
+        """Count an applied batch; result is {'upserted', 'deleted', 'failed', 'failed_deletes'}, or None if it failed"""
+        now = time.monotonic()
+        with self._condition:
+            self.batches += 1
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            if result is None:
+                self.failed_batches += 1
+                return
+            if not result.get('failed') and not result.get('failed_deletes'):
+                self._failures = 0
+            self.upserted += result.get('upserted', 0)
+            self.deleted += result.get('deleted', 0)
+            self.failed_vectors += result.get('failed', 0)
+            self.failed_deletes += result.get('failed_deletes', 0)
+            self._applied_events += len(batch)
+            self._latencies.extend(now - event['received_at'] for event in batch)
+
+    def requeue(self, batch: List[Dict]):
+        """Put a failed batch back, behind a backoff; keys with a newer pending event keep that one"""
+        now = time.monotonic()
+        with self._condition:
+            self._failures += 1
+            delay = min(_MAX_RETRY_BACKOFF_SECONDS, config.WEBHOOK_RETRY_BACKOFF * 2 ** (self._failures - 1))
+            self._paused_until = now + delay
+            requeued = 0
+            for event in batch:
+                attempts = event.get('attempts', 0) + 1
+                if attempts > config.WEBHOOK_MAX_RETRIES:
+                    print(f"❌ Dropping webhook event for {event['key']} after {attempts - 1} retries")
+                    self.dropped += 1
+                elif event['key'] not in self._pending:
+                    self._pending[event['key']] = {**event, 'attempts': attempts}
+                    requeued += 1
+            self.requeued += requeued
+            if self._pending:
+                self._window_opened = min(event['received_at'] for event in self._pending.values())
+            self._condition.notify_all()
+        if requeued:
+            print(f"🔁 Retrying {requeued} webhook events in {delay:.1f}s")
+
+    def finish(self, batch: List[Dict], result: Optional[Dict]):
+        """Record an applied batch and requeue what did not land"""
+        self.record(batch, result)
+        if result is None:
+            self.requeue(batch)
+            return
+        # Which ids failed is not known; upserts and deletes are idempotent, so retry the whole action
+        failed_actions = set()
+        if result.get('failed'):
+            failed_actions.add('upsert')
+        if result.get('failed_deletes'):
+            failed_actions.add('delete')
+        if failed_actions:
+            self.requeue([event for event in batch if event['action'] in failed_actions])
+
+    def apply(self, batch: List[Dict], apply_batch: Callable[[List[Dict]], Dict]):
+        with self._apply_lock:
+            try:
+                result = apply_batch(batch)
+            except Exception as e:
+                print(f"❌ Could not index a batch of {len(batch)} webhook events: {e}")
+                result = None
+            self.finish(batch, result)
+
+    def start(self, apply_batch: Callable[[List[Dict]], Dict]):
+        """Apply due batches with apply_batch on a background thread, and flush the rest at exit"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._apply_batch = apply_batch
+            self._thread = threading.Thread(target=self._work, args=(apply_batch,), name="webhook-indexer",
+                                            daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _work(self, apply_batch: Callable[[List[Dict]], Dict]):
+        while True:
+            self.apply(self.wait_for_batch(), apply_batch)
+
+    def exit_retry_delay(self, deadline: float) -> Optional[float]:
+        """After an exit flush attempt: seconds to wait before retrying what was requeued, or None to stop"""
+        with self._condition:
+            pending = len(self._pending)
+            delay = max(0.0, self._paused_until - time.monotonic())
+        if not pending:
+            return None
+        if time.monotonic() + delay > deadline:
+            print(f"❌ {pending} webhook events could not be indexed before exit; "
+                  f"run a sync with mode=reconcile to repair the index")
+            return None
+        return delay
+
+    def flush(self):
+        """Apply everything still buffered, regardless of window, retrying failures for a while (at exit)"""
+        if self._apply_batch is None:
+            return
+        deadline = time.monotonic() + EXIT_FLUSH_SECONDS
+        while True:
+            batch = self.take_all()
+            if batch:
+                print(f"📤 Indexing {len(batch)} buffered webhook events before exit")
+                self.apply(batch, self._apply_batch)
+            delay = self.exit_retry_delay(deadline)
+            if delay is None:
+                return
+            time.sleep(delay)
+
+    def stats(self) -> Dict:
+        with self._condition:
+            latencies = list(self._latencies)
+            return {
+                'window_seconds': self.window_seconds,
+                'max_batch': self.max_batch,
+                'pending': len(self._pending),
+                'received': self.received,
+                'coalesced': self.coalesced,
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'requeued': self.requeued,
+                'dropped': self.dropped,
+                'retry_in_seconds': round(max(0.0, self._paused_until - time.monotonic()), 1),
+                'upserted': self.upserted,
+                'deleted': self.deleted,
+                'failed_vectors': self.failed_vectors,
+                'failed_deletes': self.failed_deletes,
+                'avg_batch_size': round(self._applied_events / (self.batches - self.failed_batches), 1)
+                if self.batches > self.failed_batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'avg_window_ms': round(self._windows_waited / self.batches * 1000, 1) if self.batches else 0.0,
+                'latency_ms': {
+                    'p50': round(_percentile(latencies, 0.5) * 1000, 1),
+                    'p95': round(_percentile(latencies, 0.95) * 1000, 1),
+                    'max': round(max(latencies, default=0.0) * 1000, 1)
+                }
+            }
+
+
+_webhook_coalescer = None
+_webhook_coalescer_lock = threading.Lock()
+
+
+def get_webhook_coalescer() -> WebhookCoalescer:
+    """Get or create the process-wide webhook coalescer"""
+    global _webhook_coalescer
+    if _webhook_coalescer is None:
+        with _webhook_coalescer_lock:
+            if _webhook_coalescer is None:
+                _webhook_coalescer = WebhookCoalescer(config.WEBHOOK_COALESCE_SECONDS, config.WEBHOOK_BATCH_SIZE)
+    return _webhook_coalescer
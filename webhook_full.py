@@ -1,13 +1,29 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, g
 from flask_cors import CORS, cross_origin
 import json
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from embeddings_generator import generate_product_embedding
+from typing import Dict, List
+from embeddings_generator import encode_texts, generate_product_embedding
 from pinecone_integration import PineconeManager
-from contentstack_fetcher import ContentstackFetcher
+from contentstack_fetcher import ContentstackFetcher, vector_id
+from sync_orchestrator import parse_list
 from query_rewriter import QueryRewriter
+from deadline import Deadline
+from rewrite_cache import get_rewrite_cache
+from precomputed_expansions import get_expansion_store
+from expansion_pruning import prune_expansions, result_overlap, get_pruning_stats
+from entry_cache import get_entry_cache
+from reference_cache import get_reference_cache
+from adaptive_throttle import get_contentstack_throttler
+from search_priority import get_search_gate
+from metadata_schema import search_result
+from text_extractor import get_text_extractors
+from sync_jobs import get_sync_job_runner
+from webhook_coalescer import build_webhook_vectors, get_webhook_coalescer, webhook_action
 from config import config
 import os
 from dotenv import load_dotenv
@@ -55,10 +71,22 @@ def handle_preflight():
         if origin in allowed_origins:
             response.headers['Access-Control-Allow-Origin'] = origin
             
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+        response.headers['Access-Control-Allow-Headers'] = f'Content-Type, {config.SEARCH_DEADLINE_HEADER}'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
         return response
 
+@app.before_request
+def track_search():
+    # Background sync batches wait while searches are in flight (search_priority.py)
+    if request.path == '/search' and request.method == 'POST':
+        get_search_gate().enter()
+        g.search_gate_entered = True
+
+@app.teardown_request
+def release_search(exc):
+    if g.pop('search_gate_entered', False):
+        get_search_gate().exit()
+
 @app.after_request
 def add_cors_headers(response):
     # Allow localhost, network IP, Launch domain, and ngrok frontend domain
@@ -77,7 +105,7 @@ def add_cors_headers(response):
     if origin in allowed_origins:
         response.headers['Access-Control-Allow-Origin'] = origin
     
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Headers'] = f'Content-Type, {config.SEARCH_DEADLINE_HEADER}'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
     return response
 # Production CORS configuration
@@ -96,6 +124,7 @@ if hasattr(config, 'NGROK_FRONTEND_DOMAIN') and config.NGROK_FRONTEND_DOMAIN:
 CORS(app, origins=allowed_origins)
 
 # Global managers
+_search_executor = ThreadPoolExecutor(max_workers=config.SEARCH_EXECUTOR_WORKERS, thread_name_prefix="search")
 _pinecone_manager = None
 _contentstack_fetcher = None
 _query_rewriter = None
@@ -133,6 +162,44 @@ def get_query_rewriter():
             _query_rewriter = None
     return _query_rewriter
 
+def resume_sync_jobs():
+    """Run again the sync jobs a recycled or crashed worker left interrupted"""
+    try:
+        get_sync_job_runner().resume_interrupted(get_contentstack_fetcher)
+    except Exception as e:
+        print(f"Warning: Could not resume interrupted sync jobs: {e}")
+
+# Off the import path, so a worker starts serving while Pinecone and Contentstack initialize
+threading.Thread(target=resume_sync_jobs, name="sync-jobs-resume", daemon=True).start()
+
+def index_webhook_batch(events: List[Dict]) -> Dict:
+    """Apply a coalesced batch of webhook events: one batched upsert and one batched delete"""
+    pinecone_manager = get_pinecone_manager()
+    if not pinecone_manager:
+        raise RuntimeError("Pinecone manager not available")
+    
+    upserts = [event for event in events if event['action'] == 'upsert']
+    deletes = [event['key'] for event in events if event['action'] == 'delete']
+    upserted = failed = 0
+    if upserts:
+        fetcher = get_contentstack_fetcher()
+        if fetcher:
+            by_content_type = {}
+            for event in upserts:
+                by_content_type.setdefault(event['content_type'], []).append(event['entry'])
+            for content_type, entries in by_content_type.items():
+                fetcher.resolve_references(entries)
+                fetcher.load_text_extractor(content_type)
+        # Searches go first; a publish storm waits for them instead of competing for the model
+        get_search_gate().wait_for_idle()
+        vectors = build_webhook_vectors(upserts, encode_texts)
+        if vectors:
+            summary = pinecone_manager.upsert_batches(vectors)
+            upserted, failed = summary['upserted'], summary['failed']
+    deleted = pinecone_manager.delete_products(deletes) if deletes else 0
+    print(f"✅ Indexed webhook batch: {upserted} upserted, {deleted} deleted from {len(events)} events")
+    return {'upserted': upserted, 'deleted': deleted, 'failed': failed, 'failed_deletes': len(deletes) - deleted}
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Contentstack webhook endpoint with robust error handling"""
@@ -157,80 +224,45 @@ def webhook():
         event_type = data.get('event')
         entry_data = data.get('data', {}).get('entry', {})
         entry_uid = entry_data.get('uid')
+        # Each localized version of an entry is its own vector
+        entry_vector_id = vector_id(entry_uid, entry_data.get('locale')) if entry_uid else None
         
         if not entry_uid:
             print("⚠️ No entry UID found in webhook data")
             return jsonify({"status": "success", "message": "No entry UID to process"}), 200
         
-        # Try to get Pinecone manager (may not be available during cold starts)
-        try:
-            pinecone_manager = get_pinecone_manager()
-        except Exception as e:
-            print(f"⚠️ Pinecone manager not available: {e}")
-            pinecone_manager = None
-    
-    if event_type in ['entry_published', 'entry_updated', 'entry_created']:
-        # Generate embedding and update/add to vector DB/index
-        print(f"Action: Entry {entry_uid} needs indexing or update")
-        if pinecone_manager and entry_data:
-            embedding = generate_product_embedding(entry_data)
-            if embedding:
-                try:
-                    # Prepare comprehensive metadata with all product details
-                    metadata = {
-                        'entry_uid': entry_uid,
-                        'content_type': data.get('content_type_uid'),
-                        'event_type': event_type,
-                        'title': entry_data.get('title', ''),
-                        'name': entry_data.get('name', entry_data.get('title', '')),
-                        'description': entry_data.get('description', ''),
-                        'price': entry_data.get('price', 0),
-                        'category': entry_data.get('category', ''),
-                        'brand': entry_data.get('brand', ''),
-                        'image_url': entry_data.get('image', {}).get('url', '') if isinstance(entry_data.get('image'), dict) else '',
-                        'locale': entry_data.get('locale', 'en-us'),
-                        'created_at': entry_data.get('created_at', ''),
-                        'updated_at': entry_data.get('updated_at', '')
-                    }
-                    
-                    # Upsert to Pinecone with complete metadata
-                    embeddings_dict = {entry_uid: embedding}
-                    pinecone_manager.upsert_embeddings(embeddings_dict, metadata)
-                    print(f"✅ Successfully indexed entry {entry_uid}")
-                except Exception as e:
-                    print(f"❌ Error indexing entry {entry_uid}: {e}")
-            else:
-                print(f"⚠️ No embedding generated for entry {entry_uid}")
-        else:
-            print(f"📝 Entry {entry_uid} needs indexing (Pinecone not available)")
-            
-    elif event_type == 'entry_unpublished':
-        # Remove from vector DB/index
-        print(f"Action: Entry {entry_uid} needs removal from index")
-        if pinecone_manager and entry_uid:
-            try:
-                pinecone_manager.delete_product(entry_uid)
-                print(f"🗑️ Successfully removed entry {entry_uid} from index")
-            except Exception as e:
-                print(f"❌ Error removing entry {entry_uid}: {e}")
-        else:
-            print(f"📝 Entry {entry_uid} needs removal from index")
-            
-    elif event_type == 'entry_deleted':
-        # Handle deletion
-        print(f"Action: Entry {entry_uid} needs permanent removal from index")
-        if pinecone_manager and entry_uid:
-            try:
-                pinecone_manager.delete_product(entry_uid)
-                print(f"🗑️ Permanently removed entry {entry_uid} from index")
-            except Exception as e:
-                print(f"❌ Error permanently removing entry {entry_uid}: {e}")
-        else:
-            print(f"📝 Entry {entry_uid} needs permanent removal from index")
-    else:
-        print(f"Unhandled event type: {event_type}")
-    
-        return jsonify({"status": "success", "message": f"Processed {event_type} for entry {entry_uid}"}), 200
+        # Keep the local entry cache in step so conditional reads serve the latest data
+        entry_cache = get_entry_cache()
+        content_type = data.get('content_type_uid')
+        if entry_cache and content_type:
+            if event_type in ['entry_published', 'entry_updated', 'entry_created']:
+                entry_cache.put_entry(content_type, entry_data)
+            elif event_type in ['entry_unpublished', 'entry_deleted']:
+                entry_cache.delete_entry(content_type, entry_uid, entry_data.get('locale'))
+        
+        # Payloads carry the content type schema; recompiling keeps the text extractor current
+        content_type_schema = data.get('data', {}).get('content_type')
+        if isinstance(content_type_schema, dict) and content_type_schema.get('schema'):
+            get_text_extractors().register(content_type_schema)
+        
+        # Entries that reference this one (e.g. products of a brand) read it from the reference cache
+        if content_type:
+            if event_type in ['entry_published', 'entry_updated', 'entry_created']:
+                get_reference_cache().refresh(content_type, entry_data)
+            elif event_type in ['entry_unpublished', 'entry_deleted']:
+                get_reference_cache().invalidate(content_type, entry_uid)
+        
+        action = webhook_action(event_type)
+        if action is None:
+            print(f"Unhandled event type: {event_type}")
+            return jsonify({"status": "success", "message": f"Ignored {event_type} for entry {entry_uid}"}), 200
+        
+        # Indexing happens in coalesced batches on the webhook indexer thread
+        coalescer = get_webhook_coalescer()
+        coalescer.start(index_webhook_batch)
+        replaced = coalescer.add(entry_vector_id, action, content_type, entry_data)
+        print(f"Action: Entry {entry_uid} queued for {action}{' (replaced a pending event)' if replaced else ''}")
+        return jsonify({"status": "accepted", "message": f"Queued {event_type} for entry {entry_uid}"}), 202
         
     except Exception as e:
         print(f"❌ Critical webhook error: {e}")
@@ -255,6 +287,29 @@ def test_post():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def search_single_query(pinecone_manager, search_query: str, top_k: int, deadline: Deadline,
+                        query_embedding: list = None) -> list:
+    """Embed one query (unless already embedded) and return its Pinecone matches shaped as search results"""
+    try:
+        # Generate embedding with error handling
+        if query_embedding is None:
+            query_embedding = generate_product_embedding({
+                'title': search_query, 
+                'description': search_query
+            }, deadline=deadline)
+        
+        if not query_embedding:
+            print(f"⚠️ Failed to generate embedding for: {search_query}")
+            return []
+        
+        # Search with limited results to prevent timeout
+        results = pinecone_manager.search_similar(query_embedding, top_k=min(top_k, 10), deadline=deadline)
+    except Exception as e:
+        print(f"⚠️ Search error for query '{search_query}': {e}")
+        return []
+    
+    return [search_result(match, search_query) for match in results.get('matches', [])]
+
 @app.route('/search', methods=['POST'])
 def search():
     """Search endpoint for semantic product search with robust error handling"""
@@ -274,7 +329,15 @@ def search():
         if not query:
             return jsonify({"error": "Query parameter is required"}), 400
         
-        print(f"🔍 Search query: '{query}' (top_k: {top_k}, rewrite: {use_rewrite})")
+        # Overall time budget shared by rewrite, embedding and vector query
+        deadline = Deadline.from_header(request.headers.get(config.SEARCH_DEADLINE_HEADER))
+        
+        # Feed the search log that picks which queries get precomputed expansions (buffered in memory)
+        expansion_store = get_expansion_store()
+        if expansion_store:
+            expansion_store.record_search(query)
+        
+        print(f"🔍 Search query: '{query}' (top_k: {top_k}, rewrite: {use_rewrite}, budget: {deadline.budget_ms:.0f}ms)")
         
         # Initialize components with timeout handling
         try:
@@ -294,8 +357,10 @@ def search():
                             "category": "Sample",
                             "brand": "Demo",
                             "image_url": "",
+                            "content_type": "",
+                            "url": "",
+                            "locale": "",
                             "score": 0.85,
-                            "metadata": {"source": "fallback"},
                             "query_used": query
                         }
                     ],
@@ -312,62 +377,80 @@ def search():
                 "status": "service_unavailable"
             }), 503
         
-        # Simple search without query expansion first
-        queries_to_search = [query]
+        # Speculative search: the original query is retrieved right away while
+        # the LLM rewrite runs alongside it, so expansion is off the critical path
+        base_future = _search_executor.submit(search_single_query, pinecone_manager, query, top_k, deadline)
         
-        # Only expand if specifically requested and rewriter is available
+        expansion_status = "not_requested"
+        expansions = []
         if use_rewrite:
-            try:
-                rewriter = get_query_rewriter()
-                if rewriter:
-                    expanded_queries = rewriter.expand_query(query, 2)  # Limit expansions
-                    queries_to_search = expanded_queries[:3]  # Limit total queries
-                    print(f"📝 Expanded to {len(queries_to_search)} queries: {queries_to_search}")
-            except Exception as e:
-                print(f"⚠️ Query expansion failed: {e}")
-                # Continue with original query
+            rewriter = get_query_rewriter()
+            if rewriter:
+                rewrite_future = _search_executor.submit(rewriter.expand_query, query, 2, deadline)  # Limit expansions
+                try:
+                    # Leave enough budget to still search the expansions once they arrive
+                    expanded_queries = rewrite_future.result(
+                        timeout=deadline.timeout(reserve_ms=config.EXPANSION_MIN_BUDGET_MS)
+                    )
+                    expansions = [q for q in expanded_queries[:3] if q != query]  # Limit total queries
+                    expansion_status = "expanded" if expansions else "no_expansions"
+                    print(f"📝 Expanded to {len(expansions) + 1} queries: {[query] + expansions}")
+                except FutureTimeoutError:
+                    # The rewrite keeps running and lands in the rewrite cache for next time
+                    deadline.skip('rewrite', 'LLM rewrite did not return within budget')
+                    expansion_status = "timeout"
+                except Exception as e:
+                    print(f"⚠️ Query expansion failed: {e}")
+                    expansion_status = "failed"
+            else:
+                expansion_status = "unavailable"
         
-        all_results = []
-        seen_ids = set()
+        expansion_futures = []
+        if expansions:
+            if deadline.allows(config.EXPANSION_MIN_BUDGET_MS):
+                # One batch embedding drops near-duplicate rewrites before they cost a vector query
+                expansions, expansion_vectors = prune_expansions(query, expansions, deadline=deadline)
+                if not expansions:
+                    expansion_status = "pruned"
+                expansion_futures = [
+                    (q, _search_executor.submit(
+                        search_single_query, pinecone_manager, q, top_k, deadline, expansion_vectors.get(q)
+                    ))
+                    for q in expansions
+                ]
+            else:
+                deadline.skip('expansion_search', f'dropped {len(expansions)} expanded queries')
+                expansion_status = "timeout"
         
-        # Search with timeout protection
-        for search_query in queries_to_search:
+        # Base results always come first; expansion results merge in only if they are ready in time
+        per_query_results = [(query, base_future.result())]
+        searched_expansions = []
+        timed_out = False
+        for search_query, future in expansion_futures:
             try:
-                # Generate embedding with error handling
-                query_embedding = generate_product_embedding({
-                    'title': search_query, 
-                    'description': search_query
-                })
-                
-                if not query_embedding:
-                    print(f"⚠️ Failed to generate embedding for: {search_query}")
-                    continue
-                
-                # Search with limited results to prevent timeout
-                results = pinecone_manager.search_similar(query_embedding, top_k=min(top_k, 10))
-                
-                for match in results.get('matches', []):
-                    product_id = match['id']
-                    if product_id not in seen_ids and len(all_results) < top_k:
-                        metadata = match.get('metadata', {})
-                        all_results.append({
-                            'product_id': product_id,
-                            'name': metadata.get('name', metadata.get('title', f'Product {product_id}')),
-                            'title': metadata.get('title', metadata.get('name', f'Product {product_id}')),
-                            'description': metadata.get('description', ''),
-                            'price': metadata.get('price', 0),
-                            'category': metadata.get('category', ''),
-                            'brand': metadata.get('brand', ''),
-                            'image_url': metadata.get('image_url', ''),
-                            'score': match['score'],
-                            'metadata': metadata,
-                            'query_used': search_query
-                        })
-                        seen_ids.add(product_id)
-                        
+                per_query_results.append((search_query, future.result(timeout=deadline.timeout())))
+                searched_expansions.append(search_query)
+            except FutureTimeoutError:
+                deadline.skip('expansion_search', 'expanded query search did not return within budget')
+                timed_out = True
             except Exception as e:
                 print(f"⚠️ Search error for query '{search_query}': {e}")
-                continue
+        if expansion_futures and not searched_expansions:
+            expansion_status = "timeout" if timed_out else "failed"
+        if searched_expansions:
+            base_ids = [result['product_id'] for result in per_query_results[0][1]]
+            get_pruning_stats().add_overlaps([
+                result_overlap(base_ids, [result['product_id'] for result in results])
+                for _, results in per_query_results[1:]
+            ])
+        
+        all_results = []
+        seen_ids = set()
+        for search_query, results in per_query_results:
+            for result in results:
+                if result['product_id'] not in seen_ids and len(all_results) < top_k:
+                    all_results.append(result)
+                    seen_ids.add(result['product_id'])
         
         # Sort by score and limit results
         all_results.sort(key=lambda x: x['score'], reverse=True)
@@ -377,10 +460,13 @@ def search():
         
         return jsonify({
             "query": query,
-            "expanded_queries": queries_to_search if use_rewrite else [query],
+            "expanded_queries": [query] + searched_expansions,
+            "expanded": bool(searched_expansions),
+            "expansion_status": expansion_status,
             "results": final_results,
             "total_results": len(final_results),
-            "status": "success"
+            "status": "degraded" if deadline.skipped else "success",
+            "deadline": deadline.report()
         }), 200
         
     except Exception as e:
@@ -396,26 +482,62 @@ def search():
 
 @app.route('/sync', methods=['POST'])
 def sync_entries():
-    """Manually trigger sync of all Contentstack entries to Pinecone"""
-    content_type = request.args.get('content_type', 'product')
+    """Queue a full, incremental (mode=delta) or reconciling (mode=reconcile) sync of Contentstack entries to Pinecone.
     
-    print(f"🔄 Starting manual sync for content type: {content_type}")
+    The sync runs as a background job; the response carries its id and
+    GET /sync/<job_id> reports progress. content_types and locales
+    (comma-separated) sync every content type/locale pair in parallel
+    through the sync orchestrator.
+    """
+    content_type = request.args.get('content_type', 'product')
+    mode = request.args.get('mode', 'full')
+    content_types = parse_list(request.args.get('content_types', ''))
+    locales = parse_list(request.args.get('locales', ''))
+    # Full syncs continue from the checkpoint of an interrupted run unless resume=false
+    resume = request.args.get('resume', 'true').lower() != 'false'
     
     fetcher = get_contentstack_fetcher()
     if not fetcher:
         return jsonify({"error": "Contentstack fetcher not available"}), 503
+    if not fetcher.pinecone_manager:
+        return jsonify({"error": "Pinecone not available, cannot sync"}), 503
+    
+    if mode == 'delta':
+        params = {'mode': 'delta', 'content_type': content_type,
+                  'reset': request.args.get('reset', 'false').lower() == 'true'}
+    elif mode == 'reconcile':
+        params = {'mode': 'reconcile', 'content_types': content_types or [content_type], 'locales': locales,
+                  'dry_run': request.args.get('dry_run', 'false').lower() == 'true',
+                  'force': request.args.get('force', 'false').lower() == 'true'}
+    else:
+        params = {'mode': 'full', 'content_types': content_types or [content_type], 'locales': locales,
+                  'resume': resume}
     
     try:
-        fetcher.sync_entries_to_pinecone(content_type)
-        return jsonify({"status": "sync_completed", "content_type": content_type}), 200
+        job = get_sync_job_runner().submit(params, fetcher)
     except Exception as e:
         print(f"❌ Sync error: {e}")
         return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "status": job['status'],
+        "job_id": job['id'],
+        "status_url": f"/sync/{job['id']}",
+        "params": job['params']
+    }), 202
+
+@app.route('/sync/<job_id>', methods=['GET'])
+def sync_status(job_id):
+    """Status, progress (fetched/embedded/upserted, throughput, ETA) and result of a sync job"""
+    job = get_sync_job_runner().status(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown sync job: {job_id}"}), 404
+    return jsonify(job), 200
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    pinecone_status = "available" if get_pinecone_manager() else "unavailable"
+    pinecone_manager = get_pinecone_manager()
+    pinecone_status = "available" if pinecone_manager else "unavailable"
     contentstack_status = "available" if get_contentstack_fetcher() else "unavailable"
     rewriter_status = "available" if get_query_rewriter() else "unavailable"
 
@@ -426,6 +548,14 @@ def health():
             "contentstack": contentstack_status,
             "query_rewriter": rewriter_status
         },
+        "pinecone_query_path": pinecone_manager.get_query_stats() if pinecone_manager else None,
+        "rewrite_cache": get_rewrite_cache().stats() if get_rewrite_cache() else None,
+        "entry_cache": get_entry_cache().stats() if get_entry_cache() else None,
+        "contentstack_throttle": get_contentstack_throttler().stats(),
+        "reference_cache": get_reference_cache().stats(),
+        "search_priority": get_search_gate().stats(),
+        "webhook_batching": get_webhook_coalescer().stats(),
+        "expansion_pruning": get_pruning_stats().stats(),
         "configuration": config.get_status(),
         "ngrok_domain": config.NGROK_DOMAIN
     }), 200